@@ -10,30 +10,59 @@ Example Usage: python DM-me-maybe.py -f0 110 -f1 190 -dt 16.384 -df 0.2 -dmin 0
 
 '''
 import argparse
+import json
+import os
+import sys
 import numpy as np 
-import matplotlib.pyplot as plt
-import scienceplots; plt.style.use(['science', 'no-latex'])
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Useful-Scripts'))
+from instrumentation import start_run, stage
+from plotting import get_pyplot
 
 DM_constant = 4.148064239e3  # MHz^2 pc^-1 cm^3 s
 
 def get_args(): 
     
     parser = argparse.ArgumentParser(description="Calculate a Dedispersion plan for a given observational setup.")
-    parser.add_argument('-f0', type=float, required=True, help='Starting frequency in MHz')
-    parser.add_argument('-f1', type=float, required=True, help='Ending frequency in MHz')
-    parser.add_argument('-dt', type=float, required=True, help='Time resolution in ms')
+    parser.add_argument('-f0', type=float, nargs='+', help='Starting frequency in MHz (several values sweep a grid)')
+    parser.add_argument('-f1', type=float, nargs='+', help='Ending frequency in MHz (several values sweep a grid)')
+    parser.add_argument('-dt', type=float, nargs='+', help='Time resolution in ms (several values sweep a grid)')
     parser.add_argument('-nsub', type=int, default=32, help='Number of sub-bands')
-    parser.add_argument('-df', type=float, required=True, help='Frequency resolution in MHz')
-    parser.add_argument('-dmin', type=float, default=0.0, help='Minimum DM to consider')
-    parser.add_argument('-dmax', type=float, required=True, help='Maximum DM to consider')
+    parser.add_argument('-df', type=float, nargs='+', help='Frequency resolution in MHz (several values sweep a grid)')
+    parser.add_argument('-dmin', type=float, nargs='+', default=[0.0], help='Minimum DM to consider (several values sweep a grid)')
+    parser.add_argument('-dmax', type=float, nargs='+', help='Maximum DM to consider (several values sweep a grid)')
+    parser.add_argument('-sweep', type=str, default=None, help='File of configurations, one "name f0 f1 dt df dmax [dmin]" per line, evaluated in one process')
+    parser.add_argument('-sweep_out', type=str, default='ddm_sweep.csv', help='Columnar output of a sweep (.csv or .json)')
     parser.add_argument('-eff', type=float, default=5.0, help='SNR efficiency factor')
+    parser.add_argument('-step', type=float, default=0.5, help='Segment width in log10 of effective time resolution (0.5 = half a decade)')
+    parser.add_argument('-maxds', type=int, default=16, help='Maximum time downsampling factor allowed in the plan')
+    parser.add_argument('-maxmem', type=float, default=64.0, help='Memory ceiling in MB for DM x channel smearing evaluation')
+    parser.add_argument('-optimize', action='store_true', help='Optimise downsampling and -nsub per segment and rank alternative plans by CPU-hours')
+    parser.add_argument('-tol', type=float, default=1.5, help='Smearing budget as a multiple of the unavoidable smearing (sampling, channel and scattering)')
+    parser.add_argument('-tobs', type=float, default=3600.0, help='Observation length in seconds (cost model)')
+    parser.add_argument('-nbits', type=int, default=8, help='Bits per sample of the raw data (cost model)')
+    parser.add_argument('-gflops', type=float, default=1.0, help='Sustained dedispersion rate per core in GFLOP/s (cost model)')
+    parser.add_argument('-iorate', type=float, default=200.0, help='Sustained I/O rate per core in MB/s (cost model)')
     parser.add_argument('-p', action='store_true', help='Makes Plots')
     parser.add_argument('-coherent', action='store_true', help='Use coherent dedispersion')
     parser.add_argument('-atnf', action='store_true', help='Includes ATNF benchmark lines in plots')
     parser.add_argument('-s', action='store_true', help='Save plots to file')
     parser.add_argument('-2col', action='store_true', help='2-column plot format')
     parser.add_argument('-dat', action='store_true', help='Data from plot .dat file')
+    parser.add_argument('-json', action='store_true', help='Save the DM plan to a .json file (input for prepsubband-plan-generator.py)')
+    parser.add_argument('-csv', action='store_true', help='Save the DM plan to a .csv file')
+    parser.add_argument('-profile', '--profile', action='store_true', help='Write a JSON timing/memory report and a cProfile dump for this run')
     args = parser.parse_args()
+
+    grid = [args.f0, args.f1, args.dt, args.df, args.dmax]
+    if args.sweep is None:
+        if any(vals is None for vals in grid):
+            parser.error('-f0, -f1, -dt, -df and -dmax are required unless -sweep is given')
+        if all(len(vals) == 1 for vals in grid + [args.dmin]):
+            args.f0, args.f1, args.dt, args.df, args.dmax = [vals[0] for vals in grid]
+            args.dmin = args.dmin[0]
+        else:
+            args.sweep = grid + [args.dmin]
     
     return args
 
@@ -100,6 +129,69 @@ def _uniform_edges(f_low, f_high, n):
     fh    = fl + df
     return np.stack([fl, fh], axis=1)
 
+def _channel_edges(f_low, f_high, df):
+    """
+    Build per-channel edges from the channel width, discarding any zero-width tail channel.
+
+    Parameters:
+    f_low : float
+        Band lower edge frequency in MHz.
+    f_high : float
+        Band upper edge frequency in MHz.
+    df : float
+        Channel width in MHz.
+
+    Returns:
+    fl, fh : ndarray
+        Lower and upper edge of each channel in MHz.
+    """
+    fl = np.arange(f_low, f_high, df)
+    fh = np.clip(fl + df, None, f_high)
+    valid = fh > fl
+    return fl[valid], fh[valid]
+
+def worst_channel_smear(DM, chan_fl, chan_fh, max_mem_mb=64.0, DM_constant=DM_constant):
+    """
+    Worst intra-channel smearing at each DM without building the full DM x channel matrix.
+
+    For uniform, ascending channelisation and non-negative DMs the lowest channel
+    always has the largest f^-2 span, so it is evaluated directly. Otherwise the
+    DM axis is processed in chunks sized so that no intermediate exceeds max_mem_mb.
+
+    Parameters:
+    DM : float or array-like
+        Dispersion Measure(s) in pc cm^-3.
+    chan_fl : ndarray
+        Channel lower edges in MHz.
+    chan_fh : ndarray
+        Channel upper edges in MHz.
+    max_mem_mb : float
+        Memory ceiling for a single chunk of the DM x channel matrix in MB.
+    DM_constant : float
+        Dispersion constant.
+
+    Returns:
+    t_chan_s : ndarray
+        Worst-channel smearing time in seconds for each DM.
+    """
+    DM = np.atleast_1d(np.asarray(DM, dtype=float))
+    chan_fl = np.asarray(chan_fl, dtype=float)
+    chan_fh = np.asarray(chan_fh, dtype=float)
+    inv2_span = chan_fl**-2 - chan_fh**-2
+
+    widths = chan_fh - chan_fl
+    uniform = (np.allclose(widths[:-1], widths[0], rtol=1e-9, atol=0.0)
+               and widths[-1] <= widths[0] * (1 + 1e-9)
+               and np.all(np.diff(chan_fl) > 0))
+    if uniform and np.all(DM >= 0):
+        return DM_constant * DM * inv2_span[0]
+
+    rows = max(1, int(max_mem_mb * 2**20 // (8 * inv2_span.size)))
+    t_chan_s = np.empty(DM.size)
+    for i in range(0, DM.size, rows):
+        t_chan_s[i:i+rows] = np.max(DM_constant * DM[i:i+rows, None] * inv2_span[None, :], axis=1)
+    return t_chan_s
+
 def tSB_smear(delta_DM_sub, f_low, f_high, Nsub):
     """
     Calculate subband smearing from ΔDM within each subband .
@@ -191,7 +283,8 @@ def optimize_ddm(dm_grid,
                        f_low_mhz: float,
                        f_high_mhz: float,
                        df_mhz: float,
-                       DM_constant=DM_constant):
+                       DM_constant=DM_constant,
+                       max_mem_mb=64.0):
     """
     Compute ΔDM the band and channelization.
 
@@ -207,6 +300,8 @@ def optimize_ddm(dm_grid,
         Channel width in MHz.
     DM_constant : float
         Dispersion constant.
+    max_mem_mb : float
+        Memory ceiling for the worst-channel smearing evaluation in MB.
 
     Returns
     -------
@@ -216,15 +311,10 @@ def optimize_ddm(dm_grid,
     dm_grid = np.asarray(dm_grid, dtype=float)
 
     # Build per-channel edges across the band
-    fl = np.arange(f_low_mhz, f_high_mhz, df_mhz)
-    fh = np.clip(fl + df_mhz, None, f_high_mhz)
-    valid = fh > fl
-    fl, fh = fl[valid], fh[valid]
+    fl, fh = _channel_edges(f_low_mhz, f_high_mhz, df_mhz)
 
     # Worst intra-channel smear at each DM (seconds), using exact edges
-    inv2_span = (fl**-2 - fh**-2)                            # per-channel f^-2 span
-    t_chan_max_s = DM_constant * dm_grid[:, None] * inv2_span[None, :]
-    t_chan_max_s = np.max(t_chan_max_s, axis=1)              # worst channel per DM
+    t_chan_max_s = worst_channel_smear(dm_grid, fl, fh, max_mem_mb, DM_constant)
 
     # Full-band
     band_span_inv2 = (f_low_mhz**-2 - f_high_mhz**-2)
@@ -239,13 +329,11 @@ def nearest_value(value, array):
     return idx
 
 def benchmark_ATNF():
-    from psrqpy import QueryATNF
-    from astropy.table import Table
+    from atnf_cache import query_atnf
     
     print("\n=== ATNF Catalog Statistics === ")
     
-    query = QueryATNF(params=['NAME', 'W50', 'W10', 'DM', 'P0'])
-    table = query.table.to_pandas() # The table of ATNF pulsars
+    table = query_atnf(['NAME', 'W50', 'W10', 'DM', 'P0']) # The table of ATNF pulsars (cached locally)
     
     widths_tbl = table.dropna(subset=['W10'])
     
@@ -266,22 +354,395 @@ def benchmark_ATNF():
 
     return W10_mean, W10_1sigma, P0_mean, P0_1sigma
 
-def magnitudes(arr, step=0.5):
+PLAN_DTYPE = np.dtype([('start', 'f8'), ('stop', 'f8'), ('ddm', 'f8'),
+                       ('ntrials', 'i8'), ('downsamp', 'i8'), ('cost', 'f8')])
+
+def worst_channel_span(f_low_mhz, f_high_mhz, df_mhz):
     """
-    Selects elements whenever the log10(value) decreases by more than `step`.
-    E.g. step=0.5 means every half order of magnitude (~×3.16).
+    Largest per-channel f^-2 span across the band.
+
+    Parameters:
+    f_low_mhz : float
+        Band lower edge in MHz.
+    f_high_mhz : float
+        Band upper edge in MHz.
+    df_mhz : float
+        Channel width in MHz.
+
+    Returns:
+    span : float
+        max(fl^-2 - fh^-2) over channels in MHz^-2, so that the worst
+        intra-channel smear at a given DM is DM_constant * DM * span.
+    """
+    fl, fh = _channel_edges(f_low_mhz, f_high_mhz, df_mhz)
+    return float(np.max(fl**-2 - fh**-2))
+
+def dedispersion_plan(f_low_mhz, f_high_mhz, df_mhz, dt_ms, dm_min, dm_max,
+                      step=0.5, max_downsamp=16, coherent=False,
+                      DM_constant=DM_constant):
     """
-    arr = np.array(arr)
-    log_vals = np.log10(arr)
-    result = [arr[0]]
+    Solve a multi-segment dedispersion plan in closed form.
 
-    cur_val = log_vals[0] - step
-    for val, logv in zip(arr[1:], log_vals[1:]):
-        if logv <= cur_val:
-            result.append(val)
-            cur_val = logv - step
+    The effective time resolution at a given DM is the quadrature sum of the
+    sampling time and the worst intra-channel smear, t0(DM) = sqrt(dt^2 + (K S DM)^2).
+    Segment boundaries are placed where t0 has grown by 10**step, which can be
+    inverted exactly, so no DM grid is involved. Within each segment the data
+    are downsampled by the largest power of two that keeps the sampling time
+    below the channel smear at the segment start, and ΔDM is chosen so the
+    DM-step smear across the band matches the effective resolution there.
 
-    return np.array(result)
+    Parameters:
+    f_low_mhz : float
+        Band lower edge in MHz.
+    f_high_mhz : float
+        Band upper edge in MHz.
+    df_mhz : float
+        Channel width in MHz.
+    dt_ms : float
+        Sampling time in milliseconds.
+    dm_min : float
+        First DM of the plan in pc cm^-3.
+    dm_max : float
+        Last DM of the plan in pc cm^-3.
+    step : float
+        Segment width in log10 of the effective time resolution.
+    max_downsamp : int
+        Largest time downsampling factor allowed.
+    coherent : bool
+        If True, intra-channel smearing is removed (single segment).
+    DM_constant : float
+        Dispersion constant.
+
+    Returns:
+    plan : ndarray, dtype PLAN_DTYPE
+        One record per segment with start, stop, ddm, ntrials, downsamp and
+        cost (trials weighted by 1/downsamp, i.e. relative dedispersion work).
+    """
+    dt_s = float(dt_ms) * 1e-3
+    chan_span = 0.0 if coherent else worst_channel_span(f_low_mhz, f_high_mhz, df_mhz)
+    band_span = f_low_mhz**-2 - f_high_mhz**-2
+    k_chan = DM_constant * chan_span                          # s per pc cm^-3
+
+    t0 = lambda dm: np.sqrt(dt_s**2 + (k_chan * dm)**2)
+    ratio = 10.0**step
+    nseg = max(1, int(np.ceil(np.log(t0(dm_max) / t0(dm_min)) / np.log(ratio))))
+
+    # Invert t0(DM) = t0(dm_min) * ratio**i for every boundary at once
+    if k_chan > 0:
+        t_bound = t0(dm_min) * ratio**np.arange(nseg + 1)
+        bounds = np.sqrt(np.maximum(t_bound**2 - dt_s**2, 0.0)) / k_chan
+        bounds[0] = dm_min
+    else:
+        bounds = np.array([dm_min, dm_max], dtype=float)
+    bounds[-1] = dm_max
+
+    starts, stops = bounds[:-1], bounds[1:]
+    t_chan = k_chan * starts
+    downsamp = 2**np.floor(np.log2(np.maximum(t_chan / dt_s, 1.0)))
+    downsamp = np.minimum(downsamp, 2**np.floor(np.log2(max(max_downsamp, 1)))).astype(np.int64)
+    ddm = 2.0 * np.sqrt((dt_s * downsamp)**2 + t_chan**2) / (DM_constant * band_span)
+    ntrials = np.ceil((stops - starts) / ddm).astype(np.int64)
+
+    plan = np.empty(nseg, dtype=PLAN_DTYPE)
+    plan['start'] = starts
+    plan['stop'] = stops
+    plan['ddm'] = ddm
+    plan['ntrials'] = ntrials
+    plan['downsamp'] = downsamp
+    plan['cost'] = ntrials / downsamp
+    return plan
+
+def print_plan(plan):
+    """
+    Print a dedispersion plan as a table.
+    """
+    print(" DM Start (pc cm^-3) | DM Stop (pc cm^-3) | ΔDM (pc cm^-3) | Number of Trials | Downsamp |   Work")
+    print("-----------------------------------------------------------------------------------------------------")
+    for seg in plan:
+        print(f" {seg['start']:18.3f} | {seg['stop']:17.3f} | {seg['ddm']:14.4f} | {seg['ntrials']:16d} | {seg['downsamp']:8d} | {seg['cost']:7.1f}")
+    print(f" Total trials: {plan['ntrials'].sum()}, relative work: {plan['cost'].sum():.1f}")
+
+COST_PLAN_DTYPE = np.dtype(PLAN_DTYPE.descr + [('nsub', 'i8'), ('subdm_step', 'f8'), ('gflop', 'f8'),
+                                              ('io_gb', 'f8'), ('cpu_h', 'f8'), ('smear_ratio', 'f8')])
+
+def _nsub_candidates(nchan, nsub_min=8, nsub_max=1024):
+    """
+    Subband counts that evenly divide the channels, as prepsubband requires.
+    """
+    nsubs = np.arange(1, min(nchan, nsub_max) + 1)
+    nsubs = nsubs[(nchan % nsubs == 0) & (nsubs >= min(nsub_min, nchan))]
+    return nsubs if nsubs.size else np.array([nchan])
+
+def optimize_plan(f_low_mhz, f_high_mhz, df_mhz, dt_ms, dm_min, dm_max,
+                  tobs_s=3600.0, tol=1.5, step=0.5, max_downsamp=16, nbits=8,
+                  gflops=1.0, io_mb_s=200.0, coherent=False):
+    """
+    Choose per-segment downsampling and subband counts that minimise dedispersion cost.
+
+    Segment boundaries come from dedispersion_plan(). For every segment, downsampling
+    factor and nsub, the smearing budget is tol times the unavoidable smearing
+    sqrt(dt^2 + t_chan^2 + t_scatter^2) at the segment start. What is left after the
+    (downsampled) sampling time, channel and scattering terms is split evenly between
+    the DM-step smear (tBW_smear) and the subband smear (tSB_smear), which fixes ΔDM and
+    the subband DM step. The cost model follows prepsubband: one channel -> subband pass
+    per subband DM at full resolution, one subband -> series pass per trial at the
+    downsampled rate, reading the raw data once and writing one float32 series per trial.
+
+    Parameters:
+    f_low_mhz, f_high_mhz : float
+        Band edges in MHz.
+    df_mhz : float
+        Channel width in MHz.
+    dt_ms : float
+        Sampling time in milliseconds.
+    dm_min, dm_max : float
+        DM range of the plan in pc cm^-3.
+    tobs_s : float
+        Observation length in seconds.
+    tol : float
+        Smearing budget as a multiple of the unavoidable smearing.
+    step : float
+        Segment width in log10 of the effective time resolution.
+    max_downsamp : int
+        Largest time downsampling factor allowed.
+    nbits : int
+        Bits per sample of the raw data.
+    gflops : float
+        Sustained dedispersion rate per core in GFLOP/s.
+    io_mb_s : float
+        Sustained I/O rate per core in MB/s.
+    coherent : bool
+        If True, intra-channel smearing is removed.
+
+    Returns:
+    alternatives : list of (label, ndarray)
+        Candidate plans (dtype COST_PLAN_DTYPE), one with nsub chosen per segment
+        ('mixed') and one per fixed nsub, sorted by total CPU-hours. Infeasible
+        alternatives are dropped.
+    """
+    base = dedispersion_plan(f_low_mhz, f_high_mhz, df_mhz, dt_ms, dm_min, dm_max,
+                             step=step, max_downsamp=max_downsamp, coherent=coherent)
+    dt_s = float(dt_ms) * 1e-3
+    fl, fh = _channel_edges(f_low_mhz, f_high_mhz, df_mhz)
+    nchan = fl.size
+    nsamp = tobs_s / dt_s
+    fctr_ghz = 0.5 * (f_low_mhz + f_high_mhz) / 1000.0
+
+    # Axes: segment x downsamp x nsub
+    starts = base['start'][:, None, None]
+    stops = base['stop'][:, None, None]
+    downsamps = 2**np.arange(int(np.log2(max(max_downsamp, 1))) + 1)[None, :, None]
+    nsubs = _nsub_candidates(nchan)
+    k_sub = np.array([tSB_smear(2.0, f_low_mhz, f_high_mhz, n) for n in nsubs])[None, None, :]
+    k_bw = tBW_smear(2.0, f_low_mhz, f_high_mhz)
+
+    t_chan = np.zeros_like(starts) if coherent else worst_channel_smear(starts.ravel(), fl, fh).reshape(starts.shape)
+    t_scat = scattering_s(np.maximum(starts, 0.1), fctr_ghz)
+    t_int = total_smear(dt_ms, t_chan, t_scat, 0.0)
+    t_fixed = total_smear(dt_ms * downsamps, t_chan, t_scat, 0.0)
+    headroom2 = (tol * t_int)**2 - t_fixed**2
+    feasible = np.broadcast_to(headroom2 > 0, (starts.shape[0], downsamps.shape[1], nsubs.size))
+
+    t_split = np.sqrt(np.maximum(headroom2, 0.0) / 2.0)
+    ddm = np.broadcast_to(t_split / (0.5 * k_bw), feasible.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        subdm_step = np.maximum(np.floor(t_split / (0.5 * k_sub) / ddm), 1.0) * ddm
+        ntrials = np.where(feasible, np.ceil((stops - starts) / ddm), np.inf)
+        nsubdm = np.ceil(ntrials * ddm / subdm_step)
+
+    flop = nsubdm * nchan * nsamp + ntrials * nsubs[None, None, :] * nsamp / downsamps
+    io_bytes = nchan * nsamp * nbits / 8.0 + ntrials * (nsamp / downsamps) * 4.0
+    cpu_h = (flop / (gflops * 1e9) + io_bytes / (io_mb_s * 1e6)) / 3600.0
+    cpu_h = np.where(feasible, cpu_h, np.inf)
+    smear = total_smear(dt_ms * downsamps, t_chan, 0.5 * k_sub * subdm_step, 0.5 * k_bw * ddm)
+    smear_ratio = np.sqrt(smear**2 + t_scat**2) / t_int
+
+    def build(ids, jds, kds):
+        plan = np.empty(base.size, dtype=COST_PLAN_DTYPE)
+        idx = (ids, jds, kds)
+        plan['start'] = base['start']
+        plan['stop'] = base['stop']
+        plan['ddm'] = ddm[idx]
+        plan['ntrials'] = ntrials[idx]
+        plan['downsamp'] = downsamps[0, jds, 0]
+        plan['cost'] = plan['ntrials'] / plan['downsamp']
+        plan['nsub'] = nsubs[kds]
+        plan['subdm_step'] = subdm_step[idx]
+        plan['gflop'] = flop[idx] / 1e9
+        plan['io_gb'] = io_bytes[idx] / 1e9
+        plan['cpu_h'] = cpu_h[idx]
+        plan['smear_ratio'] = smear_ratio[idx]
+        return plan
+
+    ids = np.arange(base.size)
+    alternatives = []
+
+    flat = cpu_h.reshape(base.size, -1).argmin(axis=1)
+    jds, kds = np.unravel_index(flat, cpu_h.shape[1:])
+    alternatives.append(('mixed', build(ids, jds, kds)))
+
+    for k, nsub in enumerate(nsubs):
+        jds = cpu_h[:, :, k].argmin(axis=1)
+        kds = np.full(base.size, k)
+        alternatives.append((f'nsub={nsub}', build(ids, jds, kds)))
+
+    alternatives = [(label, plan) for label, plan in alternatives if np.all(np.isfinite(plan['cpu_h']))]
+    alternatives.sort(key=lambda alt: alt[1]['cpu_h'].sum())
+    return alternatives
+
+def print_alternatives(alternatives, top=10):
+    """
+    Print a ranked table of alternative plans followed by the best plan per segment.
+    """
+    print(" Rank | Plan         | Trials |     GFLOP |  I/O (GB) | CPU-hours")
+    print("------------------------------------------------------------------")
+    for rank, (label, plan) in enumerate(alternatives[:top], start=1):
+        print(f" {rank:4d} | {label:12s} | {plan['ntrials'].sum():6d} | {plan['gflop'].sum():9.1f} | {plan['io_gb'].sum():9.2f} | {plan['cpu_h'].sum():9.3f}")
+
+    if not alternatives:
+        print(" No plan satisfies the smearing budget, try a larger -tol")
+        return
+
+    label, plan = alternatives[0]
+    print(f"\n=== Best Plan ({label}) ===")
+    print(" DM Start (pc cm^-3) | DM Stop (pc cm^-3) | ΔDM (pc cm^-3) | Trials | Downsamp | nsub | Sub-DM step | Smear/Min | CPU-hours")
+    print("------------------------------------------------------------------------------------------------------------------------")
+    for seg in plan:
+        print(f" {seg['start']:18.3f} | {seg['stop']:17.3f} | {seg['ddm']:14.4f} | {seg['ntrials']:6d} | {seg['downsamp']:8d} | {seg['nsub']:4d} | {seg['subdm_step']:11.3f} | {seg['smear_ratio']:9.2f} | {seg['cpu_h']:9.3f}")
+
+# read_sweep() widens the name field to the longest configuration name
+SWEEP_DTYPE = np.dtype([('name', 'U32'), ('f0', 'f8'), ('f1', 'f8'), ('dt', 'f8'), ('df', 'f8'),
+                        ('dmin', 'f8'), ('dmax', 'f8'), ('nchan', 'i8'), ('nseg', 'i8'),
+                        ('ntrials', 'i8'), ('work', 'f8'), ('ddm_min', 'f8'), ('ddm_max', 'f8'),
+                        ('chan_smear_ms', 'f8'), ('total_smear_ms', 'f8'), ('cpu_h', 'f8')])
+
+def read_sweep(sweep):
+    """
+    Build the table of configurations for a sweep.
+
+    Parameters:
+    sweep : str or list
+        Either a file with one "name f0 f1 dt df dmax [dmin]" configuration per line
+        ('#' starts a comment), or lists of f0, f1, dt, df, dmax and dmin values whose
+        cartesian product is evaluated (combinations with f0 >= f1 are skipped).
+
+    Returns:
+    configs : ndarray, dtype SWEEP_DTYPE (with the name field as wide as the longest name)
+        One record per configuration with the setup columns filled in.
+    """
+    rows = []
+    if isinstance(sweep, str):
+        with open(sweep) as f:
+            for line in f:
+                fields = line.split('#')[0].split()
+                if not fields:
+                    continue
+                f0, f1, dt, df, dmax = map(float, fields[1:6])
+                dmin = float(fields[6]) if len(fields) > 6 else 0.0
+                rows.append((fields[0], f0, f1, dt, df, dmin, dmax))
+    else:
+        f0s, f1s, dts, dfs, dmaxs, dmins = sweep
+        for f0 in f0s:
+            for f1 in f1s:
+                if f0 >= f1:
+                    continue
+                for dt in dts:
+                    for df in dfs:
+                        for dmin in dmins:
+                            for dmax in dmaxs:
+                                rows.append((f"f{f0:g}-{f1:g}_dt{dt:g}_df{df:g}_dm{dmin:g}-{dmax:g}", f0, f1, dt, df, dmin, dmax))
+
+    width = max([len(row[0]) for row in rows] + [SWEEP_DTYPE['name'].itemsize // 4])
+    configs = np.zeros(len(rows), dtype=[('name', f'U{width}')] + SWEEP_DTYPE.descr[1:])
+    for i, row in enumerate(rows):
+        for name, val in zip(('name', 'f0', 'f1', 'dt', 'df', 'dmin', 'dmax'), row):
+            configs[i][name] = val
+    configs['cpu_h'] = np.nan
+    return configs
+
+def sweep_plans(configs, step=0.5, max_downsamp=16, coherent=False, DM_constant=DM_constant):
+    """
+    Evaluate dedispersion_plan() for many configurations in one vectorised pass.
+
+    Configurations form the first axis and plan segments the second, padded to the
+    longest plan and masked, so the closed-form boundaries, downsampling factors and
+    trial counts of every configuration are computed together. Channels are uniform
+    (as in _channel_edges), so the worst channel is always the lowest one.
+
+    Parameters:
+    configs : ndarray, dtype SWEEP_DTYPE
+        Configurations from read_sweep(); summary columns are filled in place.
+    step, max_downsamp, coherent, DM_constant :
+        As for dedispersion_plan().
+
+    Returns:
+    configs : ndarray, dtype SWEEP_DTYPE
+        The same table with nchan, nseg, ntrials, work, ΔDM range and smearing at dmax.
+    """
+    f0, f1, df = configs['f0'], configs['f1'], configs['df']
+    dmin, dmax = configs['dmin'], configs['dmax']
+    dt_s = configs['dt'] * 1e-3
+
+    chan_span = 0.0 if coherent else f0**-2 - np.minimum(f0 + df, f1)**-2
+    k_chan = DM_constant * chan_span * np.ones_like(f0)
+    band_span = f0**-2 - f1**-2
+
+    t0 = lambda dm: np.sqrt(dt_s**2 + (k_chan * dm)**2)
+    ratio = 10.0**step
+    nseg = np.maximum(1, np.ceil(np.log(t0(dmax) / t0(dmin)) / np.log(ratio))).astype(np.int64)
+
+    iseg = np.arange(nseg.max() + 1)[None, :]
+    t_bound = t0(dmin)[:, None] * ratio**iseg
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bounds = np.sqrt(np.maximum(t_bound**2 - dt_s[:, None]**2, 0.0)) / k_chan[:, None]
+    bounds[:, 0] = dmin
+    bounds = np.where(iseg >= nseg[:, None], dmax[:, None], bounds)
+
+    starts, stops = bounds[:, :-1], bounds[:, 1:]
+    valid = iseg[:, :-1] < nseg[:, None]
+    t_chan = k_chan[:, None] * starts
+    downsamp = 2**np.floor(np.log2(np.maximum(t_chan / dt_s[:, None], 1.0)))
+    downsamp = np.minimum(downsamp, 2**np.floor(np.log2(max(max_downsamp, 1))))
+    ddm = 2.0 * np.sqrt((dt_s[:, None] * downsamp)**2 + t_chan**2) / (DM_constant * band_span[:, None])
+    ntrials = np.where(valid, np.ceil((stops - starts) / ddm), 0)
+
+    configs['nchan'] = np.ceil((f1 - f0) / df - 1e-9)
+    configs['nseg'] = nseg
+    configs['ntrials'] = ntrials.sum(axis=1)
+    configs['work'] = (ntrials / downsamp).sum(axis=1)
+    configs['ddm_min'] = np.where(valid, ddm, np.inf).min(axis=1)
+    configs['ddm_max'] = np.where(valid, ddm, -np.inf).max(axis=1)
+
+    t_chan_max = k_chan * dmax
+    t_scat = scattering_s(np.maximum(dmax, 0.1), 0.5 * (f0 + f1) / 1000.0)
+    t_bw = 0.5 * configs['ddm_max'] * DM_constant * band_span
+    configs['chan_smear_ms'] = t_chan_max * 1e3
+    configs['total_smear_ms'] = np.sqrt(total_smear(configs['dt'], t_chan_max, 0.0, t_bw)**2 + t_scat**2) * 1e3
+    return configs
+
+def write_plan(plan, filename, config=None):
+    """
+    Save a DM plan as JSON (with the observing setup) or CSV, chosen by the file extension.
+
+    Parameters:
+    plan : ndarray, dtype PLAN_DTYPE or COST_PLAN_DTYPE
+        Plan segments.
+    filename : str
+        Output path ending in .json or .csv.
+    config : dict
+        Observing setup stored alongside the segments in the JSON file.
+    """
+    names = plan.dtype.names
+    if filename.endswith('.json'):
+        # NaN/inf (e.g. cpu_h of a sweep without -optimize) are not valid JSON, so they are written as null
+        segments = [{name: None if isinstance(val, float) and not np.isfinite(val) else val for name, val in zip(names, seg)}
+                    for seg in plan.tolist()]
+        with open(filename, 'w') as f:
+            json.dump({'config': config or {}, 'segments': segments}, f, indent=2, allow_nan=False)
+    else:
+        fmt = [{'i': '%d', 'U': '%s'}.get(plan.dtype[name].kind, '%.6f') for name in names]
+        np.savetxt(filename, plan, fmt=fmt, delimiter=',', header=','.join(names), comments='')
+    print(f"Plan saved to {filename}")
 
 def main(): 
     
@@ -297,6 +758,26 @@ def main():
     
     # === Parse Args === #
     args = get_args()
+    start_run('DM-me-maybe.py', profile=args.profile)
+
+    if args.sweep is not None:
+        with stage('sweep'):
+            configs = sweep_plans(read_sweep(args.sweep), step=args.step, max_downsamp=args.maxds, coherent=args.coherent)
+            if args.optimize:
+                for conf in configs:
+                    alternatives = optimize_plan(conf['f0'], conf['f1'], conf['df'], conf['dt'], conf['dmin'], conf['dmax'],
+                                                 tobs_s=args.tobs, tol=args.tol, step=args.step, max_downsamp=args.maxds,
+                                                 nbits=args.nbits, gflops=args.gflops, io_mb_s=args.iorate, coherent=args.coherent)
+                    if alternatives:
+                        conf['cpu_h'] = alternatives[0][1]['cpu_h'].sum()
+
+        print('=== De-Dispersion Sweep (%s configurations) ===' % len(configs))
+        print(" Name                             | Band (MHz)  | Segments | Trials |    Work | ΔDM range       | Smear @ DMmax (ms) | CPU-hours")
+        print("-------------------------------------------------------------------------------------------------------------------------------")
+        for conf in configs:
+            print(f" {conf['name']:32s} | {conf['f0']:5.0f}-{conf['f1']:<5.0f} | {conf['nseg']:8d} | {conf['ntrials']:6d} | {conf['work']:7.1f} | {conf['ddm_min']:7.4f}-{conf['ddm_max']:<7.4f} | {conf['total_smear_ms']:18.3f} | {conf['cpu_h']:9.3f}")
+        write_plan(configs, args.sweep_out)
+        return
     ftop = args.f1
     flow = args.f0
     dt   = args.dt  # ms
@@ -308,16 +789,17 @@ def main():
     outname = f"ddm_plan_f{int(flow)}-{int(ftop)}_dt{dt}_df{df}_dm{int(maxDM)}"
     
     if args.nsub:
-        nsub = int(bw/df)
-    else:
         nsub = args.nsub
+    else:
+        nsub = int(bw/df)
         
-    dms = np.linspace(minDM, maxDM, 1000)
-    ddms = optimize_ddm(dms, flow, ftop, df)  
-    ndms = 1/ddms
+    with stage('plan'):
+        dms = np.linspace(minDM, maxDM, 1000)
+        ddms = optimize_ddm(dms, flow, ftop, df, max_mem_mb=args.maxmem)  
+        ndms = 1/ddms
 
-    plan_lims = magnitudes(ndms, step=0.5)
-    plan_idxs = [nearest_value(val, ndms) for val in plan_lims]
+        plan = dedispersion_plan(flow, ftop, df, dt, minDM, maxDM, step=args.step,
+                                 max_downsamp=args.maxds, coherent=args.coherent)
     
     print('=== De-Dispersion Planning ===')
     print("DM Range: %s - %s pc cm^-3" % (np.min(dms), np.max(dms)))
@@ -325,69 +807,57 @@ def main():
     print("Channel Width: %s MHz" % df)
     print("Number of Subbands: %s" % nsub)
     print("Sampling Time: %s ms" % dt)  
-    
-    
-    print("\n=== DM Trial Info ===")
-    print(" DM (pc cm^-3) | ΔDM (pc cm^-3) |  Trials per ΔDM")
-    print("---------------------------------------------------")
-    for idx in plan_idxs:
-        print(f" {dms[idx]:14.2f} | {ddms[idx]:14.4f} | {ndms[idx]:16.2f}")
 
     print("\n=== Suggested DM Plan ===")
-    print(" DM Start (pc cm^-3) | DM Stop (pc cm^-3) | ΔDM (pc cm^-3) | Number of Trials")
-    print("----------------------------------------------------------------------------")
-    for i in range(len(plan_idxs)-1):
-        start_idx = plan_idxs[i]
-        stop_idx  = plan_idxs[i+1]
-        dm_start  = dms[start_idx]
-        dm_stop   = dms[stop_idx]
-        delta_dm  = ddms[stop_idx]
-        n_trials  = int(np.ceil((dm_stop - dm_start) / delta_dm))
-        print(f" {dm_start:18.3f} | {dm_stop:17.3f} | {delta_dm:14.3f} | {n_trials:17d}")
-        
-        # fill to maxDM
-        if i == len(plan_idxs) - 2 and dm_stop < maxDM:
-            stop_idx = len(dms) - 1
-            dm_start = dm_stop
-            dm_stop  = maxDM
-            delta_dm = ddms[stop_idx]
-            n_trials = int(np.ceil((dm_stop - dm_start) / delta_dm))
-            print(f" {dm_start:18.3f} | {dm_stop:17.3f} | {delta_dm:14.3f} | {n_trials:17d}")
+    print_plan(plan)
+
+    if args.optimize:
+        with stage('optimise'):
+            alternatives = optimize_plan(flow, ftop, df, dt, minDM, maxDM, tobs_s=args.tobs, tol=args.tol,
+                                         step=args.step, max_downsamp=args.maxds, nbits=args.nbits,
+                                         gflops=args.gflops, io_mb_s=args.iorate, coherent=args.coherent)
+        print("\n=== Ranked Plans (T_obs = %s s, tol = %s) ===" % (args.tobs, args.tol))
+        print_alternatives(alternatives)
+        if alternatives:
+            plan = alternatives[0][1]
+
+    if args.json or args.csv:
+        config = {'f0': flow, 'f1': ftop, 'dt': dt, 'df': df, 'dmin': minDM, 'dmax': maxDM,
+                  'nsub': args.nsub or 64, 'coherent': args.coherent, 'tobs': args.tobs}
+        if args.json:
+            write_plan(plan, f"{outname}.json", config)
+        if args.csv:
+            write_plan(plan, f"{outname}.csv")
 
 
     # --- Build per-channel edges from df  ---
-    # channel lower edges
-    chan_fl = np.arange(flow, ftop, df) 
-    chan_fh = np.clip(chan_fl + df, None, ftop)  # discard any zero-width tail channel
-    valid = chan_fh > chan_fl
-    chan_fl = chan_fl[valid]
-    chan_fh = chan_fh[valid]
-
-    # --- Smearing Terms ---
-    chan_smear_mat_s = dmdelay_exact(dms[:, None], chan_fh[None, :], chan_fl[None, :])
-    freq_smear_s = np.max(chan_smear_mat_s, axis=1)  # worst channel per DM (seconds)
+    with stage('smear'):
+        chan_fl, chan_fh = _channel_edges(flow, ftop, df)  # discard any zero-width tail channel
+
+        # --- Smearing Terms ---
+        freq_smear_s = worst_channel_smear(dms, chan_fl, chan_fh, max_mem_mb=args.maxmem)  # worst channel per DM (seconds)
     
-    # Smear across the band (seconds)
-    bw_smear_s = tBW_smear(ddms[1], flow, ftop)  # scalar seconds
+        # Smear across the band (seconds)
+        bw_smear_s = tBW_smear(ddms[1], flow, ftop)  # scalar seconds
 
-    # Subband smear (seconds, worst subband)
-    subband_smear_s = tSB_smear(ddms[1], flow, ftop, nsub) 
+        # Subband smear (seconds, worst subband)
+        subband_smear_s = tSB_smear(ddms[1], flow, ftop, nsub) 
 
-    # Total smearing (seconds)
-    total_smear_s = total_smear(dt, freq_smear_s, subband_smear_s, bw_smear_s)
+        # Total smearing (seconds)
+        total_smear_s = total_smear(dt, freq_smear_s, subband_smear_s, bw_smear_s)
 
-    # --- Scattering (seconds) ---
-    dms_scatter = np.where(dms == 0, 0.1, dms) # avoid log10(0)
-    scat_ctr_s    = scattering_s(dms_scatter,  fctr/1000.0)
-    scat_fch1_s   = scattering_s(dms_scatter,  flow/1000.0)
-    scat_fchend_s = scattering_s(dms_scatter,  ftop/1000.0)
+        # --- Scattering (seconds) ---
+        dms_scatter = np.where(dms == 0, 0.1, dms) # avoid log10(0)
+        scat_ctr_s    = scattering_s(dms_scatter,  fctr/1000.0)
+        scat_fch1_s   = scattering_s(dms_scatter,  flow/1000.0)
+        scat_fchend_s = scattering_s(dms_scatter,  ftop/1000.0)
 
-    if args.coherent:
-        freq_smear_s    = np.zeros_like(freq_smear_s)
-        # scat_fch1_s   = np.zeros_like(scat_fch1_s)
-        # scat_fchend_s = np.zeros_like(scat_fchend_s)
+        if args.coherent:
+            freq_smear_s    = np.zeros_like(freq_smear_s)
+            # scat_fch1_s   = np.zeros_like(scat_fch1_s)
+            # scat_fchend_s = np.zeros_like(scat_fchend_s)
         
-    total_plus_scatter_s = np.sqrt(total_smear_s**2 + scat_ctr_s**2) # summating scattering
+        total_plus_scatter_s = np.sqrt(total_smear_s**2 + scat_ctr_s**2) # summating scattering
     
     print('\n=== Smear Values ===')
     print(" DM (pc cm^-3) | Freq Smear (ms) | BW Smear (ms) | Subband Smear (ms) | Total Smear (ms) | Scatter (%s MHz) (ms)" % int(flow))
@@ -397,81 +867,83 @@ def main():
         print(f" {dms[closest_DMidx]:14.1f} | {freq_smear_s[closest_DMidx]*1e3:15.3f} | {bw_smear_s*1e3:13.3f} | {subband_smear_s*1e3:17.3f} | {total_smear_s[closest_DMidx]*1e3:15.3f} | {scat_fch1_s[closest_DMidx]*1e3:20.3f}")
 
     if args.p:
-        plt.figure(figsize=(10, 6), dpi=100)
-
-        # --- Convert for plotting (ms) ---
-        freq_smear       = freq_smear_s       * 1e3
-        bw_smear         = bw_smear_s         * 1e3
-        subband_smear    = subband_smear_s    * 1e3
-        scat_ctr         = scat_ctr_s         * 1e3
-        scat_fch1        = scat_fch1_s        * 1e3
-        scat_fchend      = scat_fchend_s      * 1e3
-
-
-        if args.atnf:
-            w10_mean, w10_1sigma, p0_mean, p0_1sigma = benchmark_ATNF()
-            plt.axhline(y=w10_mean, color='red', linestyle='-', label='W10 Mean')
-            plt.axhline(y=(w10_mean + 3*w10_1sigma), color='red', linestyle='--', label='W10 + 3$\\sigma$')
-
-        # --- Plotting Scattering ---
-        plt.plot(dms, scat_ctr,   label='Scattering (%s MHz)' % int(fctr), color='orange')
-        plt.plot(dms, scat_fch1,  label='Scattering (%s MHz)' % int(flow), color='orange', linestyle='dotted')
-        plt.plot(dms, scat_fchend,label='Scattering (%s MHz)' % int(ftop), color='orange', linestyle='dashed')
-
-        plt.axhline(y=dt, color='purple', linestyle='-.', label='Sampling Time')
+        with stage('plot'):
+            plt = get_pyplot()
+            plt.figure(figsize=(10, 6), dpi=100)
+
+            # --- Convert for plotting (ms) ---
+            freq_smear       = freq_smear_s       * 1e3
+            bw_smear         = bw_smear_s         * 1e3
+            subband_smear    = subband_smear_s    * 1e3
+            scat_ctr         = scat_ctr_s         * 1e3
+            scat_fch1        = scat_fch1_s        * 1e3
+            scat_fchend      = scat_fchend_s      * 1e3
+
+
+            if args.atnf:
+                w10_mean, w10_1sigma, p0_mean, p0_1sigma = benchmark_ATNF()
+                plt.axhline(y=w10_mean, color='red', linestyle='-', label='W10 Mean')
+                plt.axhline(y=(w10_mean + 3*w10_1sigma), color='red', linestyle='--', label='W10 + 3$\\sigma$')
+
+            # --- Plotting Scattering ---
+            plt.plot(dms, scat_ctr,   label='Scattering (%s MHz)' % int(fctr), color='orange')
+            plt.plot(dms, scat_fch1,  label='Scattering (%s MHz)' % int(flow), color='orange', linestyle='dotted')
+            plt.plot(dms, scat_fchend,label='Scattering (%s MHz)' % int(ftop), color='orange', linestyle='dashed')
+
+            plt.axhline(y=dt, color='purple', linestyle='-.', label='Sampling Time')
         
-        # print dm and freq_smear every 100 dm 
-        # print("\nDM (pc cm^-3) | Freq Smear (ms)")
-        # for dm_val in np.arange(0, dms.max(), 10):
-        #     closest_DMidx = nearest_value(dm_val, dms)
-        #     print(f"{dms[closest_DMidx]:.1f}           | {freq_smear[closest_DMidx]:.3f}")
+            # print dm and freq_smear every 100 dm 
+            # print("\nDM (pc cm^-3) | Freq Smear (ms)")
+            # for dm_val in np.arange(0, dms.max(), 10):
+            #     closest_DMidx = nearest_value(dm_val, dms)
+            #     print(f"{dms[closest_DMidx]:.1f}           | {freq_smear[closest_DMidx]:.3f}")
         
-        # --- Plotting Smearing ---
-        plt.plot(dms, freq_smear,                label='Frequency Channel Smearing', color='blue')
-        plt.plot(dms, bw_smear * np.ones_like(dms),    label='DM Step Smearing',      color='lime')
-        plt.plot(dms, subband_smear * np.ones_like(dms), label='Subband Smearing',    color='green')
-        plt.plot(dms, total_plus_scatter_s * 1e3, label='Total Smearing',           color='black', linestyle='--')
-
-        # --- Plot Setup --- 
-        plt.xlabel('DM (pc cm$^{-3}$)', fontsize=14); plt.xlim(dms[0], dms[-1])
-        plt.ylabel('Smearing Time (ms)', fontsize=14)
-        plt.yscale('log')
-        plt.xlim(dms.min(), dms.max())
-        plt.legend(frameon=True, fontsize=8, loc='lower right')
-        plt.grid(True, ls='--', alpha=0.5)
+            # --- Plotting Smearing ---
+            plt.plot(dms, freq_smear,                label='Frequency Channel Smearing', color='blue')
+            plt.plot(dms, bw_smear * np.ones_like(dms),    label='DM Step Smearing',      color='lime')
+            plt.plot(dms, subband_smear * np.ones_like(dms), label='Subband Smearing',    color='green')
+            plt.plot(dms, total_plus_scatter_s * 1e3, label='Total Smearing',           color='black', linestyle='--')
+
+            # --- Plot Setup --- 
+            plt.xlabel('DM (pc cm$^{-3}$)', fontsize=14); plt.xlim(dms[0], dms[-1])
+            plt.ylabel('Smearing Time (ms)', fontsize=14)
+            plt.yscale('log')
+            plt.xlim(dms.min(), dms.max())
+            plt.legend(frameon=True, fontsize=8, loc='lower right')
+            plt.grid(True, ls='--', alpha=0.5)
         
-        if args.s:
-            plt.savefig(f"{outname}.png", dpi=300)
-        plt.show()
+            if args.s:
+                plt.savefig(f"{outname}.png", dpi=300)
+            plt.show()
         
-        if args.dat:
-            # Save data to .dat file
-            dat_filename = f"{outname}.dat"
-            with open(dat_filename, 'w') as f:
-                f.write("# DM (pc cm^-3) | Freq Smear (ms) | BW Smear (ms) | Subband Smear (ms) | Total Smear (ms) | Scatter (%s MHz) (ms)\n" % int(flow))
-                for i in range(len(dms)):
-                    f.write(f"{dms[i]:.6f} {freq_smear[i]:.6f} {bw_smear:.6f} {subband_smear:.6f} {total_smear_s[i]*1e3:.6f} {scat_fch1[i]:.6f}\n")
-            print(f"Data saved to {dat_filename}")
+            if args.dat:
+                # Save data to .dat file
+                dat_filename = f"{outname}.dat"
+                with open(dat_filename, 'w') as f:
+                    f.write("# DM (pc cm^-3) | Freq Smear (ms) | BW Smear (ms) | Subband Smear (ms) | Total Smear (ms) | Scatter (%s MHz) (ms)\n" % int(flow))
+                    for i in range(len(dms)):
+                        f.write(f"{dms[i]:.6f} {freq_smear[i]:.6f} {bw_smear:.6f} {subband_smear:.6f} {total_smear_s[i]*1e3:.6f} {scat_fch1[i]:.6f}\n")
+                print(f"Data saved to {dat_filename}")
         
-        # --- Plotting DM Trials ---
-        plt.figure(figsize=(10, 6), dpi=100)
+            # --- Plotting DM Trials ---
+            plt.figure(figsize=(10, 6), dpi=100)
         
-        ax1 = plt.gca()
-        ax1.plot(dms[1:], ndms[1:], color='red')
-        ax1.set_yscale('log')
-        ax1.set_xlabel('DM (pc cm$^{-3}$)')
-        ax1.set_ylabel('Number of DM Trials per pc cm$^{-3}$', color='red')
-        ax1.tick_params(axis='y', labelcolor='red')
-        ax1.set_xlim(dms[0], dms[-1])
-
-        ax2 = ax1.twinx()
-        ax2.plot(dms[1:], ddms[1:])
-        ax2.set_yscale('log')
-        ax2.set_ylabel('$\Delta$ DM (pc cm$^{-3}$)', color ='blue')
-        ax2.tick_params(axis='y', labelcolor='blue')
-        plt.xlim(dms[0], dms[-1])
-        plt.grid(True, ls='--', alpha=0.5)
-        plt.show()
+            ax1 = plt.gca()
+            ax1.plot(dms[1:], ndms[1:], color='red')
+            ax1.set_yscale('log')
+            ax1.set_xlabel('DM (pc cm$^{-3}$)')
+            ax1.set_ylabel('Number of DM Trials per pc cm$^{-3}$', color='red')
+            ax1.tick_params(axis='y', labelcolor='red')
+            ax1.set_xlim(dms[0], dms[-1])
+
+            ax2 = ax1.twinx()
+            ax2.plot(dms[1:], ddms[1:])
+            ax2.set_yscale('log')
+            ax2.set_ylabel('$\Delta$ DM (pc cm$^{-3}$)', color ='blue')
+            ax2.tick_params(axis='y', labelcolor='blue')
+            plt.xlim(dms[0], dms[-1])
+            plt.grid(True, ls='--', alpha=0.5)
+            plt.show()
 
 if __name__ == '__main__': 
     main()
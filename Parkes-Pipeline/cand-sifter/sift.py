@@ -6,105 +6,417 @@ Date: 2024-02-22
 '''
 
 import numpy as np 
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 import glob
 import re
 import pandas as pd
 import os 
 import argparse 
+import hashlib
+import json
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from math import gcd
 
-file_list = glob.glob('/fred/oz203/data/PX094/J0523-2529/cand_plot/accelsearchcands/sifted/uwl*.txt')
-sf_path = '/fred/oz203/data/PX094/J0523-2529/frequency_split'
-sf_files = glob.glob(f'{sf_path}/*/*.sf')
-output_file_path = "/fred/oz203/data/PX094/J0523-2529/cand_plot/accelsearchcands/sifted/prepfold_commands.txt"
-ps_output_path = "/fred/oz203/data/PX094/J0523-2529/cand_plot/accelsearchcands/prepfold"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Binary-Orbital-Calculations'))
+from accel_functions import calculate_z
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Useful-Scripts'))
+from instrumentation import start_run, stage
 
-cand_num = []; file_names = []
-cand_dms = []; cand_snrs = []; cand_sigmas = []
-num_harm = []; ipow = []; cpow = []; Period = []
-r = []; z = []; num_hits = [] 
+CAND_COLUMNS = ['cand_num', 'DM', 'SNR', 'Sigma', 'numharm', 'ipow', 'cpow', 'P(ms)', 'r', 'z', 'numhits']
+CAND_DTYPES = {'cand_num': np.int32, 'DM': np.float64, 'SNR': np.float64, 'Sigma': np.float64, 'numharm': np.int16,
+               'ipow': np.float64, 'cpow': np.float64, 'P(ms)': np.float64, 'r': np.float64, 'z': np.float64, 'numhits': np.int32}
+NUMBER_RE = re.compile(r'[-+]?\d*\.\d+|[-+]?\d+')
+EPOCH_RE = r'uwl_(\d{6})_(\d{6})'
 
-master_dataframe = pd.DataFrame(columns=['file', 'cand_num', 'DM', 'SNR', 'Sigma', 'numharm', 'ipow', 'cpow', 'P(ms)', 'r', 'z', 'numhits'])
+# J0523-2529 orbit, as in z-param-calculator-mjd.py and the prepfold -bin options
+K2 = 190300                             # semi-amplitude of radial velocity in m/s
+P_ORB = 59454.432                       # orbital period in seconds
+Q = 0.61                                # mass ratio
+MJD_ASC = 2456577.64636 - 2400000.5     # epoch of ascending node
 
-for file in file_list:
+def fetch_args():
+    '''
+    Fetches the arguments from the command line
+    '''
+    parser = argparse.ArgumentParser(description='Collect ACCEL_sift candidates into a .csv and generate prepfold commands')
+    parser.add_argument('-i', '--input', type=str, default='/fred/oz203/data/PX094/J0523-2529/cand_plot/accelsearchcands/sifted/uwl*.txt', help='Glob of sifted candidate files')
+    parser.add_argument('-sf', '--sf_path', type=str, default='/fred/oz203/data/PX094/J0523-2529/frequency_split', help='Directory holding <obs>/<file>.sf')
+    parser.add_argument('-o', '--output', type=str, default='/fred/oz203/data/PX094/J0523-2529/cand_plot/accelsearchcands/sifted/prepfold_commands.txt', help='Output file for prepfold commands')
+    parser.add_argument('-ps', '--ps_output', type=str, default='/fred/oz203/data/PX094/J0523-2529/cand_plot/accelsearchcands/prepfold', help='Directory prepfold writes its output to')
+    parser.add_argument('-csv', '--csv', type=str, default='overall_candidates_huh.csv', help='Output .csv of candidates passing the S/N cut')
+    parser.add_argument('-snr', '--snr', type=float, default=20.0, help='S/N threshold for prepfold (default = 20)')
+    parser.add_argument('-nocluster', '--nocluster', action='store_true', help='Fold every candidate instead of one per harmonic/DM cluster')
+    parser.add_argument('-max_harm', '--max_harm', type=int, default=16, help='Largest numerator/denominator of the harmonic ratios n/m to cluster (default = 16)')
+    parser.add_argument('-ptol', '--ptol', type=float, default=1e-5, help='Largest fractional period tolerance for harmonic matches (default = 1e-5)')
+    parser.add_argument('-chance', '--chance', type=float, default=0.01, help='Expected number of chance harmonic matches per cluster; narrows -ptol in crowded observations (default = 0.01)')
+    parser.add_argument('-dmtol', '--dmtol', type=float, default=25.0, help='DM tolerance within a cluster in DM trials of the plan (default = 25)')
+    parser.add_argument('-plan', '--plan', type=str, default=None, help='DM plan .json of DM-me-maybe.py giving the DM step; by default it is taken from the candidate DMs of each band')
+    parser.add_argument('-orbit', '--orbit', action='store_true', help='Rank candidates by agreement of their z with the J0523-2529 orbit and fold only consistent ones')
+    parser.add_argument('-ztol', '--ztol', type=float, default=2.0, help='z tolerance on top of the orbital drift during the observation (default = 2, the accelsearch z step)')
+    parser.add_argument('-ztop', '--ztop', type=int, default=None, help='With -orbit, fold at most this many of the most consistent candidates')
+    parser.add_argument('-db', '--db', type=str, default='sift_candidates.sqlite', help='Persistent candidate store; only new or changed sifted files are parsed (default = sift_candidates.sqlite)')
+    parser.add_argument('-rebuild', '--rebuild', action='store_true', help='Ignore the candidate store and re-parse every sifted file')
+    parser.add_argument('-all', '--all', action='store_true', help='Write prepfold commands even for candidates whose .pfd.ps already exists')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='Number of parser processes (default = all cores)')
+    parser.add_argument('-profile', '--profile', action='store_true', help='Write a JSON timing/memory report and a cProfile dump for this run')
+    return parser.parse_args()
+
+def parse_sifted(file, write_csv=True):
+    '''
+    Parses a single ACCEL_sift output file into a typed dataframe sorted by Sigma.
+    Only the candidate header lines (those naming the uwl observation) are kept.
+    '''
+    obs_names = []; rows = []
     with open(file) as f:
         for line in f:
             if 'uwl' in line:
-                header = line.split(':')[1]
-                obs_file_name = line.split(':')[0]
-                numbers = re.findall(r'[-+]?\d*\.\d+|[-+]?\d+', header)
-                numbers = [float(num) if '.' in num else int(num) for num in numbers]
-
-                # Appending to lists
-                cand_num.append(numbers[0])
-                cand_dms.append(numbers[1])
-                cand_snrs.append(numbers[2])
-                cand_sigmas.append(numbers[3])
-                num_harm.append(numbers[4])
-                ipow.append(numbers[5])
-                cpow.append(numbers[6])
-                Period.append(numbers[7])
-                r.append(numbers[8])
-                z.append(numbers[9])
-                num_hits.append(numbers[10])
-                file_names.append(obs_file_name)
-
-        # Create a dataframe for the current file
-        dataframe = pd.DataFrame({
-            'file': file_names,
-            'cand_num': cand_num,
-            'DM': cand_dms,
-            'SNR': cand_snrs,
-            'Sigma': cand_sigmas,
-            'numharm': num_harm,
-            'ipow': ipow,
-            'cpow': cpow,
-            'P(ms)': Period,
-            'r': r,
-            'z': z,
-            'numhits': num_hits
-        })
-
-        dataframe = dataframe.sort_values(by='Sigma', ascending=False)
-
-        # Print filtered stats
-        # print(f'Number of candidates in {file}:', len(dataframe))
+                obs_file_name, header = line.split(':')[:2]
+                obs_names.append(obs_file_name)
+                rows.append(NUMBER_RE.findall(header)[:len(CAND_COLUMNS)])
+
+    values = np.array(rows, dtype=float).reshape(-1, len(CAND_COLUMNS))
+    dataframe = pd.DataFrame({'file': obs_names})
+    for i, col in enumerate(CAND_COLUMNS):
+        dataframe[col] = values[:, i].astype(CAND_DTYPES[col])
+
+    dataframe = dataframe.sort_values(by='Sigma', ascending=False)
+    if write_csv:
         dataframe.to_csv(f'{file.split(".")[0]}.csv', index=False)
+    return dataframe
+
+def _parse_files(file_list, workers=None):
+    '''
+    Parses the sifted files in a process pool, returning one dataframe per file
+    '''
+    if workers == 1 or len(file_list) <= 1:
+        return [parse_sifted(file) for file in file_list]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parse_sifted, file_list, chunksize=max(1, len(file_list) // (4 * (workers or os.cpu_count() or 1)))))
+
+def _empty_candidates():
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in [('file', object)] + list(CAND_DTYPES.items())})
+
+def read_candidates(file_list, workers=None):
+    '''
+    Parses every sifted file in a process pool and returns one table, concatenated once.
+    '''
+    if not file_list:
+        return _empty_candidates()
+    return pd.concat(_parse_files(file_list, workers), ignore_index=True)
+
+def open_store(db_path):
+    '''
+    Opens (creating if needed) the SQLite candidate store: one row per ingested sifted file with its
+    mtime, size and SHA-1, and every parsed candidate tagged with the file it came from
+    '''
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE IF NOT EXISTS ingested (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, sha1 TEXT)')
+    columns = ', '.join(f'"{col}" {"INTEGER" if np.issubdtype(dtype, np.integer) else "REAL"}' for col, dtype in CAND_DTYPES.items())
+    conn.execute(f'CREATE TABLE IF NOT EXISTS candidates (source TEXT, file TEXT, {columns})')
+    conn.execute('CREATE INDEX IF NOT EXISTS candidates_source ON candidates (source)')
+    return conn
+
+def _sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def update_store(conn, file_list, workers=None):
+    '''
+    Parses only the sifted files that are new or whose contents changed since they were ingested.
+    Files are compared by mtime and size first; the SHA-1 is only computed when those differ, so a
+    touched but unchanged file is not re-parsed. All changes are made in one transaction, so an
+    interrupted run leaves the store as it was. Returns the number of files parsed.
+    '''
+    known = {path: (mtime, size, sha1) for path, mtime, size, sha1 in conn.execute('SELECT path, mtime, size, sha1 FROM ingested')}
+
+    todo, touched = [], []
+    for path in file_list:
+        st = os.stat(path)
+        record = known.get(path)
+        if record and record[0] == st.st_mtime and record[1] == st.st_size:
+            continue
+        sha1 = _sha1(path)
+        if record and record[2] == sha1:
+            touched.append((st.st_mtime, st.st_size, path))
+            continue
+        todo.append((path, st.st_mtime, st.st_size, sha1))
+
+    frames = _parse_files([t[0] for t in todo], workers)
+    columns = ['source', 'file'] + CAND_COLUMNS
+    insert = 'INSERT INTO candidates (%s) VALUES (%s)' % (', '.join(f'"{col}"' for col in columns), ', '.join('?' * len(columns)))
+    with conn:
+        conn.executemany('UPDATE ingested SET mtime = ?, size = ? WHERE path = ?', touched)
+        for (path, mtime, size, sha1), frame in zip(todo, frames):
+            conn.execute('DELETE FROM candidates WHERE source = ?', (path,))
+            conn.executemany(insert, frame.assign(source=path)[columns].astype(object).itertuples(index=False, name=None))
+            conn.execute('INSERT OR REPLACE INTO ingested VALUES (?, ?, ?, ?)', (path, mtime, size, sha1))
+    return len(todo)
+
+def load_store(conn, file_list):
+    '''
+    Returns the stored candidates of the given sifted files, in file order as read_candidates would
+    '''
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (source TEXT PRIMARY KEY)')
+    with conn:
+        conn.execute('DELETE FROM wanted')
+        conn.executemany('INSERT OR IGNORE INTO wanted VALUES (?)', ((path,) for path in file_list))
+    stored = pd.read_sql('SELECT candidates.* FROM candidates JOIN wanted USING (source) ORDER BY source, candidates.rowid', conn)
+    stored = stored.drop(columns='source')
+    if stored.empty:
+        return _empty_candidates()
+    return stored.astype(CAND_DTYPES).reset_index(drop=True)
+
+def harmonic_ratios(max_harm=16):
+    '''
+    Returns the sorted rational period ratios n/m with n, m <= max_harm in lowest terms
+    '''
+    ratios = {n / m for n in range(1, max_harm + 1) for m in range(1, max_harm + 1) if gcd(n, m) == 1}
+    return np.array(sorted(ratios))
+
+def dm_steps(dataframe, plan_file=None):
+    '''
+    Returns the DM step of the dedispersion plan at every candidate.
+
+    With plan_file (a DM-me-maybe.py -json plan), the step is the ΔDM of the segment holding the
+    candidate DM. Otherwise it is the smallest spacing between the candidate DMs of the same band
+    (e.g. 3.0-4.0GHz) across all observations, as every observation of a band uses the same plan.
+    '''
+    dms = dataframe['DM'].to_numpy(dtype=float)
+    if plan_file:
+        with open(plan_file) as f:
+            segments = sorted(json.load(f)['segments'], key=lambda seg: seg['start'])
+        starts = np.array([seg['start'] for seg in segments])
+        ddm = np.array([seg['ddm'] for seg in segments])
+        return ddm[np.clip(np.searchsorted(starts, dms, side='right') - 1, 0, len(ddm) - 1)]
+
+    def smallest_gap(values):
+        gaps = np.diff(np.unique(np.round(values, 6)))
+        return gaps.min() if gaps.size else np.nan
+
+    band = dataframe['file'].str.split('_prepsub').str[0].str.split('.add_').str[-1]
+    steps = pd.Series(dms).groupby(band.to_numpy()).transform(smallest_gap).to_numpy()
+    fallback = smallest_gap(dms)
+    return np.where(np.isnan(steps), fallback if np.isfinite(fallback) else 1.0, steps)
+
+def cluster_candidates(dataframe, max_harm=16, ptol=1e-5, dm_tol=25.0, chance=0.01, steps=None):
+    '''
+    Groups candidates of the same observation that are harmonically related and close in DM.
+
+    Candidates are visited from the highest Sigma down. Each unassigned candidate seeds a cluster and
+    collects every unassigned candidate of its observation (any sub-band) whose period is a rational
+    multiple n/m of its own (n, m <= max_harm) and whose DM is within dm_tol DM steps (steps, one per
+    candidate, the larger of the pair is used; dm_steps() by default).
+
+    Chance coincidences are controlled per seed: with N candidates in its DM window spread over the
+    log-period range L of all candidates, the ratio windows catch 2 * ptol * n_ratios * N / L unrelated candidates on
+    average, so the period tolerance is narrowed until that is at most `chance` (never above ptol).
+    Matches are found with np.searchsorted on the sorted log-periods, so each cluster costs
+    O(n_ratios log N).
+
+    Returns the representatives (the seed of each cluster) with the hit statistics
+    nmembers, nharmonics, nsubbands, DM_lo and DM_hi, and the input with a cluster column.
+    '''
+    dataframe = dataframe.reset_index(drop=True)
+    obs = dataframe['file'].str.split('.add').str[0]
+    subband = dataframe['file'].str.split('_prepsub').str[0]
+    period = dataframe['P(ms)'].to_numpy(dtype=float)
+    dms = dataframe['DM'].to_numpy(dtype=float)
+    sigma = dataframe['Sigma'].to_numpy(dtype=float)
+    steps = dm_steps(dataframe) if steps is None else np.asarray(steps, dtype=float)
+    log_ratios = np.log(harmonic_ratios(max_harm))
+    log_span = max(np.ptp(np.log(period)), 1.0) if len(period) else 1.0
+
+    cluster = np.full(len(dataframe), -1)
+    nharmonics = {}
+    next_id = 0
+    for _, idx in obs.groupby(obs).indices.items():
+        order = idx[np.argsort(period[idx])]
+        log_period = np.log(period[order])
+        sorted_dms = np.sort(dms[idx])
+        dm_window = dm_tol * steps[idx].max()
+
+        for seed in idx[np.argsort(-sigma[idx], kind='stable')]:
+            if cluster[seed] >= 0:
+                continue
+            n_near = np.searchsorted(sorted_dms, dms[seed] + dm_window, side='right') - np.searchsorted(sorted_dms, dms[seed] - dm_window, side='left')
+            tol = min(ptol, chance * log_span / (2 * len(log_ratios) * max(n_near - 1, 1)))
+            targets = np.log(period[seed]) + log_ratios
+            lo = np.searchsorted(log_period, targets - tol, side='left')
+            hi = np.searchsorted(log_period, targets + tol, side='right')
+            lens = hi - lo
+            hit = lens > 0
+            lo, lens = lo[hit], lens[hit]
+            pos = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens) + np.repeat(lo, lens)
+            ratio_ids = np.repeat(np.flatnonzero(hit), lens)
+
+            members = order[pos]
+            keep = (cluster[members] < 0) & (np.abs(dms[members] - dms[seed]) <= dm_tol * np.maximum(steps[members], steps[seed]))
+            members, ratio_ids = members[keep], ratio_ids[keep]
+            cluster[members] = next_id
+            cluster[seed] = next_id
+            nharmonics[next_id] = max(1, len(np.unique(ratio_ids)))
+            next_id += 1
+
+    dataframe['cluster'] = cluster
+    grouped = dataframe.groupby('cluster')
+    reps = dataframe.loc[grouped['Sigma'].idxmax()].set_index('cluster')
+    reps['nmembers'] = grouped.size()
+    reps['nharmonics'] = pd.Series(nharmonics)
+    reps['nsubbands'] = subband.groupby(cluster).nunique()
+    reps['DM_lo'] = grouped['DM'].min()
+    reps['DM_hi'] = grouped['DM'].max()
+    reps = reps.reset_index().sort_values(by='Sigma', ascending=False)
+    return reps, dataframe
+
+def obs_start_mjd(files):
+    '''
+    Returns the start MJD of each candidate from the uwl_yymmdd_hhmmss in its file name (NaN if absent)
+    '''
+    stamps = files.str.extract(EPOCH_RE)
+    iso = '20' + stamps[0].str[:2] + '-' + stamps[0].str[2:4] + '-' + stamps[0].str[4:] + 'T' + \
+          stamps[1].str[:2] + ':' + stamps[1].str[2:4] + ':' + stamps[1].str[4:]
+    start = pd.to_datetime(iso, format='%Y-%m-%dT%H:%M:%S', errors='coerce')
+    return ((start - pd.Timestamp('1858-11-17')) / pd.Timedelta(days=1)).to_numpy(dtype=float)
+
+def orbit_scores(dataframe, ztol=2.0, k2=K2, P_orb=P_ORB, q=Q, mjd_asc=MJD_ASC):
+    '''
+    Adds the orbit-predicted z of every candidate and how well its measured z agrees, in one pass.
+
+    The observation length follows from the Fourier bin and period (T = r * P), and the prediction is
+    made at mid-observation with calculate_z. The tolerance is ztol plus half the change of the predicted
+    z over the observation, so candidates near quadrature are not penalised for the orbit moving.
+    orbit_score = |z - z_pred| / z_tol, with <= 1 counting as consistent.
+    '''
+    period = dataframe['P(ms)'].to_numpy(dtype=float) / 1000
+    T_obs = dataframe['r'].to_numpy(dtype=float) * period
+    t_start = (obs_start_mjd(dataframe['file']) - mjd_asc) * 86400
+
+    z_start, z_mid, z_end = (calculate_z(1 / period, k2, P_orb, q, t_start + frac * T_obs, 0, T_obs) for frac in (0, 0.5, 1))
+    z_tol = ztol + np.abs(z_end - z_start) / 2
+
+    dataframe = dataframe.copy()
+    dataframe['z_pred'] = z_mid
+    dataframe['z_tol'] = z_tol
+    dataframe['orbit_score'] = np.abs(dataframe['z'].to_numpy(dtype=float) - z_mid) / z_tol
+    return dataframe
+
+def index_sf_files(sf_files, mask_files):
+    '''
+    Maps each observation root (the .sf file name without extension) to its .sf path and rfifind mask.
+    The mask entry is None when the mask does not exist, so lookups never scan the file lists.
+    '''
+    mask_files = set(mask_files)
+    index = {}
+    for sf_file in sf_files:
+        root = os.path.basename(sf_file)[:-len('.sf')]
+        mask_file = os.path.join(os.path.dirname(sf_file), 'masks', f'{root}_rfifind.mask')
+        index[root] = (sf_file, mask_file if mask_file in mask_files else None)
+    return index
+
+def check_inputs(prepfold_df, index):
+    '''
+    Reports observations whose .sf or mask file is missing and drops their candidates
+    '''
+    roots = prepfold_df['file'].str.split('_prepsub').str[0]
+    missing_sf = sorted(root for root in roots.unique() if root not in index)
+    missing_mask = sorted(root for root in roots.unique() if root in index and index[root][1] is None)
+
+    for root in missing_sf:
+        print(f'⚠️ No .sf file found for {root}, skipping its candidates')
+    for root in missing_mask:
+        print(f'⚠️ No rfifind mask found for {root}, skipping its candidates')
+
+    return prepfold_df[~roots.isin(missing_sf + missing_mask)]
+
+def write_prepfold_commands(prepfold_df, index, output_file_path, ps_output_path, skip_done=True):
+    '''
+    Writes one prepfold command per candidate to output_file_path, resolving .sf and mask files through the index.
+    With skip_done, candidates whose .pfd.ps already exists in ps_output_path are left out.
+    Returns the number of commands written.
+    '''
+    done = set(os.listdir(ps_output_path)) if skip_done and os.path.isdir(ps_output_path) else set()
+    n_written = 0
+
+    ignore_chans = "0:115,216:335,402,485:563,575,578,582,664:743,778:809,812:895,958:991,996:1024,1252:1259,1276:1283,1292,1296,1300:1307,1316,1348,1432,1456,1472,1501:1504,1508,1511:1530,1596,1600,1668,1724,1735:1737,1784,1788,2084:2103,2784,3176:3179,3183:3184,3656:3689,4024:4128,4164:4203,4404:4483,4564:4643,4704:4799,4864,5079:5147,5312:5315,5436:5439,5492:5495,5500:5503,5556:5559,5624:5663,5684:5703,5744:5803,5824:5827,5844:5863,5948:5951,6004:6007,6012:6015,6068:6071,6089:6090,6392:6711,7132:7167,7384:7463,7864:7943,9471,10964:11042,11384:11462"
+    orbital_commands = f'-bin -pb 59454.432 -e 0.04 -To 56577.14636 -w 0'
+
+    with open(output_file_path, 'w') as file:
+        # generate prepfold commands to .txt file
+        for cand_file, cand_snr, cand_dm, cand_period in zip(prepfold_df['file'], prepfold_df['SNR'], prepfold_df['DM'], prepfold_df['P(ms)']):
+            file_name = cand_file.split("_prepsub")[0]
+            sf_file, mask_file = index[file_name]
 
-        # Append to the master dataframe
-        master_dataframe = pd.concat([master_dataframe, dataframe], ignore_index=True)
+            # output_ps = (cand_file.split("_ACCEL")[0] + f'_SNR{cand_snr}').replace(".", "_")
+            root_name = cand_file.split(".add")[0]; snr = int(cand_snr); dm = int(cand_dm)
+            output_ps = f'{root_name}_SNR{snr}_DM{dm}'
+            output_prefix = os.path.join(ps_output_path, output_ps)
+            command = f'cd {ps_output_path}; prepfold -noxwin {orbital_commands} -n 128 -p {cand_period/1000} -dm {cand_dm} -ndmfact 1 -dmstep 5 -o {output_ps} -mask {mask_file} -ignorechan {ignore_chans} {sf_file}\n'
 
+            ps_file = f'{output_prefix}_{cand_period:.2f}ms_Cand.pfd.ps'
+            if os.path.basename(ps_file) in done:
+                continue
 
+            file.write(command)
+            n_written += 1
+    return n_written
 
-# filter based on SNR 
-master_dataframe = master_dataframe.drop_duplicates(subset=['file', 'DM', 'SNR'], keep='first')
-prepfold_df = master_dataframe[master_dataframe['SNR'] > 20]
-print('Number of candidate commands generate for prepfold: %s' % len(prepfold_df))
-# Save the overall dataframe to a CSV file
-prepfold_df.to_csv('overall_candidates_huh.csv', index=False)
+def main():
+    args = fetch_args()
+    start_run('sift.py', profile=args.profile)
 
+    with stage('index'):
+        file_list = sorted(glob.glob(args.input))
+        sf_files = glob.glob(f'{args.sf_path}/*/*.sf')
+        mask_files = glob.glob(f'{args.sf_path}/*/masks/*_rfifind.mask')
+        index = index_sf_files(sf_files, mask_files)
 
-with open(output_file_path, 'w') as file:
-    # generate prepfold commands to .txt file
-    for i in (range(len(prepfold_df))):
-        file_name = prepfold_df.iloc[i]["file"].split("_prepsub")[0]
-        sf_file = [sf for sf in sf_files if file_name in sf][0]
-        mask_file = os.path.join(os.path.dirname(sf_file), 'masks', f'{file_name}_rfifind.mask')
-        ignore_chans = "0:115,216:335,402,485:563,575,578,582,664:743,778:809,812:895,958:991,996:1024,1252:1259,1276:1283,1292,1296,1300:1307,1316,1348,1432,1456,1472,1501:1504,1508,1511:1530,1596,1600,1668,1724,1735:1737,1784,1788,2084:2103,2784,3176:3179,3183:3184,3656:3689,4024:4128,4164:4203,4404:4483,4564:4643,4704:4799,4864,5079:5147,5312:5315,5436:5439,5492:5495,5500:5503,5556:5559,5624:5663,5684:5703,5744:5803,5824:5827,5844:5863,5948:5951,6004:6007,6012:6015,6068:6071,6089:6090,6392:6711,7132:7167,7384:7463,7864:7943,9471,10964:11042,11384:11462"
+    with stage('store'):
+        if args.rebuild and os.path.exists(args.db):
+            os.remove(args.db)
+        conn = open_store(args.db)
+        n_parsed = update_store(conn, file_list, args.workers)
+        print('Parsed %s new or changed sifted files (%s unchanged)' % (n_parsed, len(file_list) - n_parsed))
+        master_dataframe = load_store(conn, file_list)
+        conn.close()
 
-        orbital_commands = f'-bin -pb 59454.432 -e 0.04 -To 56577.14636 -w 0'
-        # output_ps = (prepfold_df.iloc[i]["file"].split("_ACCEL")[0] + f'_SNR{prepfold_df.iloc[i]["SNR"]}').replace(".", "_")
-        root_name = prepfold_df.iloc[i]["file"].split(".add")[0]; snr=int(prepfold_df.iloc[i]["SNR"]); dm = int(prepfold_df.iloc[i]["DM"])
-        output_ps = f'{root_name}_SNR{snr}_DM{dm}'
-        output_prefix = os.path.join(ps_output_path, output_ps)
-        command = f'cd {ps_output_path}; prepfold -noxwin {orbital_commands} -n 128 -p {prepfold_df.iloc[i]["P(ms)"]/1000} -dm {prepfold_df.iloc[i]["DM"]} -ndmfact 1 -dmstep 5 -o {output_ps} -mask {mask_file} -ignorechan {ignore_chans} {sf_file}\n'
+    # filter based on SNR 
+    master_dataframe = master_dataframe.drop_duplicates(subset=['file', 'DM', 'SNR'], keep='first')
+    if args.orbit:
+        with stage('orbit'):
+            master_dataframe = orbit_scores(master_dataframe, args.ztol)
+    if not args.nocluster:
+        with stage('cluster'):
+            steps = dm_steps(master_dataframe.reset_index(drop=True), args.plan)
+            reps, master_dataframe = cluster_candidates(master_dataframe, args.max_harm, args.ptol, args.dmtol, args.chance, steps)
+            stats = reps[['cluster', 'nmembers', 'nharmonics', 'nsubbands', 'DM_lo', 'DM_hi']]
+            master_dataframe = master_dataframe.merge(stats, on='cluster', how='left').sort_values(by='Sigma', ascending=False)
+            print('Clustered %s candidates into %s harmonic/DM groups' % (len(master_dataframe), len(reps)))
+    prepfold_df = master_dataframe[master_dataframe['SNR'] > args.snr]
+    if args.orbit:
+        prepfold_df = prepfold_df[prepfold_df['orbit_score'] <= 1].sort_values(by=['orbit_score', 'Sigma'], ascending=[True, False])
+        print('Orbit-consistent candidates: %s of %s' % (len(prepfold_df), (master_dataframe['SNR'] > args.snr).sum()))
+    with stage('write'):
+        prepfold_df = check_inputs(prepfold_df, index)
+        # one fold per cluster, of its best member left after the cuts; every member stays in the .csv
+        fold_df = prepfold_df.drop_duplicates(subset='cluster') if not args.nocluster else prepfold_df
+        if args.orbit and args.ztop:
+            fold_df = fold_df.head(args.ztop)
+        print('Number of candidate commands generate for prepfold: %s' % len(fold_df))
+        # Save the overall dataframe to a CSV file
+        if not args.nocluster:
+            prepfold_df.assign(folded=prepfold_df.index.isin(fold_df.index)).to_csv(args.csv, index=False)
+        else:
+            fold_df.to_csv(args.csv, index=False)
 
-        ps_file = f'{output_prefix}_{prepfold_df.iloc[i]["P(ms)"]:.2f}ms_Cand.pfd.ps'
-        
-        # if ps_file not in glob.glob(f'{ps_output_path}/*'):
+        n_written = write_prepfold_commands(fold_df, index, args.output, args.ps_output, skip_done=not args.all)
+        print('Wrote %s prepfold commands (%s already folded)' % (n_written, len(fold_df) - n_written))
 
-        file.write(command)
+if __name__ == '__main__':
+    main()
 
 # figsize = 6
 # fontsize = 13
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Tests of the harmonic/DM candidate clustering in sift.py (run with pytest)
+Author: Owen A. Johnson
+Date: 2025-10-20
+'''
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import sift
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'overall_candidates_huh.csv')
+
+def test_sample_family_is_merged():
+    # 5.00017 ms and its 1, 1/2, 3/10 and 16/3 harmonics in one observation, DM 16.5-27.5 on a 0.5 step
+    candidates = pd.read_csv(SAMPLE_CSV)
+    reps, members = sift.cluster_candidates(candidates)
+    family = members[members['file'].str.startswith('uwl_221109_114040_16.add_3.0-4.0GHz')]
+    assert family['cluster'].nunique() == 1
+    assert np.allclose(np.sort(family['P(ms)']), [1.500051, 2.50008, 5.000154, 5.00017, 26.667574])
+    assert len(reps) < len(candidates)
+    assert reps.set_index('cluster').loc[family['cluster'].iloc[0], 'P(ms)'] == 5.00017
+
+def test_random_candidates_stay_apart():
+    rng = np.random.default_rng(0)
+    n = 900
+    candidates = pd.DataFrame({'file': ['uwl_230101_000000_0.add_3.0-4.0GHz_prepsub_DM0.00_ACCEL_200'] * n,
+                               'P(ms)': np.exp(rng.uniform(0, np.log(1000), n)),
+                               'DM': rng.integers(0, 1000, n) * 0.5, 'Sigma': rng.uniform(2, 20, n)})
+    reps, _ = sift.cluster_candidates(candidates)
+    assert len(reps) >= 0.98 * n
+
+def test_dm_steps(tmp_path):
+    candidates = pd.read_csv(SAMPLE_CSV)
+    steps = sift.dm_steps(candidates)
+    high = candidates['file'].str.contains('3.0-4.0GHz').to_numpy()
+    assert np.allclose(steps[high], 0.5)
+
+    plan_file = tmp_path / 'plan.json'
+    plan_file.write_text(json.dumps({'config': {}, 'segments': [{'start': 0, 'stop': 20, 'ddm': 0.1}, {'start': 20, 'stop': 100, 'ddm': 0.3}]}))
+    steps = sift.dm_steps(candidates, str(plan_file))
+    assert np.allclose(steps, np.where(candidates['DM'] < 20, 0.1, 0.3))
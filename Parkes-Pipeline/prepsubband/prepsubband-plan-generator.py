@@ -0,0 +1,191 @@
+'''
+Code Purpose: Turn a DM plan exported by DM-me-maybe.py (-json) into load-balanced prepsubband / transientx sbatch jobs.
+Each plan segment is split into chunks of DM trials sized to the memory of a node, and chunks are packed
+onto nodes (one chunk per core) so that every job carries roughly the same amount of work.
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+Example Usage: python prepsubband-plan-generator.py -i /fred/oz203/data/PX094/J0523-2529/frequency_split -plan ddm_plan_f704-1920_dt0.064_df0.25_dm600.json -band 0.7-1.9GHz
+'''
+import argparse
+import glob
+import json
+import os
+
+# Channels to ignore for each UWL slice, as in prepsubband.sh
+IGNORE_CHANS = {
+    '0.7-1.9GHz': '0:115,216:335,402,485:563,575,578,582,664:743,778:809,812:895,958:991,996:1024,1252:1259,1276:1283,1292,1296,1300:1307,1316,1348,1432,1456,1472,1501:1504,1508,1511:1530,1596,1600,1668,1724,1735:1737,1784,1788,2084:2103,2784,3176:3179,3183:3184,3656:3689,4024:4128,4164:4203,4404:4483,4564:4607',
+    '1.9-3.0GHz': '0:35,96:191,256,471:539,704:707,828:831,884:887,892:895,948:951,1016:1055,1076:1095,1136:1195,1216:1219,1236:1255,1340:1343,1396:1399,1404:1407,1460:1463,1481:1482,1784:2103,2524:2559,2776:2855,3256:3335',
+    '3.0-4.0GHz': '0,1493:1571,1913:1991',
+}
+
+def fetch_args():
+    '''
+    Fetches the arguments from the command line
+    '''
+    parser = argparse.ArgumentParser(description='Generate load-balanced prepsubband/transientx sbatch jobs from a DM plan')
+    parser.add_argument('-i', '--input', type=str, help='Directory searched recursively for .sf files', required=True)
+    parser.add_argument('-plan', '--plan', type=str, help='DM plan .json written by DM-me-maybe.py -json', required=True)
+    parser.add_argument('-band', '--band', type=str, help='Only use .sf files whose name contains this slice, e.g. 0.7-1.9GHz', default=None)
+    parser.add_argument('-tool', '--tool', type=str, choices=['prepsubband', 'transientx'], default='prepsubband', help='Dedispersion tool to emit commands for (default = prepsubband)')
+    parser.add_argument('-cores', '--cores', type=int, default=8, help='Cores per node, one chunk runs per core (default = 8)')
+    parser.add_argument('-mem', '--mem', type=float, default=32.0, help='Memory per node in GB (default = 32)')
+    parser.add_argument('-mem_trial', '--mem_trial', type=float, default=16.0, help='Estimated memory per DM trial at full time resolution in MB (default = 16)')
+    parser.add_argument('-max_trials', '--max_trials', type=int, default=1000, help='Maximum DM trials per call (default = 1000)')
+    parser.add_argument('-time', '--time', type=str, default='1-00:00:00', help='SLURM wall-time per job (default = 1-00:00:00)')
+    parser.add_argument('-submit', '--submit', action='store_true', help='Submit the generated jobs with sbatch')
+
+    return parser.parse_args()
+
+def read_plan(plan_file):
+    '''
+    Reads a DM plan .json file and returns the observing setup and the list of segments
+    '''
+    with open(plan_file) as f:
+        plan = json.load(f)
+    return plan['config'], plan['segments']
+
+def chunk_plan(segments, mem_trials, max_trials, default_nsub=64):
+    '''
+    Splits every plan segment into chunks of DM trials with equal work.
+
+    A trial at downsampling factor ds needs ds times less memory and time, so a chunk may hold
+    up to mem_trials * ds trials (capped at max_trials per call) for the same footprint.
+    Chunks within a segment are sized evenly rather than leaving a short remainder.
+    Every chunk gets an index, unique within the plan, for its output file names.
+    '''
+    chunks = []
+    for seg in segments:
+        ntrials = int(seg['ntrials'])
+        if ntrials <= 0:
+            continue
+        downsamp = int(seg.get('downsamp', 1))
+        per_chunk = max(1, min(max_trials, mem_trials * downsamp))
+        nchunks = -(-ntrials // per_chunk)
+        base, extra = divmod(ntrials, nchunks)
+
+        first = 0
+        for i in range(nchunks):
+            numdms = base + (1 if i < extra else 0)
+            chunks.append({
+                'index': len(chunks),
+                'lodm': seg['start'] + first * seg['ddm'],
+                'dmstep': seg['ddm'],
+                'numdms': numdms,
+                'downsamp': downsamp,
+                'nsub': int(seg.get('nsub', default_nsub)),
+                'work': numdms / downsamp,
+            })
+            first += numdms
+    return chunks
+
+def sf_nchan(sf_file):
+    '''
+    Returns the number of frequency channels of a PSRFITS .sf file, from its SUBINT header
+    '''
+    from astropy.io import fits
+    return int(fits.getheader(sf_file, 'SUBINT')['NCHAN'])
+
+def balance_jobs(chunks, cores):
+    '''
+    Packs chunks onto nodes with the longest-processing-time-first heuristic.
+    Every node runs at most `cores` chunks concurrently, and the number of nodes is the
+    minimum needed, so the heaviest node sets the wall-clock time of the whole batch.
+    '''
+    njobs = max(1, -(-len(chunks) // cores))
+    jobs = [[] for _ in range(njobs)]
+    loads = [0.0] * njobs
+
+    for chunk in sorted(chunks, key=lambda c: c['work'], reverse=True):
+        open_jobs = [j for j in range(njobs) if len(jobs[j]) < cores]
+        j = min(open_jobs, key=lambda j: loads[j])
+        jobs[j].append(chunk)
+        loads[j] += chunk['work']
+    return jobs, loads
+
+def chunk_command(tool, chunk, sf_file, mask, ignorechan, output_prefix):
+    '''
+    Builds the dedispersion command line for a single chunk
+    '''
+    if tool == 'prepsubband':
+        command = f"prepsubband -nsub {chunk['nsub']} -lodm {chunk['lodm']:.6f} -dmstep {chunk['dmstep']:.6f} -numdms {chunk['numdms']} -downsamp {chunk['downsamp']}"
+        if ignorechan:
+            command += f" -ignorechan {ignorechan}"
+        return command + f" -mask {mask} -o {output_prefix} {sf_file}"
+
+    return (f"transientx_fil -v --psrfits --thre 7 --dms {chunk['lodm']:.6f} --ddm {chunk['dmstep']:.6f} --overlap 0.1 --ndm {chunk['numdms']} "
+            f"--td {chunk['downsamp']} -l 30 -o {output_prefix} --minw 3e-5 --maxw 0.3 -z {mask} zdot -f {sf_file}")
+
+def main():
+    args = fetch_args()
+
+    config, segments = read_plan(args.plan)
+    # Memory per node caps the full-resolution trials a single core may hold
+    mem_trials = max(1, int(args.mem * 1024 / args.cores / args.mem_trial))
+    chunks = chunk_plan(segments, mem_trials, args.max_trials, default_nsub=config.get('nsub', 64))
+
+    print('Plan: %s - %s pc cm^-3, %s segments, %s trials' % (config.get('dmin'), config.get('dmax'), len(segments), sum(c['numdms'] for c in chunks)))
+    print('Trials per core (full resolution): %s, chunks per observation: %s' % (min(mem_trials, args.max_trials), len(chunks)))
+
+    sf_files = sorted(glob.glob(os.path.join(args.input, '**', '*.sf'), recursive=True))
+    if args.band:
+        sf_files = [sf for sf in sf_files if args.band in os.path.basename(sf)]
+    print('Number of .sf files found: %s' % len(sf_files))
+
+    jobs, loads = balance_jobs(chunks, args.cores)
+    print('Jobs per observation: %s, work per job: min %.1f / max %.1f' % (len(jobs), min(loads), max(loads)))
+
+    scripts = []
+    for sf_file in sf_files:
+        basename = os.path.basename(sf_file)[:-len('.sf')]
+        basepath = os.path.dirname(sf_file)
+        mask = f"{basepath}/masks/{basename}_rfifind.mask"
+        if not os.path.exists(mask):
+            print('Mask file not found for %s' % basename)
+            continue
+        if args.tool == 'prepsubband':
+            # prepsubband needs nsub to divide the channels of this file
+            nchan = sf_nchan(sf_file)
+            bad_nsub = sorted({chunk['nsub'] for chunk in chunks if nchan % chunk['nsub']})
+            if bad_nsub:
+                print('nsub %s does not divide the %s channels of %s, skipping it' % (', '.join(map(str, bad_nsub)), nchan, basename))
+                continue
+
+        band = next((b for b in IGNORE_CHANS if b in basename), None)
+        ignorechan = IGNORE_CHANS.get(band)
+        outdir = f"{basepath}/{'prepdata' if args.tool == 'prepsubband' else 'transientx'}"
+        datadir = f"{outdir}/{band}" if band else outdir
+        os.makedirs(datadir, exist_ok=True)
+        os.makedirs(f"{outdir}/logs", exist_ok=True)
+        os.makedirs(f"{outdir}/sbatch_scripts", exist_ok=True)
+
+        for j, job in enumerate(jobs):
+            sbatch_script = f"{outdir}/sbatch_scripts/{basename}_{args.tool}_{j:03d}.sbatch"
+            mem_gb = max(1, int(round(args.mem * len(job) / args.cores)))
+            with open(sbatch_script, 'w') as f:
+                f.write("#!/bin/bash\n")
+                f.write(f"#SBATCH --job-name={args.tool}\n")
+                f.write(f"#SBATCH --output={outdir}/logs/{basename}_{args.tool}_{j:03d}.out\n")
+                f.write(f"#SBATCH --error={outdir}/logs/{basename}_{args.tool}_{j:03d}.err\n")
+                f.write(f"#SBATCH --time={args.time}\n")
+                f.write(f"#SBATCH --mem={mem_gb}G\n")
+                f.write("#SBATCH --ntasks=1\n")
+                f.write(f"#SBATCH --cpus-per-task={len(job)}\n")
+                f.write("source /fred/oz002/psrhome/scripts/psrhome.sh\n")
+                f.write(f"cd {basepath}\n")
+                for chunk in job:
+                    # chunks of the same file run concurrently, so write straight into the slice directory under their own names
+                    output_prefix = f"{datadir}/{basename}_prepsub_{chunk['index']:03d}" if args.tool == 'prepsubband' else f"{datadir}/{basename}_DM{chunk['lodm']:.2f}"
+                    f.write(chunk_command(args.tool, chunk, sf_file, mask, ignorechan, output_prefix) + " &\n")
+                f.write("wait\n")
+            scripts.append(sbatch_script)
+
+    print('Wrote %s sbatch scripts' % len(scripts))
+
+    if args.submit:
+        import subprocess
+        for sbatch_script in scripts:
+            subprocess.run(['sbatch', sbatch_script])
+
+if __name__ == '__main__':
+    main()
@@ -2,42 +2,163 @@
 Code Purpose: Single Pulse Analysis for PRESTO on UWL Data 
 Author: Owen A. Johnson 
 Date: 2025-02-11
+
+Example Usage: python singlepulse_analysis.py -i <obs>/prepdata/<sub-band> -t 8
+               python singlepulse_analysis.py -survey /fred/oz203/data/PX094/J0523-2529/frequency_split -t 8 -np
 '''
 import argparse
+import contextlib
 import glob as glob
+import hashlib
+import json
 import os as os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np 
-import scipy.stats as stats
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import scienceplots 
-plt.style.use('science')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Useful-Scripts'))
+from sp_clustering import fof_cluster, print_events, write_events
+from sp_density import plot_density, use_density
+from instrumentation import start_run, stage
+from plotting import get_pyplot
+
+# One row per PRESTO single pulse event, with the narrowest types that hold the values
+SP_DTYPE = np.dtype([('dm', np.float32), ('sigma', np.float32), ('time', np.float64), ('sample', np.int64), ('downfact', np.uint16)])
+SP_CACHE = 'singlepulse_cache'
+
+# S/N bins of the overmasking checks, just above the single_pulse_search.py threshold
+SNR_EDGES = np.array([6.0, 6.5, 7.0, 7.5, 8.0])
+SP_SUMMARY = 'singlepulse_summary.json'
+SURVEY_TOP = 3  # events listed per sub-band in the survey table
+WINDOW_DTYPE = np.dtype([('t_start', np.float64), ('t_end', np.float64), ('dm_lo', np.float32), ('dm_hi', np.float32),
+                         ('observed', np.int64), ('expected', np.float64), ('gauss_expected', np.float64),
+                         ('p_excess', np.float64), ('p_deficit', np.float64), ('flag', 'U6')])
 
 def fetch_args(): 
     '''
     Fetches the arguments from the command line 
     '''
     parser = argparse.ArgumentParser(description='Single Pulse Analysis for PRESTO on UWL Data')
-    parser.add_argument('-i', '--input', type=str, help='Input directory', required=True)
+    parser.add_argument('-i', '--input', type=str, help='Input directory', required=False)
+    parser.add_argument('-survey', '--survey', type=str, help='frequency_split directory: analyse every <obs>/prepdata/<sub-band> below it and write one summary table', required=False)
+    parser.add_argument('-o', '--output', type=str, help='Survey summary table (default = <survey>/singlepulse_survey_summary.csv)', required=False)
+    parser.add_argument('-force', '--force', help='Re-analyse survey directories even if their outputs are up to date', required=False, action='store_true')
     parser.add_argument('-t', '--threshold', type=float, help='Threshold for single pulse detection (default = 10)', required=False)
     parser.add_argument('-d', '--dm_trials', type=float, help='Number of DM trials (default = 1000)', required=False)
+    parser.add_argument('-np', '--noplot', help='Skip the diagnostic plot (default = False)', required=False, action='store_true')
+    parser.add_argument('-win', '--window', type=float, default=10.0, help='Time window of the masking diagnostic in seconds, matching rfifind -time (default = 10)', required=False)
+    parser.add_argument('-ndm', '--dm_bands', type=int, default=4, help='Number of DM bands of the masking diagnostic (default = 4)', required=False)
+    parser.add_argument('-pfa', '--pfa', type=float, default=1e-3, help='False alarm probability across all windows for flagging (default = 1e-3)', required=False)
+    parser.add_argument('-nocluster', '--nocluster', help='Skip the friends-of-friends grouping of detections into events', required=False, action='store_true')
+    parser.add_argument('-link_t', '--link_t', type=float, default=0.02, help='Time linking length of the event clustering in seconds (default = 0.02)', required=False)
+    parser.add_argument('-link_dm', '--link_dm', type=float, default=2.0, help='DM linking length of the event clustering (default = 2)', required=False)
+    parser.add_argument('-link_w', '--link_w', type=float, default=2.0, help='Width linking factor of the event clustering (default = 2)', required=False)
+    parser.add_argument('-top', '--top', type=int, default=20, help='Number of ranked events to print and to mark on density plots (default = 20)', required=False)
+    parser.add_argument('-render', '--render', type=str, choices=['auto', 'scatter', 'density'], default='auto', help='Draw every detection (scatter) or a max-S/N image (density); auto picks density for large runs (default = auto)', required=False)
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='Number of reader processes (default = all cores)', required=False)
+    parser.add_argument('-cache', '--cache', help='Keep a binary copy of the events next to the input so re-analysis skips the text parsing', required=False, action='store_true')
+    parser.add_argument('-profile', '--profile', help='Write a JSON timing/memory report and a cProfile dump for this run', required=False, action='store_true')
     
-    return parser.parse_args()
+    arguments = parser.parse_args()
+    if not arguments.input and not arguments.survey:
+        parser.error('one of -i/--input or -survey/--survey is required')
+    return arguments
 
 def read_singlepulse(sp_file):
     '''
-    Reads in a singlepulse file and returns the data as a numpy array
+    Reads in a singlepulse file and returns the events as a SP_DTYPE structured array
+    '''
+    import pandas as pd
+    try:
+        table = pd.read_csv(sp_file, sep=r'\s+', comment='#', header=None, names=SP_DTYPE.names, dtype=dict(SP_DTYPE.descr), engine='c')
+    except pd.errors.EmptyDataError:  # header only, no pulses above the search threshold
+        return np.empty(0, dtype=SP_DTYPE)
+    events = np.empty(len(table), dtype=SP_DTYPE)
+    for name in SP_DTYPE.names:
+        events[name] = table[name].to_numpy()
+    return events
+
+def _cache_key(sp_files):
+    '''
+    Fingerprint of the input files (name, size, mtime) used to validate the binary cache
+    '''
+    digest = hashlib.sha1()
+    for sp_file in sorted(sp_files):
+        st = os.stat(sp_file)
+        digest.update(f'{os.path.basename(sp_file)} {st.st_size} {st.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+def count_singlepulse(sp_file):
+    '''
+    Number of events in a singlepulse file from its line count, without parsing (header lines start with #)
     '''
-    dm, sig, time, sample, dfact = np.loadtxt(sp_file, skiprows=1, unpack=True)
-    return dm, sig, time, sample, dfact
+    with open(sp_file, 'rb') as f:
+        data = f.read()
+    if not data:
+        return 0
+    lines = data.count(b'\n') + (not data.endswith(b'\n'))
+    return lines - data.startswith(b'#') - data.count(b'\n#')
+
+def load_singlepulse(sp_files, workers=None, cache_dir=None):
+    '''
+    Reads all singlepulse files in a process pool into one SP_DTYPE structured array.
+    The output is allocated once from the row counts of the files and every parsed file is copied
+    into place as it arrives, so the per-file arrays are never all held at once.
+
+    With cache_dir, the output is allocated directly as a .npy there (moved into place once complete,
+    with a .json fingerprint of the inputs); later calls with unchanged inputs memory-map that file
+    instead of parsing any text.
+    '''
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, SP_CACHE + '.npy')
+        meta_file = os.path.join(cache_dir, SP_CACHE + '.json')
+        key = _cache_key(sp_files)
+        if os.path.exists(cache_file) and os.path.exists(meta_file):
+            with open(meta_file) as f:
+                if json.load(f).get('key') == key:
+                    return np.load(cache_file, mmap_mode='r')
+
+    with contextlib.ExitStack() as stack:
+        if workers == 1 or len(sp_files) <= 1:
+            pool_map = map
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            chunksize = max(1, len(sp_files) // (4 * (workers or os.cpu_count() or 1)))
+            pool_map = lambda func, files: pool.map(func, files, chunksize=chunksize)
+
+        counts = list(pool_map(count_singlepulse, sp_files))
+        if cache_dir:
+            tmp = f'{cache_file}.{os.getpid()}.tmp.npy'
+            events = np.lib.format.open_memmap(tmp, mode='w+', dtype=SP_DTYPE, shape=(sum(counts),))
+        else:
+            events = np.empty(sum(counts), dtype=SP_DTYPE)
+
+        offset = 0
+        for sp_file, count, part in zip(sp_files, counts, pool_map(read_singlepulse, sp_files)):
+            if len(part) != count:
+                raise ValueError(f'{sp_file}: counted {count} events but parsed {len(part)}')
+            events[offset:offset + count] = part
+            offset += count
+
+    if cache_dir:
+        events.flush()
+        del events
+        os.replace(tmp, cache_file)
+        with open(f'{meta_file}.{os.getpid()}.tmp', 'w') as f:
+            json.dump({'key': key, 'nfiles': len(sp_files), 'nevents': offset}, f)
+        os.replace(f'{meta_file}.{os.getpid()}.tmp', meta_file)
+        return np.load(cache_file, mmap_mode='r')
+    return events
 
 def expected_pulses(n_trials, snr_min, snr_max):
     """
     Computes the expected number of pulses between SNR_min and SNR_max
     assuming pure Gaussian noise.
     """
-    prob_snr_min = 1 - stats.norm.cdf(snr_min)  # P(X ≥ snr_min)
-    prob_snr_max = 1 - stats.norm.cdf(snr_max)  # P(X ≥ snr_max)
+    from scipy.special import ndtr
+    
+    prob_snr_min = 1 - ndtr(snr_min)  # P(X ≥ snr_min)
+    prob_snr_max = 1 - ndtr(snr_max)  # P(X ≥ snr_max)
     
     expected_above_snr_min = prob_snr_min * n_trials
     expected_above_snr_max = prob_snr_max * n_trials
@@ -69,6 +190,81 @@ def check_overmasking(t_obs, tsamp, dm, sig, time, dm_trials=1000, width_trials=
 
     return
 
+def masking_windows(events, t_obs, tsamp, window=10.0, n_dm_bands=4, dm_trials=1000, width_trials=8, snr_edges=SNR_EDGES, pfa=1e-3):
+    """
+    Time-resolved overmasking check: counts pulses per time window, DM band and S/N bin in one
+    np.histogramdd pass and compares each window with what the rest of the observation predicts.
+
+    The expected count of a cell is the observation-average rate of its DM band and S/N bin scaled to
+    the window length, so steady non-Gaussian noise does not flag every window; the pure Gaussian
+    expectation is reported alongside. Poisson tail probabilities of the summed counts are compared
+    with pfa divided by the number of windows: a deficit flags the window as 'over' masked (e.g. a
+    zapped interval), an excess as 'under' masked (RFI that got through).
+
+    Returns a WINDOW_DTYPE array with one row per (window, DM band).
+    """
+    from scipy.special import ndtr, pdtr, pdtrc
+
+    dm_lo, dm_hi = float(events['dm'].min()), float(events['dm'].max())
+    t_edges = np.append(np.arange(0, t_obs, window), t_obs)
+    dm_edges = np.linspace(dm_lo, max(dm_hi, dm_lo + 1e-3), n_dm_bands + 1)
+    counts, _ = np.histogramdd(np.column_stack([events['time'], events['dm'], events['sigma']]), bins=[t_edges, dm_edges, snr_edges])
+
+    # exposure of each window (the last one may be short) against the whole observation
+    frac_time = np.diff(t_edges) / t_obs
+    expected = (counts.sum(axis=0)[None, :, :] * frac_time[:, None, None]).sum(axis=2)
+    observed = counts.sum(axis=2).astype(np.int64)
+
+    p_tail = ndtr(-snr_edges[:-1]) - ndtr(-snr_edges[1:])
+    trials = (np.diff(t_edges) / tsamp)[:, None, None] * (dm_trials / n_dm_bands) * width_trials
+    gauss_expected = np.broadcast_to((trials * p_tail[None, None, :]).sum(axis=2), observed.shape)
+
+    with np.errstate(invalid='ignore'):
+        p_excess = np.where(observed > 0, pdtrc(observed - 1, expected), 1.0)
+        p_deficit = pdtr(observed, expected)
+    threshold = pfa / observed.size
+
+    table = np.empty(observed.size, dtype=WINDOW_DTYPE)
+    table['t_start'] = np.repeat(t_edges[:-1], n_dm_bands)
+    table['t_end'] = np.repeat(t_edges[1:], n_dm_bands)
+    table['dm_lo'] = np.tile(dm_edges[:-1], len(frac_time))
+    table['dm_hi'] = np.tile(dm_edges[1:], len(frac_time))
+    table['observed'] = observed.ravel()
+    table['expected'] = expected.ravel()
+    table['gauss_expected'] = gauss_expected.ravel()
+    table['p_excess'] = p_excess.ravel()
+    table['p_deficit'] = p_deficit.ravel()
+    table['flag'] = np.where(table['p_deficit'] < threshold, 'over', np.where(table['p_excess'] < threshold, 'under', ''))
+    return table
+
+def zapints(table, rfi_time=10.0):
+    """
+    Converts the under-masked windows into an rfifind -zapints string of interval ranges
+    """
+    under = table[table['flag'] == 'under']
+    ints = np.unique(np.concatenate([np.arange(int(t0 // rfi_time), int(np.ceil(t1 / rfi_time))) for t0, t1 in zip(under['t_start'], under['t_end'])] or [np.empty(0, int)]))
+    if len(ints) == 0:
+        return ''
+    breaks = np.flatnonzero(np.diff(ints) > 1)
+    starts, stops = ints[np.r_[0, breaks + 1]], ints[np.r_[breaks, len(ints) - 1]]
+    return ','.join(str(a) if a == b else f'{a}:{b}' for a, b in zip(starts, stops))
+
+def report_masking_windows(table, output_file, rfi_time=10.0):
+    """
+    Prints the flagged windows and writes the full table to a .csv for rfifind tuning
+    """
+    np.savetxt(output_file, table, delimiter=',', header=','.join(WINDOW_DTYPE.names), comments='',
+               fmt=['%.3f', '%.3f', '%.2f', '%.2f', '%d', '%.2f', '%.2f', '%.3e', '%.3e', '%s'])
+    for flag, meaning in [('over', 'fewer pulses than expected, masking may be too aggressive'), ('under', 'more pulses than expected, RFI may have leaked through')]:
+        rows = table[table['flag'] == flag]
+        print(f"{'⚠️ ' if len(rows) else ''}{len(rows)} of {len(table)} window/DM cells {flag}-masked ({meaning})")
+        for row in rows[:10]:
+            print(f"    t = {row['t_start']:8.1f} - {row['t_end']:8.1f} s, DM {row['dm_lo']:7.1f} - {row['dm_hi']:7.1f}: observed {row['observed']}, expected {row['expected']:.1f}")
+    intervals = zapints(table, rfi_time)
+    if intervals:
+        print(f'Suggested rfifind option (-time {rfi_time:g}): -zapints {intervals}')
+    print(f'Masking diagnostic written to {output_file}')
+
 def marker_scaling(sig, threshold=10.0):
     """
     Scales the marker size based on S/N. Mimicing what is done by PRESTO in the same plot. 
@@ -83,36 +279,45 @@ def marker_scaling(sig, threshold=10.0):
 
     
     
-def main():
-    arguments = fetch_args()
-     
-    sp_files = glob.glob(os.path.join(arguments.input, '*.singlepulse'))
+def find_header(input_dir):
+    '''
+    Returns the .hdrinfo of a sub-band directory, which sits one directory up, or None
+    '''
+    subband_name = os.path.basename(os.path.normpath(input_dir))
+    headers = glob.glob(os.path.dirname(os.path.normpath(input_dir)) + '/*%s.hdrinfo' % subband_name)
+    return headers[0] if headers else None
+
+def analyse_subband(input_dir, arguments, workers=None, cwd_plot=True):
+    '''
+    Runs the full analysis of one sub-band directory and returns a one-row summary of it.
+    The plot is saved in the directory and, with cwd_plot, also as singlepulse_analysis.png in the working directory.
+    '''
+    sp_files = sorted(glob.glob(os.path.join(input_dir, '*.singlepulse')))
+    summary = {'directory': input_dir, 'nfiles': len(sp_files), 'npulses': 0, 'ndetections': 0, 'nevents': 0,
+               'mean_snr': np.nan, 'n_over': 0, 'n_under': 0, 'zapints': '', 'top_events': ''}
     
     # grab the header info from up a directory
-    subband_name = os.path.basename(os.path.normpath(arguments.input))
-    header = glob.glob(os.path.dirname(os.path.join(arguments.input)) + '/*%s.hdrinfo' % subband_name)[0]
+    header = find_header(input_dir)
+    if header is None:
+        print('⚠️ No .hdrinfo found for {}'.format(input_dir))
+        return dict(summary, status='no hdrinfo')
     date, tobs, nchan, tsamp = np.loadtxt(header, usecols=(0, 1, 2, 3), dtype=str, skiprows=2)
     filename = np.loadtxt(header, usecols=(0), dtype=str)[0]
+    summary['filename'] = str(filename)
     
     print('\n-------------------')
     print('Filename: {}'.format(filename))
     print('Found {} singlepulse files'.format(len(sp_files)))
     
-    # Concatenate the singlepulse files into a single array
-    dm, sig, time, sample, dfact = [], [], [], [], []
-    
-    for sp_file in sp_files:
-        dm_, sig_, time_, sample_, dfact_ = read_singlepulse(sp_file)
-        dm = np.concatenate((dm, dm_))
-        sig = np.concatenate((sig, sig_))
-        time = np.concatenate((time, time_))
-        sample = np.concatenate((sample, sample_))
-        dfact = np.concatenate((dfact, dfact_))
+    # Read every singlepulse file into a single structured array
+    with stage('read'):
+        events = load_singlepulse(sp_files, workers, cache_dir=input_dir if arguments.cache else None)
+    dm, sig, time, sample, dfact = (events[name] for name in SP_DTYPE.names)
         
     # if no single pulses are found, exit
     if len(dm) == 0:
         print('⚠️ No single pulses found in {} for current setup'.format(filename))
-        return
+        return dict(summary, status='no pulses')
     
     print('\n-------------------')
     print('Read in {} single pulses'.format(len(dm)))
@@ -120,20 +325,21 @@ def main():
     print('\n-------------------\n')
     
     # Check for overmasking
-    check_overmasking(float(tobs), float(tsamp), dm, sig, time)
+    with stage('masking'):
+        check_overmasking(float(tobs), float(tsamp), dm, sig, time)
+        windows = masking_windows(events, float(tobs), float(tsamp), arguments.window, arguments.dm_bands, arguments.dm_trials or 1000, pfa=arguments.pfa)
+        report_masking_windows(windows, os.path.join(input_dir, f'{filename}_masking_windows.csv'), rfi_time=arguments.window)
+    summary.update(npulses=len(dm), n_over=int(np.sum(windows['flag'] == 'over')), n_under=int(np.sum(windows['flag'] == 'under')),
+                   zapints=zapints(windows, arguments.window))
     
     # Mask based on S/N threshold
     if arguments.threshold:
-        mask = sig >= arguments.threshold
-        dm = dm[mask]
-        sig = sig[mask]
-        time = time[mask]
-        sample = sample[mask]
-        dfact = dfact[mask]
+        events = events[sig >= arguments.threshold]
+        dm, sig, time, sample, dfact = (events[name] for name in SP_DTYPE.names)
         
         if len(dm) == 0:
             print('⚠️ No single pulses found in {} for current threshold'.format(filename))
-            return
+            return dict(summary, status='none above threshold')
             
         print('\n-------------------')
         print('Masked based on S/N threshold of {}'.format(arguments.threshold))
@@ -141,53 +347,170 @@ def main():
         print('Average S/N: {}'.format(np.mean(sig)))
         print('-------------------\n')
     
-    # 3 square top plots, 1 bottom plot
-    fig = plt.figure(figsize=(12, 8))
-    gs = gridspec.GridSpec(2, 3, height_ratios=[1, 2])
-    plt.suptitle('%s | S/N$_{thres}$ = %s | $N_{pulse} =$ %s' % (filename, arguments.threshold, len(dm)), fontsize=16)
-
-    # Top row (3 plots)
-    ax1 = plt.subplot(gs[0, 0])
-    ax2 = plt.subplot(gs[0, 1])
-    ax3 = plt.subplot(gs[0, 2])
-
-    # Bottom row (1 plot spanning 3 columns)
-    ax4 = plt.subplot(gs[1, :])
-
-    # Histogram of S/N
-    ax1.hist(sig, bins=100, color='black', histtype='step')
-    ax1.set_xlabel('S/N')
-    ax1.set_ylabel('Pulses')
-    ax1.set_xlim(sig.min(), sig.max())
-
-    # Histogram of DM
-    ax2.hist(dm, bins=60, color='black', histtype='step')
-    ax2.set_xlabel('DM (pc cm$^{-3}$)')
-    ax2.set_ylabel('Pulses')
-    ax2.set_xlim(0, dm.max())
-
-    # DM vs. S/N scatter plot
-    ax3.scatter(dm, sig, color='black', s=1)
-    ax3.axhline(sig.mean(), color='red', linestyle='--')
-    ax3.set_xlabel('DM (pc cm$^{-3}$)')
-    ax3.set_ylabel('S/N')
-    ax3.set_xlim(0, dm.max())
-    ax3.set_ylim(sig.min(), sig.max())
-
-    # Time vs. DM scatter plot spanning full bottom row
-    marker_sizes = marker_scaling(sig, threshold=arguments.threshold)
-    ax4.scatter(time, dm, s=marker_sizes, edgecolor='black', facecolor='none', alpha=0.3)
-    ax4.set_xlabel('Time (s)')
-    ax4.set_ylabel('DM (pc cm$^{-3}$)')
-    ax4.set_xlim(0, float(tobs))
-    ax4.set_ylim(0, dm.max())
-
-    # Adjust layout and save the figure
-    plt.tight_layout()
-    plt.savefig('singlepulse_analysis.png')
-    output_file = os.path.join(arguments.input, f'{filename}_singlepulse_t{arguments.threshold}.png')
-    plt.savefig(output_file)
+    # Group detections of the same pulse across DM and width trials into events
+    sp_events = None
+    if not arguments.nocluster:
+        with stage('cluster'):
+            _, sp_events = fof_cluster(time, dm, dfact * float(tsamp), sig, arguments.link_t, arguments.link_dm, arguments.link_w)
+            print('Clustered {} detections into {} events'.format(len(dm), len(sp_events)))
+            print_events(sp_events, arguments.top)
+            write_events(sp_events, os.path.join(input_dir, f'{filename}_singlepulse_events_t{arguments.threshold}.csv'))
+        print('-------------------\n')
+        summary['nevents'] = len(sp_events)
+        summary['top_events'] = '; '.join(f"t={e['time']:.3f}s DM={e['dm']:.2f} S/N={e['snr']:.1f} n={e['nmembers']}" for e in sp_events[:SURVEY_TOP])
+    summary.update(ndetections=len(dm), mean_snr=float(np.mean(sig)), status='ok')
+    
+    if arguments.noplot:
+        return summary
     
+    with stage('plot'):
+        plt = get_pyplot('science')
+        import matplotlib.gridspec as gridspec
+    
+        # 3 square top plots, 1 bottom plot
+        fig = plt.figure(figsize=(12, 8))
+        gs = gridspec.GridSpec(2, 3, height_ratios=[1, 2])
+        plt.suptitle('%s | S/N$_{thres}$ = %s | $N_{pulse} =$ %s' % (filename, arguments.threshold, len(dm)), fontsize=16)
+
+        # Top row (3 plots)
+        ax1 = plt.subplot(gs[0, 0])
+        ax2 = plt.subplot(gs[0, 1])
+        ax3 = plt.subplot(gs[0, 2])
+
+        # Bottom row (1 plot spanning 3 columns)
+        ax4 = plt.subplot(gs[1, :])
+
+        # Histogram of S/N
+        ax1.hist(sig, bins=100, color='black', histtype='step')
+        ax1.set_xlabel('S/N')
+        ax1.set_ylabel('Pulses')
+        ax1.set_xlim(sig.min(), sig.max())
+
+        # Histogram of DM
+        ax2.hist(dm, bins=60, color='black', histtype='step')
+        ax2.set_xlabel('DM (pc cm$^{-3}$)')
+        ax2.set_ylabel('Pulses')
+        ax2.set_xlim(0, dm.max())
+
+        density = use_density(arguments.render, len(dm))
+
+        # DM vs. S/N scatter plot
+        if density:
+            plot_density(ax3, dm, sig, sig, (0, dm.max()), (sig.min(), sig.max()), bins=(200, 100), cmap='Greys')
+        else:
+            ax3.scatter(dm, sig, color='black', s=1)
+        ax3.axhline(sig.mean(), color='red', linestyle='--')
+        ax3.set_xlabel('DM (pc cm$^{-3}$)')
+        ax3.set_ylabel('S/N')
+        ax3.set_xlim(0, dm.max())
+        ax3.set_ylim(sig.min(), sig.max())
+
+        # Time vs. DM spanning full bottom row; large runs are drawn as a max-S/N image with only the brightest events marked
+        if density:
+            im = plot_density(ax4, time, dm, sig, (0, float(tobs)), (0, dm.max()))
+            fig.colorbar(im, ax=ax4, label='Max S/N', pad=0.01)
+            if sp_events is not None:
+                top_time, top_dm, top_sig = sp_events['time'][:arguments.top], sp_events['dm'][:arguments.top], sp_events['snr'][:arguments.top]
+            else:
+                top = np.argsort(sig)[::-1][:arguments.top]
+                top_time, top_dm, top_sig = time[top], dm[top], sig[top]
+            ax4.scatter(top_time, top_dm, s=marker_scaling(top_sig, threshold=sig.min()), edgecolor='red', facecolor='none')
+        else:
+            marker_sizes = marker_scaling(sig, threshold=arguments.threshold)
+            ax4.scatter(time, dm, s=marker_sizes, edgecolor='black', facecolor='none', alpha=0.3)
+        ax4.set_xlabel('Time (s)')
+        ax4.set_ylabel('DM (pc cm$^{-3}$)')
+        ax4.set_xlim(0, float(tobs))
+        ax4.set_ylim(0, dm.max())
+
+        # Adjust layout and save the figure
+        plt.tight_layout()
+        if cwd_plot:
+            plt.savefig('singlepulse_analysis.png')
+        output_file = os.path.join(input_dir, f'{filename}_singlepulse_t{arguments.threshold}.png')
+        plt.savefig(output_file)
+        plt.close(fig)
+    return summary
+
+def _options(arguments):
+    '''
+    The arguments that change the outputs of a sub-band, stored with its summary to decide if it is up to date
+    '''
+    keys = ['threshold', 'dm_trials', 'noplot', 'window', 'dm_bands', 'pfa', 'nocluster', 'link_t', 'link_dm', 'link_w', 'top', 'render']
+    return {key: getattr(arguments, key) for key in keys}
+
+def _fingerprint(input_dir):
+    sp_files = sorted(glob.glob(os.path.join(input_dir, '*.singlepulse')))
+    header = find_header(input_dir)
+    return _cache_key(sp_files + ([header] if header else []))
+
+def cached_summary(input_dir, arguments):
+    '''
+    Returns the stored summary of a sub-band directory if its inputs and options are unchanged, else None
+    '''
+    summary_file = os.path.join(input_dir, SP_SUMMARY)
+    if not os.path.exists(summary_file):
+        return None
+    with open(summary_file) as f:
+        stored = json.load(f)
+    if stored.get('key') != _fingerprint(input_dir) or stored.get('options') != _options(arguments):
+        return None
+    return stored['summary']
+
+def _survey_task(task):
+    '''
+    Analyses one sub-band in a worker process, logging to the directory and storing the summary next to it
+    '''
+    input_dir, arguments = task
+    key = _fingerprint(input_dir)
+    with open(os.path.join(input_dir, 'singlepulse_analysis.log'), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            # survey workers share the working directory, so only the per-directory plot is written
+            summary = analyse_subband(input_dir, arguments, workers=1, cwd_plot=False)
+        except Exception as err:
+            print('⚠️ Analysis failed: {}'.format(err))
+            return {'directory': input_dir, 'status': 'error: {}'.format(err)}
+    with open(os.path.join(input_dir, SP_SUMMARY), 'w') as f:
+        json.dump({'key': key, 'options': _options(arguments), 'summary': summary}, f, indent=2)
+    return summary
+
+def survey(arguments):
+    '''
+    Analyses every <obs>/prepdata/<sub-band> below the frequency_split directory in a process pool,
+    skipping sub-bands whose stored summary is up to date, and writes one table for the survey
+    '''
+    import pandas as pd
+
+    dirs = sorted(d for d in glob.glob(os.path.join(arguments.survey, '*', 'prepdata', '*GHz')) if os.path.isdir(d))
+    summaries = {d: None if arguments.force else cached_summary(d, arguments) for d in dirs}
+    todo = [d for d in dirs if summaries[d] is None]
+    print('Found {} sub-band directories, {} up to date, {} to analyse'.format(len(dirs), len(dirs) - len(todo), len(todo)))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=arguments.workers) as pool:
+            for input_dir, summary in zip(todo, pool.map(_survey_task, [(d, arguments) for d in todo])):
+                summaries[input_dir] = summary
+                print('{}: {}'.format(input_dir, summary['status']))
+
+    table = pd.DataFrame([summaries[d] for d in dirs])
+    if len(table):
+        parts = table['directory'].str.split(os.sep)
+        table.insert(0, 'subband', parts.str[-1])
+        table.insert(0, 'observation', parts.str[-3])
+        table = table[['observation', 'subband', 'status'] + [c for c in table.columns if c not in ('observation', 'subband', 'status')]]
+    output = arguments.output or os.path.join(arguments.survey, 'singlepulse_survey_summary.csv')
+    table.to_csv(output, index=False)
+    print('Survey summary of {} sub-bands written to {}'.format(len(table), output))
+
+def main():
+    arguments = fetch_args()
+    start_run('singlepulse_analysis.py', profile=arguments.profile)
+    if arguments.survey:
+        with stage('survey'):
+            survey(arguments)
+    else:
+        analyse_subband(arguments.input, arguments, arguments.workers)
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
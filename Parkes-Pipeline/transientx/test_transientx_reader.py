@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Tests of the .cands reader in transientx-analysis.py (run with pytest)
+Author: Owen A. Johnson
+Date: 2025-10-20
+'''
+import importlib.util
+import os
+
+import numpy as np
+
+_spec = importlib.util.spec_from_file_location('transientx_analysis', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transientx-analysis.py'))
+transientx_analysis = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(transientx_analysis)
+
+HEADER = '#id\tbeam\tmjd\tdm\twidth\tsnr\tmaxsnr\tfreq\tpng\tnbox\tfile\n'
+ROWS = ['1\t0\t60000.123456789\t56.7\t0.00128\t9.5\t10.2\t1400\tcand_001.png\t3\tobs_a.fil\n',
+        '2\t0\t60000.223456789\t301.2\t0.01024\t12.25\t12.9\t1400\tcand_002.png\t5\tobs_b.fil\n']
+
+def test_header_is_skipped(tmp_path):
+    cands_file = tmp_path / 'obs.cands'
+    cands_file.write_text(HEADER + ''.join(ROWS))
+
+    cands = transientx_analysis.read_transientx(str(cands_file))
+    assert len(cands) == 2
+    np.testing.assert_allclose(cands['mjd'], [60000.123456789, 60000.223456789])
+    np.testing.assert_allclose(cands['dm'], [56.7, 301.2], rtol=1e-6)
+    np.testing.assert_allclose(cands['snr'], [9.5, 12.25])
+    assert list(cands['png']) == ['cand_001.png', 'cand_002.png']
+    assert list(cands['ifile']) == ['obs_a.fil', 'obs_b.fil']
+
+def test_header_only(tmp_path):
+    cands_file = tmp_path / 'empty.cands'
+    cands_file.write_text(HEADER)
+
+    assert len(transientx_analysis.read_transientx(str(cands_file))) == 0
+
+def test_default_cuts_keep_every_candidate(tmp_path, monkeypatch):
+    # DM 0 and S/N <= 0 rows are only dropped when -dm / -t are given
+    rows = ROWS + ['3\t0\t60000.323456789\t0.0\t0.00064\t0.0\t0.5\t1400\tcand_003.png\t1\tobs_a.fil\n']
+    (tmp_path / 'obs.cands').write_text(HEADER + ''.join(rows))
+    monkeypatch.setattr('sys.argv', ['transientx-analysis.py', '-i', str(tmp_path), '-np', '-nocache'])
+    monkeypatch.chdir(tmp_path)
+
+    transientx_analysis.main()
+    events = np.genfromtxt(tmp_path / 'obs_a_transx_events_t0.0_DM0.csv', delimiter=',', names=True)
+    assert np.atleast_1d(events['nmembers']).sum() == 3
@@ -1,14 +1,25 @@
 #!/home/ojohnson/djarin/bin/python
 import argparse
 import glob as glob
+import hashlib
+import json
 import os as os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np 
-import scipy.stats as stats
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import scienceplots 
 import subprocess
-plt.style.use(['science', 'no-latex'])
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Useful-Scripts'))
+from sp_clustering import fof_cluster, print_events, write_events
+from sp_density import plot_density, use_density
+from pdf_assembler import write_pdf, split_pages, book_name
+from instrumentation import start_run, stage
+from plotting import get_pyplot
+
+# Columns of a TransientX .cands file used here (mjd, dm, width, snr, png, input file)
+CANDS_COLUMNS = [2, 3, 4, 5, 8, 10]
+CANDS_NUMERIC = np.dtype([('mjd', np.float64), ('dm', np.float32), ('width', np.float32), ('snr', np.float32)])
+CANDS_CACHE = 'transientx_cache'
 
 def fetch_args(): 
     '''
@@ -20,15 +31,81 @@ def fetch_args():
     parser.add_argument('-dm', '--dm', type=float, help='DM thresehold to plot (default = 0)', required=False)
     parser.add_argument('-pdf', '--pdf', help='Save as pdf (default = False)', required=False, action='store_true')
     parser.add_argument('-convert', '--convert', help='Use imagik convert function for pdf (default = False)', required=False, action='store_true')
+    parser.add_argument('-pdf_pages', '--pdf_pages', type=int, help='Maximum candidate pages per pdf (each also opens with the summary plot), larger books are split into parts', required=False)
+    parser.add_argument('-pdf_dm', '--pdf_dm', type=float, nargs='+', help='DM edges to split the pdf into one book per DM range, e.g. 0 100 300 1000', required=False)
+    parser.add_argument('-np', '--noplot', help='Skip the diagnostic plot (default = False)', required=False, action='store_true')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='Number of reader processes (default = all cores)', required=False)
+    parser.add_argument('-nocache', '--nocache', help='Do not read or write the parsed candidate cache in the input directory', required=False, action='store_true')
+    parser.add_argument('-nocluster', '--nocluster', help='Skip the friends-of-friends grouping of candidates into events', required=False, action='store_true')
+    parser.add_argument('-link_t', '--link_t', type=float, default=0.02, help='Time linking length of the event clustering in seconds (default = 0.02)', required=False)
+    parser.add_argument('-link_dm', '--link_dm', type=float, default=2.0, help='DM linking length of the event clustering (default = 2)', required=False)
+    parser.add_argument('-link_w', '--link_w', type=float, default=2.0, help='Width linking factor of the event clustering (default = 2)', required=False)
+    parser.add_argument('-top', '--top', type=int, default=20, help='Number of ranked events to print and to mark on density plots (default = 20)', required=False)
+    parser.add_argument('-render', '--render', type=str, choices=['auto', 'scatter', 'density'], default='auto', help='Draw every candidate (scatter) or a max-S/N image (density); auto picks density for large runs (default = auto)', required=False)
+    parser.add_argument('-profile', '--profile', help='Write a JSON timing/memory report and a cProfile dump for this run', required=False, action='store_true')
     
     return parser.parse_args()
 
 def read_transientx(cands_file):
-    mjd, dm, width, snr, png, ifile = np.loadtxt(cands_file, usecols=(2, 3, 4, 5, 8, 10), unpack=True, dtype=str)
-    mjd = mjd.astype(float); dm = dm.astype(float); width = width.astype(float); snr = snr.astype(float)
-    time = mjd - mjd.min()
-    
-    return time, dm, width, snr, png, ifile
+    '''
+    Reads the used columns of a .cands file into a structured array (numeric columns typed, png and file as strings)
+    '''
+    import pandas as pd
+    names = list(CANDS_NUMERIC.names) + ['png', 'ifile']
+    try:
+        table = pd.read_csv(cands_file, sep=r'\s+', comment='#', header=None, usecols=CANDS_COLUMNS, names=None, dtype={c: t for c, (_, t) in zip(CANDS_COLUMNS, CANDS_NUMERIC.descr)}, engine='c')
+    except pd.errors.EmptyDataError:
+        return np.empty(0, dtype=CANDS_NUMERIC.descr + [('png', 'U1'), ('ifile', 'U1')])
+    table.columns = names
+    png = table['png'].to_numpy(dtype=str); ifile = table['ifile'].to_numpy(dtype=str)
+    cands = np.empty(len(table), dtype=CANDS_NUMERIC.descr + [('png', png.dtype), ('ifile', ifile.dtype)])
+    for name in names:
+        cands[name] = table[name].to_numpy()
+    return cands
+
+def _cache_key(files):
+    '''
+    Fingerprint of the input files (name, size, mtime) used to validate the cache
+    '''
+    digest = hashlib.sha1()
+    for file in sorted(files):
+        st = os.stat(file)
+        digest.update(f'{os.path.basename(file)} {st.st_size} {st.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+def load_transientx(cands_files, workers=None, cache_dir=None):
+    '''
+    Reads all .cands files in a process pool into one structured array, allocated once from the row counts.
+    With cache_dir the merged table is kept there as a .npy, so re-runs with other cuts skip the parsing.
+    '''
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, CANDS_CACHE + '.npy')
+        meta_file = os.path.join(cache_dir, CANDS_CACHE + '.json')
+        key = _cache_key(cands_files)
+        if os.path.exists(cache_file) and os.path.exists(meta_file):
+            with open(meta_file) as f:
+                if json.load(f).get('key') == key:
+                    return np.load(cache_file)
+
+    if workers == 1 or len(cands_files) <= 1:
+        parts = [read_transientx(cands_file) for cands_file in cands_files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(read_transientx, cands_files))
+
+    # strings are widened to the longest of any file
+    dtype = CANDS_NUMERIC.descr + [(name, f"U{max([1] + [part.dtype[name].itemsize // 4 for part in parts])}") for name in ('png', 'ifile')]
+    cands = np.empty(sum(len(part) for part in parts), dtype=dtype)
+    offset = 0
+    for part in parts:
+        cands[offset:offset + len(part)] = part
+        offset += len(part)
+
+    if cache_dir:
+        np.save(cache_file, cands)
+        with open(meta_file, 'w') as f:
+            json.dump({'key': key, 'nfiles': len(cands_files), 'ncands': len(cands)}, f)
+    return cands
 
 def marker_scaling(sig, threshold=10.0):
     """
@@ -41,120 +118,164 @@ def marker_scaling(sig, threshold=10.0):
     
     return marker_sizes
 
+def write_review_books(png, dm, summary_png, pdf_file, input_dir, max_pages=None, dm_edges=None, workers=None):
+    '''
+    Writes the candidate pngs (in the given order) to pdf books, each opening with the summary plot.
+    Books are split by DM range when dm_edges is given and into parts of at most max_pages.
+    '''
+    # candidate pngs are named relative to where transientx ran, which is usually the input directory
+    paths = np.array([p if os.path.exists(p) else os.path.join(input_dir, p) for p in png])
+    found = np.array([os.path.exists(p) for p in paths], dtype=bool)
+    if not found.all():
+        print(f'⚠️ {np.sum(~found)} candidate pngs not found, leaving them out')
+    paths, dm = paths[found], dm[found]
+
+    if dm_edges:
+        edges = sorted(dm_edges)
+        groups = [(f'_dm{lo:g}-{hi:g}', (dm >= lo) & (dm < hi)) for lo, hi in zip(edges[:-1], edges[1:])]
+    else:
+        groups = [('', np.ones(len(dm), dtype=bool))]
+
+    root, ext = os.path.splitext(pdf_file)
+    for suffix, selected in groups:
+        if not selected.any():
+            continue
+        books = split_pages(list(paths[selected]), max_pages)
+        for part, pages in enumerate(books, 1):
+            book = book_name(root + suffix + ext, part, len(books))
+            npages = write_pdf([summary_png] + pages, book, workers)
+            print(f'Saved {book} ({npages} pages)')
+
 def main(): 
     
     args = fetch_args()
+    start_run('transientx-analysis.py', profile=args.profile)
     
     if args.threshold is None:
         args.threshold = 0.0
     if args.dm is None:
         args.dm = 0 
     
-    # Read in the transientx file
-    cands_files = glob.glob(f"{args.input}/*.cands")
+    # Read in the transientx files
+    cands_files = sorted(glob.glob(f"{args.input}/*.cands"))
     print('Number of candidates files:', len(cands_files))
     
-    # Cat all the candidates
-    time = []; dm = []; width = []; snr = []; png = []; ifile = []
-    
-    for cands_file in cands_files:
-        time_, dm_, width_, snr_, png_, ifile_ = read_transientx(cands_file)
-        
-        time.extend(time_)
-        dm.extend(dm_)
-        width.extend(width_)
-        snr.extend(snr_)
-        png.extend(png_)
-        ifile.extend(ifile_)
-    
-    print(f"Read in {len(time)} candidates from {cands_file}")
+    with stage('read'):
+        cands = load_transientx(cands_files, args.workers, cache_dir=None if args.nocache else args.input)
+    print(f"Read in {len(cands)} candidates from {args.input}")
     
     # filter by threshold and dm 
-    snr = np.array(snr); dm = np.array(dm); time = np.array(time); width = np.array(width); png = np.array(png); ifile = np.array(ifile)
-    
     if args.threshold:
-        mask = snr > args.threshold
-        snr = snr[mask]
-        time = time[mask]
-        width = width[mask]
-        dm = dm[mask]
-        png = png[mask]
-        ifile = ifile[mask]
-    
+        cands = cands[cands['snr'] > args.threshold]
     if args.dm:
-        mask = dm > args.dm
-        snr = snr[mask]
-        time = time[mask]
-        width = width[mask]
-        dm = dm[mask]
-        png = png[mask]
-        ifile = ifile[mask]
-    
-    if len(dm) == 0:
-        print('⚠️ No single pulses found in {} for current setup'.format(cands_file))
+        cands = cands[cands['dm'] > args.dm]
+    if len(cands) == 0:
+        print('⚠️ No single pulses found in {} for current setup'.format(args.input))
         return
     
+    # time since the first candidate of all files, in days
+    time = cands['mjd'] - cands['mjd'].min()
+    dm = cands['dm']; width = cands['width']; snr = cands['snr']; png = cands['png']; ifile = cands['ifile']
+    
     filename = ifile[0].split('.')[0]
     
-    fig = plt.figure(figsize=(12, 8))
-    gs = gridspec.GridSpec(2, 3, height_ratios=[1, 2])
-    plt.suptitle('%s | DM $>$ %s | S/N  $>$ %s | $N_{pulse} =$ %s' % (filename, args.dm, args.threshold, len(dm)), fontsize=16)
-
-    # Top row (3 plots)
-    ax1 = plt.subplot(gs[0, 0])
-    ax2 = plt.subplot(gs[0, 1])
-    ax3 = plt.subplot(gs[0, 2])
-
-    # Bottom row (1 plot spanning 3 columns)
-    ax4 = plt.subplot(gs[1, :])
-
-    # Histogram of S/N
-    ax1.hist(snr, bins=100, color='black', histtype='step')
-    ax1.set_xlabel('S/N')
-    ax1.set_ylabel('Pulses')
-    ax1.set_xlim(snr.min(), snr.max())
-
-    # Histogram of DM
-    ax2.hist(dm, bins=60, color='black', histtype='step')
-    ax2.set_xlabel('DM (pc cm$^{-3}$)')
-    ax2.set_ylabel('Pulses')
-    ax2.set_xlim(0, dm.max())
-
-    # DM vs. S/N scatter plot
-    ax3.scatter(dm, snr, color='black', s=1)
-    ax3.axhline(snr.mean(), color='red', linestyle='--')
-    ax3.text(0.05, 0.95, 'Mean S/N: %.2f' % snr.mean(), transform=ax3.transAxes, verticalalignment='top')
-    ax3.set_xlabel('DM (pc cm$^{-3}$)')
-    ax3.set_ylabel('S/N')
-    ax3.set_xlim(0, dm.max())
-    ax3.set_ylim(snr.min(), snr.max())
-    
-    # Time vs. DM scatter plot spanning full bottom row
-    t_fact = 24*60*60 # Convert days to seconds
-    time = time * t_fact
-    marker_sizes = snr**2
-    
-    ax4.scatter(time, dm,  s = marker_sizes, edgecolor='black', facecolor='none', alpha=0.3)
-    ax4.set_xlabel('Time (s)')
-    ax4.set_ylabel('DM (pc cm$^{-3}$)')
-    ax4.set_xlim(0, float(time.max()))
-    ax4.set_ylim(0, dm.max())
-    
-    plt.tight_layout()
-    output_file = os.path.join(args.input, f'{filename}_transx_t{args.threshold}_DM{args.dm}.png')
-    plt.savefig(output_file)
+    # Group candidates of the same pulse across DM and width trials into events (time in days -> s)
+    tx_events = None
+    if not args.nocluster:
+        with stage('cluster'):
+            _, tx_events = fof_cluster(time * 24*60*60, dm, width, snr, args.link_t, args.link_dm, args.link_w)
+            print(f"Clustered {len(dm)} candidates into {len(tx_events)} events")
+            print_events(tx_events, args.top)
+            write_events(tx_events, os.path.join(args.input, f'{filename}_transx_events_t{args.threshold}_DM{args.dm}.csv'))
+    
+    if args.noplot:
+        return
+    
+    with stage('plot'):
+        plt = get_pyplot()
+        import matplotlib.gridspec as gridspec
+    
+        fig = plt.figure(figsize=(12, 8))
+        gs = gridspec.GridSpec(2, 3, height_ratios=[1, 2])
+        plt.suptitle('%s | DM $>$ %s | S/N  $>$ %s | $N_{pulse} =$ %s' % (filename, args.dm, args.threshold, len(dm)), fontsize=16)
+
+        # Top row (3 plots)
+        ax1 = plt.subplot(gs[0, 0])
+        ax2 = plt.subplot(gs[0, 1])
+        ax3 = plt.subplot(gs[0, 2])
+
+        # Bottom row (1 plot spanning 3 columns)
+        ax4 = plt.subplot(gs[1, :])
+
+        # Histogram of S/N
+        ax1.hist(snr, bins=100, color='black', histtype='step')
+        ax1.set_xlabel('S/N')
+        ax1.set_ylabel('Pulses')
+        ax1.set_xlim(snr.min(), snr.max())
+
+        # Histogram of DM
+        ax2.hist(dm, bins=60, color='black', histtype='step')
+        ax2.set_xlabel('DM (pc cm$^{-3}$)')
+        ax2.set_ylabel('Pulses')
+        ax2.set_xlim(0, dm.max())
+
+        density = use_density(args.render, len(dm))
+
+        # DM vs. S/N scatter plot
+        if density:
+            plot_density(ax3, dm, snr, snr, (0, dm.max()), (snr.min(), snr.max()), bins=(200, 100), cmap='Greys')
+        else:
+            ax3.scatter(dm, snr, color='black', s=1)
+        ax3.axhline(snr.mean(), color='red', linestyle='--')
+        ax3.text(0.05, 0.95, 'Mean S/N: %.2f' % snr.mean(), transform=ax3.transAxes, verticalalignment='top')
+        ax3.set_xlabel('DM (pc cm$^{-3}$)')
+        ax3.set_ylabel('S/N')
+        ax3.set_xlim(0, dm.max())
+        ax3.set_ylim(snr.min(), snr.max())
+    
+        # Time vs. DM scatter plot spanning full bottom row
+        t_fact = 24*60*60 # Convert days to seconds
+        time = time * t_fact
+    
+        # Large runs are drawn as a max-S/N image with only the brightest events marked
+        if density:
+            im = plot_density(ax4, time, dm, snr, (0, float(time.max())), (0, dm.max()))
+            fig.colorbar(im, ax=ax4, label='Max S/N', pad=0.01)
+            if tx_events is not None:
+                top_time, top_dm, top_snr = tx_events['time'][:args.top], tx_events['dm'][:args.top], tx_events['snr'][:args.top]
+            else:
+                top = np.argsort(snr)[::-1][:args.top]
+                top_time, top_dm, top_snr = time[top], dm[top], snr[top]
+            ax4.scatter(top_time, top_dm, s=top_snr**2, edgecolor='red', facecolor='none')
+        else:
+            marker_sizes = snr**2
+            ax4.scatter(time, dm,  s = marker_sizes, edgecolor='black', facecolor='none', alpha=0.3)
+        ax4.set_xlabel('Time (s)')
+        ax4.set_ylabel('DM (pc cm$^{-3}$)')
+        ax4.set_xlim(0, float(time.max()))
+        ax4.set_ylim(0, dm.max())
+    
+        plt.tight_layout()
+        output_file = os.path.join(args.input, f'{filename}_transx_t{args.threshold}_DM{args.dm}.png')
+        plt.savefig(output_file)
 
     # Save pngs to a single pdf
     if args.pdf:
         # Sort files by DM by decreasing order
         dm_sort = np.argsort(dm)[::-1]
-        png = png[dm_sort]
-        png = [str(i) for i in png]
-        png.insert(0, output_file)
-    
-        # use convert subprocess to convert png to pdf
-        subprocess.run(['convert'] + png + [f'{filename}_transx_t{args.threshold}_DM{args.dm}.pdf'])
-        print(f'Saved {filename}_transx_t{args.threshold}_DM{args.dm}.pdf')
+        pdf_file = f'{filename}_transx_t{args.threshold}_DM{args.dm}.pdf'
+        
+        with stage('pdf'):
+            if args.convert:
+                png = png[dm_sort]
+                png = [str(i) for i in png]
+                png.insert(0, output_file)
+        
+                # use convert subprocess to convert png to pdf
+                subprocess.run(['convert'] + png + [pdf_file])
+                print(f'Saved {pdf_file}')
+            else:
+                write_review_books(png[dm_sort], dm[dm_sort], output_file, pdf_file, args.input, args.pdf_pages, args.pdf_dm, args.workers)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
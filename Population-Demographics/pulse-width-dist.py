@@ -5,18 +5,18 @@ Author: Owen A. Johnson
 Date: 12/01/2024
 '''
 
+import os
+import sys
 import numpy as np 
 import matplotlib.pyplot as plt
 import scienceplots; plt.style.use(['science','ieee']); ibm_cols = ['#6490ff', '#795ef0', '#dc5880', '#fe6100', '#ffae00']
 import pandas as pd
-from psrqpy import QueryATNF
-from astropy.table import Table
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Useful-Scripts'))
+from atnf_cache import query_atnf
 import matplotlib.image as mpimg
 from scipy import stats
 
-query = QueryATNF(params=['NAME', 'W50', 'W10', 'DM']) # Query the ATNF pulsar catalogue for the following parameters: P0, P1, BINARY, TYPE, P1_I
-
-table = query.table.to_pandas() # The table of ATNF pulsars
+table = query_atnf(['NAME', 'W50', 'W10', 'DM']) # The table of ATNF pulsars, served from the local catalogue cache
 # drop W50 values that are NaN
 table = table.dropna(subset=['W50'])
 
@@ -92,10 +92,10 @@ else:
     else:
         print('No RA and Dec provided, asking simbad and PSRCAT for coordinates for %s...' % trgt_name)
 
-        from psrqpy import QueryATNF
-        from astropy.table import Table
-        query = QueryATNF(params=['NAME', 'RaJ', 'DecJ']) 
-        table = query.table.to_pandas()
+        import sys
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from atnf_cache import query_atnf
+        table = query_atnf(['NAME', 'RaJ', 'DecJ'])
         
         if trgt_name in table['NAME'].values:
             print(table.loc[table['NAME'] == trgt_name])
@@ -286,31 +286,39 @@ plt.tight_layout()
 plt.show()
 
 if args.sens: 
-    import subprocess
-    
-    ra_hms = coord_deg.ra.to_string(unit=u.hourangle, sep=':', precision=2)
-    dec_dms = coord_deg.dec.to_string(unit=u.degree, sep=':', precision=2)
-    
-    command = command = 'python ./tsky_sefd_LOFAR_ilt.py --ra %s --dec %s --freqs 100 110 120 130 140 150 160 170 180 190' % (ra_hms, dec_dms)
-    output = subprocess.check_output(command, shell=True).decode('utf-8')
-    
-    freq = []; conv_temp = []; raw_temp = []; diff_temp = []
-    lines = output.strip().split('\n')
     lofar_bandwidth = 3.66e6 # Hz
     tobs_v = 2*3600 # seconds
     
-    for line in lines[4:]:
-        # Split each line by tabs
-        columns = line.split('\t')
-        # print(columns)
-        freq.append(float(columns[0].split(':')[0]))
-        print(columns[0].split(':')[0]) 
-        conv_temp.append(float(columns[2]))
-        raw_temp.append(float(columns[4]))
-        diff_temp.append(float(columns[6]))
+    from tsky_lookup import TskyLookup, SENS_FREQS
+    try:
+        # precomputed all-sky table (tsky_sefd_LOFAR_ilt.py --build_lookup), a pixel lookup instead of a full Tsky run
+        sky = TskyLookup().query(coord_deg.ra.deg, coord_deg.dec.deg, freqs=SENS_FREQS)
+        freq = sky['freqs']; conv_temp = sky['tsky']; raw_temp = sky['tref']; diff_temp = conv_temp - raw_temp
+    except (FileNotFoundError, ValueError) as err:
+        print(err)
+        import subprocess
+        
+        ra_hms = coord_deg.ra.to_string(unit=u.hourangle, sep=':', precision=2)
+        dec_dms = coord_deg.dec.to_string(unit=u.degree, sep=':', precision=2)
+        
+        command = command = 'python ./tsky_sefd_LOFAR_ilt.py --ra %s --dec %s --freqs %s' % (ra_hms, dec_dms, ' '.join('%g' % f for f in SENS_FREQS))
+        output = subprocess.check_output(command, shell=True).decode('utf-8')
+        
+        freq = []; conv_temp = []; raw_temp = []; diff_temp = []
+        lines = output.strip().split('\n')
+        
+        for line in lines[4:]:
+            # Split each line by tabs
+            columns = line.split('\t')
+            # print(columns)
+            freq.append(float(columns[0].split(':')[0]))
+            print(columns[0].split(':')[0]) 
+            conv_temp.append(float(columns[2]))
+            raw_temp.append(float(columns[4]))
+            diff_temp.append(float(columns[6]))
         
     freq = np.array(freq); conv_temp = np.array(conv_temp); raw_temp = np.array(raw_temp); diff_temp = np.array(diff_temp)
-    Aeff = np.linspace(2400, 1422, len(freq))
+    Aeff = np.interp(freq, [SENS_FREQS[0], SENS_FREQS[-1]], [2400, 1422])  # linear in frequency over the HBA grid
     def sens_limit(snr, tsys, Aeff, bandwidth, tobs): 
         num = snr*tsys*1380*2
         print(num)
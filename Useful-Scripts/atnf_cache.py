@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Shared on-disk cache of the ATNF pulsar catalogue so scripts do not download it on every run.
+Each parameter is stored as its own .npy column next to a meta.json holding the catalogue version and
+fetch time, so a query only memory-maps the columns it asks for. A refresh writes a new snapshot of
+columns and then swaps meta.json atomically, so jobs reading the same directory never see a partly
+written file or a mix of old and new columns. Works offline from a pre-seeded snapshot
+(copy the cache directory to the compute nodes, or point ATNF_CACHE_DIR at a shared one).
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+Example Usage: python atnf_cache.py --seed                  # download and store the default parameter set
+               python atnf_cache.py --info                  # show version, age and stored parameters
+
+From a script:
+    from atnf_cache import query_atnf
+    table = query_atnf(['NAME', 'W10', 'DM', 'P0'])         # pandas DataFrame, like QueryATNF(...).table.to_pandas()
+'''
+import argparse
+import glob
+import json
+import os
+import time
+import numpy as np
+
+CACHE_DIR = os.environ.get('ATNF_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pulsar-scripts', 'atnf'))
+TTL_DAYS = float(os.environ.get('ATNF_CACHE_TTL_DAYS', 30))
+OFFLINE = os.environ.get('ATNF_OFFLINE', '0') not in ('', '0', 'false', 'False')
+
+# Union of the parameters used across the repository, fetched by --seed
+DEFAULT_PARAMS = ['NAME', 'JNAME', 'RAJ', 'DECJ', 'P0', 'P1', 'DM', 'W50', 'W10', 'ASSOC', 'BINARY', 'TYPE',
+                  'MINMASS', 'DIST', 'PMTOT', 'VTRANS', 'PMRA', 'PMDEC', 'PB']
+
+def _read_meta(cache_dir):
+    '''
+    Returns the cache metadata, or None when there is no cache yet
+    '''
+    meta_file = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        return json.load(f)
+
+def _column_file(cache_dir, param, snapshot=None):
+    '''
+    Path of a stored column; caches written before snapshots were introduced use <param>.npy
+    '''
+    return os.path.join(cache_dir, f'{param}.{snapshot}.npy' if snapshot else f'{param}.npy')
+
+def _fetch(params, cache_dir):
+    '''
+    Downloads the requested parameters with psrqpy and writes them to the cache as a new snapshot,
+    one .npy per column, then points meta.json at it with an atomic rename. The previous snapshot is
+    kept for readers that loaded the old meta.json; older ones are removed.
+    '''
+    from psrqpy import QueryATNF
+
+    query = QueryATNF(params=params)
+    table = query.table.to_pandas()
+    os.makedirs(cache_dir, exist_ok=True)
+    previous = _read_meta(cache_dir)
+    snapshot = f"{time.time_ns()}_{os.getpid()}"
+
+    stored = []
+    for param in params:
+        if param not in table.columns:
+            continue
+        col = table[param]
+        if col.dtype.kind in 'fiub':
+            arr = col.to_numpy(dtype=float)
+        else:
+            # Strings are stored fixed-width so they can be memory-mapped; missing values become ''
+            arr = np.array(['' if v is None or v != v else str(v) for v in col], dtype=str)
+        np.save(_column_file(cache_dir, param, snapshot), arr)
+        stored.append(param)
+
+    meta = {
+        'version': str(getattr(query, 'get_version', 'unknown')),
+        'fetched': time.time(),
+        'npsr': int(len(table)),
+        'params': stored,
+        'requested': list(params),
+        'snapshot': snapshot,
+    }
+    meta_file = os.path.join(cache_dir, 'meta.json')
+    tmp = f'{meta_file}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, meta_file)
+
+    keep = {_column_file(cache_dir, param, snapshot) for param in stored}
+    if previous:
+        keep |= {_column_file(cache_dir, param, previous.get('snapshot')) for param in previous['params']}
+    for path in glob.glob(os.path.join(cache_dir, '*.npy')):
+        if path not in keep:
+            os.remove(path)
+    return meta
+
+def query_atnf(params, ttl_days=TTL_DAYS, cache_dir=CACHE_DIR, offline=OFFLINE):
+    '''
+    Returns the requested ATNF parameters as a pandas DataFrame, served from the on-disk cache.
+
+    The catalogue is (re)downloaded only when a parameter is missing from the cache or the cache is
+    older than ttl_days. If the download fails, or offline is set, a stale cache is used with a warning.
+    Raises ValueError naming any requested parameter the catalogue does not provide.
+    String columns come back as objects with NaN for missing values, as with QueryATNF.table.to_pandas().
+    '''
+    import pandas as pd
+
+    params = list(dict.fromkeys(p.upper() for p in params))
+    meta = _read_meta(cache_dir)
+    missing = [p for p in params if meta is None or p not in meta.get('requested', meta['params'])]
+    stale = meta is not None and (time.time() - meta['fetched']) > ttl_days * 86400
+
+    if missing or stale:
+        if offline:
+            if missing:
+                raise RuntimeError(f'ATNF cache at {cache_dir} has no {missing} and offline mode is set; seed it with `atnf_cache.py --seed`')
+            print(f'⚠️ ATNF cache is older than {ttl_days} days, using it anyway (offline)')
+        else:
+            try:
+                wanted = sorted(set(params) | set(meta.get('requested', meta['params']) if meta else []), key=lambda p: p != 'NAME')
+                meta = _fetch(wanted, cache_dir)
+            except Exception as err:
+                if missing:
+                    raise
+                print(f'⚠️ Could not refresh ATNF cache ({err}), using cached version {meta["version"]}')
+
+    absent = [p for p in params if p not in meta['params']]
+    if absent:
+        raise ValueError(f"ATNF catalogue {meta['version']} has no parameter {', '.join(absent)} (cache at {cache_dir})")
+
+    columns = {}
+    for param in params:
+        arr = np.load(_column_file(cache_dir, param, meta.get('snapshot')), mmap_mode='r')
+        if arr.dtype.kind == 'U':
+            col = arr.astype(object)
+            col[arr == ''] = np.nan
+            columns[param] = col
+        else:
+            columns[param] = arr
+    return pd.DataFrame(columns)
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed or inspect the local ATNF catalogue cache')
+    parser.add_argument('--seed', action='store_true', help='Download the catalogue and store it in the cache')
+    parser.add_argument('--params', nargs='+', default=DEFAULT_PARAMS, help='Parameters to store when seeding')
+    parser.add_argument('--info', action='store_true', help='Print the cache metadata')
+    parser.add_argument('--cache_dir', default=CACHE_DIR, help=f'Cache directory (default = {CACHE_DIR})')
+    args = parser.parse_args()
+
+    if args.seed:
+        meta = _fetch([p.upper() for p in args.params], args.cache_dir)
+        print(f"Stored {len(meta['params'])} parameters for {meta['npsr']} pulsars (catalogue {meta['version']}) in {args.cache_dir}")
+
+    meta = _read_meta(args.cache_dir)
+    if args.info or not args.seed:
+        if meta is None:
+            print(f'No ATNF cache at {args.cache_dir}')
+            return
+        age_days = (time.time() - meta['fetched']) / 86400
+        print(f"Cache: {args.cache_dir}\nCatalogue version: {meta['version']}\nAge: {age_days:.1f} days\nPulsars: {meta['npsr']}\nParameters: {', '.join(meta['params'])}")
+
+if __name__ == '__main__':
+    main()
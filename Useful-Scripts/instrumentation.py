@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Lightweight run instrumentation shared by the analysis scripts. Stages of a run are timed
+with a context manager, the resident memory is sampled in a background thread to get the peak per stage,
+and optionally the whole run is profiled with cProfile. Each run writes one JSON report, so timings from
+thousands of SLURM jobs can be collected and compared to spot regressions.
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+Enable it with either of
+    --profile on the command line of a script (report + cProfile dump in the working directory)
+    PULSAR_REPORT_DIR=<dir>                    (report only, written to <dir>)
+    PULSAR_PROFILE=1                           (report + cProfile dump, in PULSAR_REPORT_DIR or the working directory)
+When disabled, stage() only costs two perf_counter calls.
+
+From a script:
+    from instrumentation import start_run, stage
+    start_run('sift.py', profile=args.profile)
+    with stage('parse'):
+        ...
+
+Example Usage: python instrumentation.py sift_*.json         # summarise reports: median/max time and memory per stage
+'''
+import argparse
+import atexit
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENV_PROFILE = 'PULSAR_PROFILE'
+ENV_REPORT_DIR = 'PULSAR_REPORT_DIR'
+SAMPLE_INTERVAL = 0.05  # seconds between RSS samples
+
+def current_rss_mb():
+    '''
+    Resident set size of this process in MB (from /proc on Linux, else the peak from getrusage)
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb(who='self'):
+    '''
+    Peak resident set size in MB of this process ('self') or of its largest finished child ('children')
+    '''
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    return usage.ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+class Run:
+    '''
+    Collects stage timings and memory for one run of a script and writes them as a JSON report
+    '''
+    def __init__(self, script, enabled=False, cprofile=False, report_dir=None):
+        self.script = script
+        self.enabled = enabled
+        self.report_dir = report_dir or os.getcwd()
+        self.start_wall = time.time()
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.stages = {}
+        self._active = []
+        self._lock = threading.Lock()
+        self._finished = False
+        self._profiler = None
+
+        if enabled:
+            self._stop = threading.Event()
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        if cprofile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            rss = current_rss_mb()
+            with self._lock:
+                for record in self._active:
+                    record['rss_peak_mb'] = max(record['rss_peak_mb'], rss)
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Times the enclosed block; repeated stages of the same name are accumulated
+        '''
+        record = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rss_start_mb': None, 'rss_peak_mb': 0.0})
+        if self.enabled:
+            rss = current_rss_mb()
+            if record['rss_start_mb'] is None:
+                record['rss_start_mb'] = rss
+            with self._lock:
+                record['rss_peak_mb'] = max(record['rss_peak_mb'], rss)
+                self._active.append(record)
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['calls'] += 1
+            record['wall_s'] += time.perf_counter() - start
+            record['cpu_s'] += time.process_time() - start_cpu
+            if self.enabled:
+                with self._lock:
+                    self._active.remove(record)
+                    record['rss_peak_mb'] = max(record['rss_peak_mb'], current_rss_mb())
+
+    def report(self):
+        '''
+        Returns the report of the run so far as a dictionary
+        '''
+        return {
+            'script': self.script,
+            'argv': sys.argv,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'slurm_job_id': os.environ.get('SLURM_JOB_ID'),
+            'slurm_array_task_id': os.environ.get('SLURM_ARRAY_TASK_ID'),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.start_wall)),
+            'python': sys.version.split()[0],
+            'wall_s': time.perf_counter() - self.start,
+            'cpu_s': time.process_time() - self.start_cpu,
+            'peak_rss_mb': peak_rss_mb('self'),
+            'peak_rss_children_mb': peak_rss_mb('children'),
+            'stages': self.stages,
+        }
+
+    def finish(self):
+        '''
+        Stops sampling and profiling and writes the report (and the .prof dump) once
+        '''
+        if self._finished or not self.enabled:
+            return None
+        self._finished = True
+        self._stop.set()
+
+        name = '%s_%s_%s_%s' % (os.path.splitext(os.path.basename(self.script))[0], socket.gethostname().split('.')[0],
+                                os.environ.get('SLURM_JOB_ID', os.getpid()), time.strftime('%Y%m%dT%H%M%S', time.localtime(self.start_wall)))
+        os.makedirs(self.report_dir, exist_ok=True)
+        report = self.report()
+        if self._profiler is not None:
+            self._profiler.disable()
+            report['cprofile'] = os.path.join(self.report_dir, name + '.prof')
+            self._profiler.dump_stats(report['cprofile'])
+
+        report_file = os.path.join(self.report_dir, name + '.json')
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Run report written to {report_file}', file=sys.stderr)
+        return report_file
+
+_RUN = Run('none')
+
+def start_run(script, profile=False):
+    '''
+    Starts instrumenting this process and returns the Run; the report is written at exit.
+    `profile` (the --profile flag) or PULSAR_PROFILE enable the report and cProfile, PULSAR_REPORT_DIR the report alone.
+    '''
+    global _RUN
+    cprofile = profile or os.environ.get(ENV_PROFILE, '0') not in ('', '0', 'false', 'False')
+    report_dir = os.environ.get(ENV_REPORT_DIR)
+    _RUN = Run(script, enabled=cprofile or bool(report_dir), cprofile=cprofile, report_dir=report_dir)
+    atexit.register(_RUN.finish)
+    return _RUN
+
+def stage(name):
+    '''
+    Context manager timing a stage of the current run (a no-op report if start_run was not called)
+    '''
+    return _RUN.stage(name)
+
+def summarise(report_files):
+    '''
+    Prints the median and maximum wall time and peak memory of every stage across a set of reports
+    '''
+    import numpy as np
+    stages = {}
+    for report_file in report_files:
+        with open(report_file) as f:
+            report = json.load(f)
+        for name, record in list(report['stages'].items()) + [('total', {'wall_s': report['wall_s'], 'rss_peak_mb': report['peak_rss_mb']})]:
+            stages.setdefault(name, []).append((record['wall_s'], record['rss_peak_mb']))
+
+    print(f"{'Stage':24s} | {'Runs':>5s} | {'Median (s)':>10s} | {'Max (s)':>9s} | {'Median RSS (MB)':>15s} | {'Max RSS (MB)':>12s}")
+    print('-' * 92)
+    for name, values in stages.items():
+        wall, rss = np.array(values).T
+        print(f'{name:24s} | {len(wall):5d} | {np.median(wall):10.3f} | {wall.max():9.3f} | {np.median(rss):15.1f} | {rss.max():12.1f}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise JSON run reports written by the instrumented scripts')
+    parser.add_argument('reports', nargs='+', help='Report .json files')
+    args = parser.parse_args()
+    summarise(args.reports)
+
+if __name__ == '__main__':
+    main()
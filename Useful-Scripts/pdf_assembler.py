@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Assemble candidate PNGs into PDF review books without ImageMagick. Images are decoded and
+compressed in a process pool and each page is written to the PDF as soon as it is ready, so only a few
+images are held in memory at once and there is no command-line length limit on the number of pages.
+Used by Parkes-Pipeline/transientx/transientx-analysis.py (-pdf).
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+Example Usage: python pdf_assembler.py -o candidates.pdf cand_*.png
+               python pdf_assembler.py -o candidates.pdf -pages 500 cand_*.png     # candidates_part001.pdf, ...
+
+From a script:
+    from pdf_assembler import write_pdf
+    write_pdf(png_files, 'candidates.pdf', workers=8)
+'''
+import argparse
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+def encode_page(png_file, level=1):
+    '''
+    Decodes an image and returns (width, height, deflated RGB bytes); transparency is flattened onto white
+    '''
+    from PIL import Image
+    with Image.open(png_file) as im:
+        if im.mode in ('RGBA', 'LA', 'P'):
+            im = im.convert('RGBA')
+            page = Image.new('RGB', im.size, (255, 255, 255))
+            page.paste(im, mask=im.getchannel('A'))
+        else:
+            page = im.convert('RGB')
+    return page.width, page.height, zlib.compress(page.tobytes(), level)
+
+def _encoded(png_files, workers, inflight):
+    '''
+    Yields the encoded pages in order while keeping at most `inflight` images in memory
+    '''
+    if workers == 1:
+        yield from map(encode_page, png_files)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for png_file in png_files:
+            futures.append(pool.submit(encode_page, png_file))
+            if len(futures) >= inflight:
+                yield futures.pop(0).result()
+        for future in futures:
+            yield future.result()
+
+def write_pdf(png_files, output_file, workers=None, inflight=None):
+    '''
+    Writes one page per image, sized to the image at 72 dpi, streaming pages to output_file.
+    Returns the number of pages written.
+    '''
+    workers = workers or os.cpu_count() or 1
+    inflight = inflight or 2 * workers
+    offsets = {}
+
+    with open(output_file, 'wb') as f:
+        def write_obj(num, body, stream=None):
+            offsets[num] = f.tell()
+            f.write(b'%d 0 obj\n' % num + body)
+            if stream is not None:
+                f.write(b'\nstream\n' + stream + b'\nendstream')
+            f.write(b'\nendobj\n')
+
+        f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        # objects 1 and 2 are the catalogue and page tree, each page then takes three objects
+        kids = []
+        for i, (width, height, data) in enumerate(_encoded(png_files, workers, inflight)):
+            page, content, image = 3 + 3 * i, 4 + 3 * i, 5 + 3 * i
+            write_obj(image, b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB '
+                             b'/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>' % (width, height, len(data)), data)
+            draw = b'q %d 0 0 %d 0 0 cm /Im0 Do Q' % (width, height)
+            write_obj(content, b'<< /Length %d >>' % len(draw), draw)
+            write_obj(page, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                            b'/Resources << /XObject << /Im0 %d 0 R >> >> >>' % (width, height, content, image))
+            kids.append(page)
+
+        write_obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        write_obj(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % k for k in kids), len(kids)))
+
+        xref = f.tell()
+        nobj = 3 + 3 * len(kids)
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % nobj)
+        f.write(b''.join(b'%010d 00000 n \n' % offsets[num] for num in range(1, nobj)))
+        f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (nobj, xref))
+    return len(kids)
+
+def split_pages(items, max_pages=None):
+    '''
+    Splits a list into consecutive books of at most max_pages (one book if max_pages is None)
+    '''
+    if not max_pages:
+        return [items]
+    return [items[i:i + max_pages] for i in range(0, len(items), max_pages)]
+
+def book_name(output_file, part, nparts):
+    '''
+    Appends _partNNN to the output name when a book is split
+    '''
+    if nparts == 1:
+        return output_file
+    root, ext = os.path.splitext(output_file)
+    return f'{root}_part{part:03d}{ext or ".pdf"}'
+
+def main():
+    parser = argparse.ArgumentParser(description='Assemble PNGs into PDF books')
+    parser.add_argument('png', nargs='+', help='PNG files, one page each, in order')
+    parser.add_argument('-o', '--output', required=True, help='Output .pdf')
+    parser.add_argument('-pages', '--pages', type=int, default=None, help='Maximum pages per PDF, larger books are split into parts')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='Number of image encoding processes (default = all cores)')
+    args = parser.parse_args()
+
+    books = split_pages(args.png, args.pages)
+    for part, pngs in enumerate(books, 1):
+        output = book_name(args.output, part, len(books))
+        print(f'Wrote {write_pdf(pngs, output, args.workers)} pages to {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Lazy matplotlib import shared by the analysis scripts. matplotlib and scienceplots are only
+imported when a plot is made, so text-only runs in array jobs start quickly, and the headless Agg
+backend is used on nodes without a display.
+Used by DM-me-maybe.py, singlepulse_analysis.py and transientx-analysis.py.
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+From a script:
+    from plotting import get_pyplot
+    plt = get_pyplot()                     # scienceplots 'science' style without LaTeX
+    plt = get_pyplot('science')            # with LaTeX text rendering
+'''
+import os
+import sys
+
+def get_pyplot(style=('science', 'no-latex')):
+    '''
+    Imports and returns matplotlib.pyplot with the scienceplots style applied.
+    Uses the headless Agg backend unless MPLBACKEND is set or a display is available.
+    '''
+    import matplotlib
+    if 'MPLBACKEND' not in os.environ and sys.platform != 'darwin' and not os.environ.get('DISPLAY'):
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import scienceplots
+    plt.style.use(list(style) if isinstance(style, (list, tuple)) else style)
+    return plt
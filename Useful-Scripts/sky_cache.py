@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: On-disk cache of pygdsm sky-model maps so the HEALPix map of a model at a frequency is generated
+once and then memory-mapped by every later lookup. pygdsm regenerates the whole map on every
+get_sky_temperature() call, which dominated Tsky runs over many sources. Maps are stored one .npy per
+(model, nside, frequency), so any frequency set reuses the maps already made. Point SKY_CACHE_DIR at a shared
+directory to seed the cache once for all jobs.
+Used by tsky_sefd_LOFAR_ilt.py.
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+Example Usage: python sky_cache.py --seed -m LFSS -f 110 120 130 140 150      # generate and store maps
+               python sky_cache.py --info                                     # list the cached maps
+
+From a script:
+    from sky_cache import CachedSkyModel
+    model = CachedSkyModel('LFSS', pygdsm.LowFrequencySkyModel)
+    tsky = model.get_sky_temperature(coords, 150.)                            # same call as the pygdsm model
+'''
+import argparse
+import glob
+import os
+import numpy as np
+
+CACHE_DIR = os.environ.get('SKY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pulsar-scripts', 'sky'))
+
+def map_file(name, freq, nside=None, cache_dir=CACHE_DIR):
+    '''
+    Path of the cached map of a model at a frequency in MHz ('native' resolution when nside is None)
+    '''
+    return os.path.join(cache_dir, f"{name}_n{nside or 'native'}_{float(freq):.6g}MHz.npy")
+
+def lonlat_pixels(nside, coords):
+    '''
+    RING pixel index (as used by pygdsm maps) of every coordinate of a SkyCoord, in galactic coordinates
+    '''
+    import healpy as hp
+    gal = coords.galactic
+    return hp.ang2pix(nside, gal.l.deg, gal.b.deg, lonlat=True)
+
+class CachedSkyModel:
+    '''
+    Drop-in replacement for a pygdsm sky model whose maps come from the on-disk cache.
+    The pygdsm model is only built the first time a map is missing from the cache.
+    '''
+    def __init__(self, name, model_class=None, nside=None, cache_dir=CACHE_DIR):
+        self.name = name
+        self.model_class = model_class
+        self.nside = nside
+        self.cache_dir = cache_dir
+        self.generated_map_freqs = None
+        self._model = None
+        self._maps = {}
+
+    def _generate(self, freq):
+        '''
+        Generates one map with pygdsm (at the requested nside) and stores it atomically in the cache
+        '''
+        if self._model is None:
+            if self.model_class is None:
+                raise RuntimeError(f'No cached {self.name} map at {freq} MHz and no pygdsm model to generate it')
+            self._model = self.model_class(freq_unit='MHz')
+        sky = np.asarray(self._model.generate(freq), dtype=np.float32)
+        if self.nside is not None:
+            import healpy as hp
+            sky = hp.ud_grade(sky, self.nside)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        output = map_file(self.name, freq, self.nside, self.cache_dir)
+        tmp = f'{output}.{os.getpid()}.tmp.npy'
+        np.save(tmp, sky)
+        os.replace(tmp, output)
+
+    def get_map(self, freq):
+        '''
+        Returns the map at a frequency in MHz as a read-only memory map, generating it if it is not cached
+        '''
+        freq = float(freq)
+        if freq not in self._maps:
+            path = map_file(self.name, freq, self.nside, self.cache_dir)
+            if not os.path.exists(path):
+                self._generate(freq)
+            self._maps[freq] = np.load(path, mmap_mode='r')
+        return self._maps[freq]
+
+    def map_nside(self, freq):
+        import healpy as hp
+        return hp.npix2nside(len(self.get_map(freq)))
+
+    def generate(self, freqs):
+        '''
+        Makes sure the maps of freqs are cached and returns them, (nfreq, npix) for a list, (npix,) for one frequency
+        '''
+        self.generated_map_freqs = freqs
+        if np.ndim(freqs) == 0:
+            return self.get_map(freqs)
+        return np.stack([self.get_map(freq) for freq in freqs])
+
+    def get_sky_temperature(self, coords, freqs=None):
+        '''
+        Sky temperature at coords, with the same shapes as the pygdsm method
+        '''
+        freqs = self.generated_map_freqs if freqs is None else freqs
+        if np.ndim(freqs) == 0:
+            return self.get_map(freqs)[lonlat_pixels(self.map_nside(freqs), coords)]
+        return np.stack([self.get_map(freq)[lonlat_pixels(self.map_nside(freq), coords)] for freq in freqs])
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed or inspect the local sky-model map cache')
+    parser.add_argument('--seed', action='store_true', help='Generate and store the maps of a model at the given frequencies')
+    parser.add_argument('-m', '--model', default='LFSS', choices=['LFSS', 'GSM2008', 'GSM2016', 'HASLAM'], help='Sky model to seed')
+    parser.add_argument('-f', '--freqs', type=float, nargs='+', default=[100, 150, 200], help='Frequencies to seed [MHz]')
+    parser.add_argument('--nside', type=int, default=None, help='Store maps at this HEALPix nside instead of the native one')
+    parser.add_argument('--info', action='store_true', help='List the cached maps')
+    parser.add_argument('--cache_dir', default=CACHE_DIR, help=f'Cache directory (default = {CACHE_DIR})')
+    args = parser.parse_args()
+
+    if args.seed:
+        import pygdsm
+        models = {'LFSS': pygdsm.LowFrequencySkyModel, 'GSM2008': pygdsm.GlobalSkyModel,
+                  'GSM2016': pygdsm.GlobalSkyModel16, 'HASLAM': pygdsm.HaslamSkyModel}
+        model = CachedSkyModel(args.model, models[args.model], args.nside, args.cache_dir)
+        for freq in args.freqs:
+            print(f'{args.model} {freq:g} MHz: nside {model.map_nside(freq)}')
+
+    if args.info or not args.seed:
+        files = sorted(glob.glob(os.path.join(args.cache_dir, '*MHz.npy')))
+        print(f'{len(files)} cached maps in {args.cache_dir}')
+        for path in files:
+            print(f'  {os.path.basename(path)} ({os.path.getsize(path) / 2**20:.1f} MB)')
+
+if __name__ == '__main__':
+    main()
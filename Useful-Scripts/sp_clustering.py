@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Friends-of-friends clustering of single pulse detections. One bright pulse is detected in
+many neighbouring DM and width trials; this groups detections that are linked in (time, DM, width) and
+returns one event per group, so a search gives event counts and ranked lists instead of raw detections.
+Used by Parkes-Pipeline/singlepulse/singlepulse_analysis.py and Parkes-Pipeline/transientx/transientx-analysis.py.
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+From a script:
+    from sp_clustering import fof_cluster
+    labels, events = fof_cluster(time, dm, width, snr, link_t=0.02, link_dm=2.0)
+'''
+import numpy as np
+
+# One row per clustered event, described by its brightest member
+EVENT_DTYPE = np.dtype([('time', np.float64), ('dm', np.float32), ('width', np.float32), ('snr', np.float32),
+                        ('dm_lo', np.float32), ('dm_hi', np.float32), ('t_lo', np.float64), ('t_hi', np.float64),
+                        ('nmembers', np.int64), ('peak', np.int64)])
+
+# Cells holding more detections than this are thinned to their Pareto fronts before the pair search
+DENSE_CELL = 32
+
+def _front(points):
+    '''
+    Indices of the points not dominated (<= in every coordinate) by another point
+    '''
+    keep = []
+    remaining = np.arange(len(points))
+    while len(remaining):
+        # the largest coordinate sum left is never dominated; drop it and everything it dominates
+        best = remaining[np.argmax(points[remaining].sum(axis=1))]
+        keep.append(best)
+        remaining = remaining[~np.all(points[remaining] <= points[best], axis=1)]
+    return np.array(keep)
+
+def fof_cluster(time, dm, width, snr, link_t=0.02, link_dm=2.0, link_w=2.0):
+    '''
+    Groups detections whose separations are all within the linking lengths of at least one other member.
+
+    Two detections are friends when they are within link_t in time, link_dm in DM and a factor link_w in
+    width. Coordinates are scaled by the linking lengths and binned into unit cells: all detections of a cell
+    are friends, so groups are the connected components of a graph of cells. Two neighbouring cells are linked
+    if and only if points on their Pareto fronts (over the 8 sign orthants) are friends, so dense cells, e.g. an
+    RFI burst, are thinned to their fronts before the KD-tree pair search. The number of pairs, and memory,
+    then stays linear in the number of detections however crowded they are.
+
+    Returns the cluster label of every detection and an EVENT_DTYPE array, sorted by decreasing S/N, holding
+    the peak detection of each cluster (its index in `peak`), the time and DM extent and the member count.
+    '''
+    from itertools import product
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    time = np.asarray(time, dtype=float); dm = np.asarray(dm, dtype=float)
+    width = np.asarray(width, dtype=float); snr = np.asarray(snr, dtype=float)
+    n = len(time)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=EVENT_DTYPE)
+
+    coords = np.column_stack([time / link_t, dm / link_dm, np.log(np.maximum(width, 1e-12)) / np.log(link_w)])
+    # one integer key per unit cell
+    grid = np.floor(coords).astype(np.int64)
+    grid -= grid.min(axis=0)
+    shape = grid.max(axis=0) + 1
+    _, cell, counts = np.unique((grid[:, 0] * shape[1] + grid[:, 1]) * shape[2] + grid[:, 2], return_inverse=True, return_counts=True)
+
+    # keep every detection of sparse cells and only the fronts of dense ones
+    thin = [np.flatnonzero(counts[cell] <= DENSE_CELL)]
+    by_cell = np.argsort(cell, kind='stable')
+    starts = np.r_[0, np.cumsum(counts)]
+    for c in np.flatnonzero(counts > DENSE_CELL):
+        members = by_cell[starts[c]:starts[c + 1]]
+        thin += [members[_front(coords[members] * signs)] for signs in product((1, -1), repeat=3)]
+    thin = np.unique(np.concatenate(thin))
+
+    pairs = cKDTree(coords[thin]).query_pairs(r=1.0, p=np.inf, output_type='ndarray')
+    links = cell[thin[pairs]]
+    links = links[links[:, 0] != links[:, 1]]
+    graph = coo_matrix((np.ones(len(links), dtype=np.int8), (links[:, 0], links[:, 1])), shape=(len(counts), len(counts)))
+    nclusters, cell_labels = connected_components(graph, directed=False)
+    labels = cell_labels[cell]
+
+    # members of each cluster contiguous, brightest first
+    order = np.lexsort((-snr, labels))
+    starts = np.flatnonzero(np.r_[True, np.diff(labels[order]) != 0])
+    peak = order[starts]
+
+    events = np.empty(nclusters, dtype=EVENT_DTYPE)
+    events['time'] = time[peak]
+    events['dm'] = dm[peak]
+    events['width'] = width[peak]
+    events['snr'] = snr[peak]
+    events['dm_lo'] = np.minimum.reduceat(dm[order], starts)
+    events['dm_hi'] = np.maximum.reduceat(dm[order], starts)
+    events['t_lo'] = np.minimum.reduceat(time[order], starts)
+    events['t_hi'] = np.maximum.reduceat(time[order], starts)
+    events['nmembers'] = np.diff(np.r_[starts, n])
+    events['peak'] = peak
+    return labels, events[np.argsort(-events['snr'], kind='stable')]
+
+def print_events(events, top=20, time_unit='s'):
+    '''
+    Prints the brightest clustered events as a ranked table
+    '''
+    print(f"{'Rank':>4s} | {'Time (' + time_unit + ')':>12s} | {'DM':>8s} | {'S/N':>7s} | {'Width':>9s} | {'DM range':>17s} | {'Members':>7s}")
+    print('-' * 82)
+    for rank, event in enumerate(events[:top], 1):
+        print(f"{rank:4d} | {event['time']:12.4f} | {event['dm']:8.2f} | {event['snr']:7.2f} | {event['width']:9.3g} | {event['dm_lo']:7.2f} - {event['dm_hi']:7.2f} | {event['nmembers']:7d}")
+
+def write_events(events, output_file):
+    '''
+    Writes clustered events to a .csv, one row per event
+    '''
+    np.savetxt(output_file, events, delimiter=',', header=','.join(EVENT_DTYPE.names), comments='',
+               fmt=['%.6f', '%.3f', '%.6g', '%.2f', '%.3f', '%.3f', '%.6f', '%.6f', '%d', '%d'])
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Rasterised rendering of single pulse detections. Instead of one marker per detection, points
+are binned into a fixed-size image of the maximum S/N (and count) per pixel and drawn with imshow, so the
+cost of drawing does not grow with the number of detections. Only the brightest events get markers.
+Used by Parkes-Pipeline/singlepulse/singlepulse_analysis.py and Parkes-Pipeline/transientx/transientx-analysis.py.
+Author: Owen A. Johnson
+Date: 2025-10-20
+'''
+import numpy as np
+
+# Above this many detections the analysis scripts switch from scatter to density rendering (-render auto)
+DENSITY_MIN_POINTS = 20000
+
+def density_image(x, y, values, x_range, y_range, bins=(1000, 400)):
+    '''
+    Bins points into an (ny, nx) grid in one vectorised pass.
+    Returns the maximum value per pixel (NaN where empty) and the number of points per pixel.
+    '''
+    nx, ny = bins
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float); values = np.asarray(values, dtype=float)
+    (x0, x1), (y0, y1) = x_range, y_range
+    ix = np.floor((x - x0) / (x1 - x0) * nx).astype(np.int64)
+    iy = np.floor((y - y0) / (y1 - y0) * ny).astype(np.int64)
+    # points on the upper edge belong to the last pixel
+    ix[x == x1] = nx - 1; iy[y == y1] = ny - 1
+    inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    flat = iy[inside] * nx + ix[inside]
+
+    counts = np.bincount(flat, minlength=nx * ny)
+    peak = np.full(nx * ny, -np.inf)
+    np.maximum.at(peak, flat, values[inside])
+    peak[counts == 0] = np.nan
+    return peak.reshape(ny, nx), counts.reshape(ny, nx)
+
+def plot_density(ax, x, y, values, x_range, y_range, bins=(1000, 400), cmap='viridis'):
+    '''
+    Draws the max-value image of the points on ax with imshow and returns the image for a colorbar
+    '''
+    peak, _ = density_image(x, y, values, x_range, y_range, bins)
+    return ax.imshow(np.ma.masked_invalid(peak), origin='lower', aspect='auto', interpolation='nearest',
+                     extent=(x_range[0], x_range[1], y_range[0], y_range[1]), cmap=cmap)
+
+def use_density(render, npoints):
+    '''
+    Resolves the -render option (auto, scatter or density) for a given number of detections
+    '''
+    return render == 'density' or (render == 'auto' and npoints > DENSITY_MIN_POINTS)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Measure the start-up time of the analysis scripts for text-only runs (no plotting),
+which is what dominates short SLURM array jobs. Each command is run several times and the median
+wall-clock time is reported against a budget.
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+Example Usage: python startup-benchmark.py -n 5 -budget 1.0
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Text-only invocations; `-h` exits straight after the module-level imports and argument parsing.
+COMMANDS = {
+    'DM-me-maybe.py (plan)': [os.path.join(REPO, 'DM-Calculations', 'DM-me-maybe.py'), '-f0', '704', '-f1', '1920', '-dt', '0.064', '-df', '0.25', '-dmax', '600'],
+    'DM-me-maybe.py (-h)': [os.path.join(REPO, 'DM-Calculations', 'DM-me-maybe.py'), '-h'],
+    'singlepulse_analysis.py (-h)': [os.path.join(REPO, 'Parkes-Pipeline', 'singlepulse', 'singlepulse_analysis.py'), '-h'],
+    'transientx-analysis.py (-h)': [os.path.join(REPO, 'Parkes-Pipeline', 'transientx', 'transientx-analysis.py'), '-h'],
+    'sift.py (-h)': [os.path.join(REPO, 'Parkes-Pipeline', 'cand-sifter', 'sift.py'), '-h'],
+}
+
+def fetch_args():
+    '''
+    Fetches the arguments from the command line
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark start-up time of the text-only analysis scripts')
+    parser.add_argument('-n', '--repeats', type=int, default=5, help='Runs per command (default = 5)')
+    parser.add_argument('-budget', '--budget', type=float, default=1.0, help='Start-up budget in seconds (default = 1.0)')
+    return parser.parse_args()
+
+def time_command(command, repeats):
+    '''
+    Runs a command `repeats` times and returns the wall-clock times in seconds.
+    Raises RuntimeError with the tail of stderr if a run fails, so a crash is never timed as a fast start-up.
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable] + command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f'exit code {result.returncode}: ' + ' | '.join(result.stderr.strip().splitlines()[-3:]))
+    return times
+
+def main():
+    args = fetch_args()
+
+    # Baseline: a bare interpreter with numpy, which every script needs anyway
+    baseline = statistics.median(time_command(['-c', 'import numpy'], args.repeats))
+    print(f"{'Command':32s} | Median (s) |   Min (s) | Budget")
+    print("-" * 66)
+    print(f"{'python -c import numpy':32s} | {baseline:10.3f} | {'':9s} |")
+
+    over = 0
+    for name, command in COMMANDS.items():
+        try:
+            times = time_command(command, args.repeats)
+        except RuntimeError as err:
+            over += 1
+            print(f"{name:32s} | {'':10s} | {'':9s} | FAILED ({err})")
+            continue
+        median = statistics.median(times)
+        ok = median < args.budget
+        over += not ok
+        print(f"{name:32s} | {median:10.3f} | {min(times):9.3f} | {'ok' if ok else 'OVER'}")
+
+    sys.exit(1 if over else 0)
+
+if __name__ == '__main__':
+    main()
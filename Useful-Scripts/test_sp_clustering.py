@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: Tests of the friends-of-friends clustering in sp_clustering.py (run with pytest)
+Author: Owen A. Johnson
+Date: 2025-10-20
+'''
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from sp_clustering import fof_cluster
+
+def _reference_labels(time, dm, width, link_t, link_dm, link_w):
+    # every friend pair, feasible for small inputs only
+    coords = np.column_stack([time / link_t, dm / link_dm, np.log(width) / np.log(link_w)])
+    pairs = cKDTree(coords).query_pairs(r=1.0, p=np.inf, output_type='ndarray')
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(len(time), len(time)))
+    return connected_components(graph, directed=False)[1]
+
+def _same_partition(a, b):
+    # labels describe the same groups if label pairs map one-to-one
+    pairs = np.unique(np.column_stack([a, b]), axis=0)
+    return len(pairs) == len(np.unique(a)) == len(np.unique(b))
+
+def _detections(rng, n, t_range, dm_range):
+    time = rng.uniform(*t_range, n)
+    dm = rng.uniform(*dm_range, n)
+    width = 2.0 ** rng.integers(0, 6, n) * 64e-6
+    return time, dm, width, rng.uniform(6, 20, n)
+
+def test_matches_all_pairs():
+    rng = np.random.default_rng(1)
+    # sparse noise plus two crowded patches, so both the sparse and the thinned dense cells are used
+    parts = [_detections(rng, 3000, (0, 50), (0, 500)), _detections(rng, 2000, (10, 10.05), (100, 106)),
+             _detections(rng, 2000, (30, 30.3), (40, 41))]
+    time, dm, width, snr = (np.concatenate(col) for col in zip(*parts))
+
+    labels, events = fof_cluster(time, dm, width, snr, link_t=0.02, link_dm=2.0, link_w=2.5)
+    assert _same_partition(labels, _reference_labels(time, dm, width, 0.02, 2.0, 2.5))
+    assert events['nmembers'].sum() == len(time)
+    assert np.all(np.diff(events['snr']) <= 0)
+
+def test_dense_burst():
+    # an RFI burst of 480k detections within a few linking lengths, which makes ~1e11 friend pairs
+    rng = np.random.default_rng(2)
+    time, dm, width, snr = _detections(rng, 480000, (5, 5.1), (50, 60))
+    time[0], snr[0] = 20.0, 50.0  # an isolated pulse away from the burst
+
+    labels, events = fof_cluster(time, dm, width, snr, link_t=0.02, link_dm=2.0, link_w=2.5)
+    assert len(events) == 2
+    assert events['nmembers'][0] == 1 and events['peak'][0] == 0
+    assert events['nmembers'][1] == len(time) - 1
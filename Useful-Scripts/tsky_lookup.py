@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+'''
+Code Purpose: In-process all-sky lookup of beam-convolved Tsky and SEFD for the LOFAR HBA configuration of
+tsky_sefd_LOFAR_ilt.py. The table is precomputed once on an equatorial HEALPix grid, so a query for any RA/Dec
+is one pixel index into memory-mapped arrays instead of a run of tsky_sefd_LOFAR_ilt.py (pygdsm import, sky
+generation and beam convolution). SEFD scales as 1/Aeff, i.e. with the inverse number of tiles, so one table
+serves every --ntiles setting.
+Used by altaz-single-target.py (--sens).
+Author: Owen A. Johnson
+Date: 2025-10-20
+
+Example Usage: python tsky_sefd_LOFAR_ilt.py --build_lookup                                                   # build the table (SENS_FREQS)
+               python tsky_lookup.py 83.63 22.01                                                             # query RA/Dec in degrees
+               python tsky_lookup.py 05:34:31.9 +22:00:52 --units hourangle,deg --ntiles 48
+
+From a script:
+    from tsky_lookup import TskyLookup
+    sky = TskyLookup().query(83.63, 22.01)                   # dict of freqs, tsky, tref and sefd arrays
+    sky = TskyLookup().query(83.63, 22.01, freqs=[110, 150]) # only these frequencies (ValueError if not in the table)
+'''
+import argparse
+import json
+import os
+import numpy as np
+
+LOOKUP_DIR = os.environ.get('TSKY_LOOKUP_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pulsar-scripts', 'tsky_lookup'))
+# Frequency grid [MHz] of the altaz-single-target.py --sens curve, built by default with --build_lookup
+SENS_FREQS = [100., 110., 120., 130., 140., 150., 160., 170., 180., 190.]
+
+class TskyLookup:
+    '''
+    Memory-mapped (pixel, frequency) tables of convolved Tsky, pointing-centre Tsky and SEFD on an ICRS HEALPix grid
+    '''
+    def __init__(self, lookup_dir=LOOKUP_DIR):
+        meta_file = os.path.join(lookup_dir, 'meta.json')
+        if not os.path.exists(meta_file):
+            raise FileNotFoundError(f'No Tsky lookup table in {lookup_dir}; build it with `tsky_sefd_LOFAR_ilt.py --build_lookup`')
+        with open(meta_file) as f:
+            self.meta = json.load(f)
+        self.freqs = np.array(self.meta['freqs'])
+        self.nside = self.meta['nside']
+        self.tsky = np.load(os.path.join(lookup_dir, 'tsky.npy'), mmap_mode='r')
+        self.tref = np.load(os.path.join(lookup_dir, 'tref.npy'), mmap_mode='r')
+        self.sefd = np.load(os.path.join(lookup_dir, 'sefd.npy'), mmap_mode='r')
+
+    def pixels(self, ra, dec):
+        '''
+        Table rows of RA/Dec in degrees (scalars or arrays)
+        '''
+        import healpy as hp
+        return hp.ang2pix(self.nside, ra, dec, lonlat=True)
+
+    def columns(self, freqs):
+        '''
+        Table columns of the frequencies freqs in MHz; ValueError if the table does not hold all of them
+        '''
+        freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+        match = np.isclose(self.freqs[None, :], freqs[:, None])
+        missing = freqs[~match.any(axis=1)]
+        if missing.size:
+            raise ValueError(f"Tsky lookup table has no {', '.join(f'{f:g}' for f in missing)} MHz "
+                             f"(built for {', '.join(f'{f:g}' for f in self.freqs)} MHz)")
+        return match.argmax(axis=1)
+
+    def query(self, ra, dec, ntiles=None, freqs=None):
+        '''
+        Tsky, pointing-centre Tsky [K] and SEFD [Jy] at RA/Dec in degrees, each (..., frequency).
+        SEFD is rescaled from the tiles the table was built with to ntiles. With freqs, only those
+        frequencies are returned, in that order.
+        '''
+        pix = self.pixels(ra, dec)
+        cols = slice(None) if freqs is None else self.columns(freqs)
+        scale = self.meta['ntiles'] / ntiles if ntiles else 1.
+        return {'freqs': self.freqs[cols], 'tsky': np.asarray(self.tsky[pix])[..., cols], 'tref': np.asarray(self.tref[pix])[..., cols],
+                'sefd': np.asarray(self.sefd[pix])[..., cols] * scale}
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the precomputed all-sky Tsky/SEFD lookup table')
+    parser.add_argument('ra', type=str, help='Right Ascension (degrees unless --units is given)')
+    parser.add_argument('dec', type=str, help='Declination (degrees unless --units is given)')
+    parser.add_argument('--units', type=str, default=None, help='Units of RA/Dec for astropy, e.g. "hourangle,deg"')
+    parser.add_argument('--ntiles', type=int, default=None, help='Number of HBA tiles (default: as the table was built)')
+    parser.add_argument('--lookup_dir', default=LOOKUP_DIR, help=f'Lookup table directory (default = {LOOKUP_DIR})')
+    args = parser.parse_args()
+
+    if args.units:
+        from astropy.coordinates import SkyCoord
+        coord = SkyCoord(args.ra, args.dec, unit=args.units)
+        ra, dec = coord.ra.deg, coord.dec.deg
+    else:
+        ra, dec = float(args.ra), float(args.dec)
+
+    lookup = TskyLookup(args.lookup_dir)
+    sky = lookup.query(ra, dec, args.ntiles)
+    print(f"{lookup.meta['model']} sky, nside {lookup.nside}, {args.ntiles or lookup.meta['ntiles']} tiles")
+    print('Freq [MHz]:\tConv. Temp. [K]\tRaw Temp [K]\tSEFD [Jy MHz ms]')
+    for freq, tsky, tref, sefd in zip(sky['freqs'], sky['tsky'], sky['tref'], sky['sefd']):
+        print(f'{freq:g}:\t\t{tsky:.5g}\t\t{tref:.5g}\t\t{sefd:.5g}')
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@
 from astropy.coordinates import SkyCoord
 from scipy import optimize as opt
 import argparse
+import json
+import os
 import astropy.units as u
 import matplotlib
 matplotlib.rcParams['mathtext.fontset'] = 'stix'
@@ -14,6 +16,11 @@ import numpy as np
 import pickle
 import pygdsm
 
+from concurrent.futures import ProcessPoolExecutor
+from instrumentation import start_run, stage
+from sky_cache import CachedSkyModel
+from tsky_lookup import LOOKUP_DIR, SENS_FREQS
+
 # Number of active tiles during observations
 N_TILES = 94
 
@@ -36,12 +43,13 @@ def lofar_tinst_range(band = 'HBA', freqs = None, dv = 0.):
 	for Tinst from fit to Wijnholds (2011) between frequencies f1 and f2 (in MHz).
 	Return value is Tinst in Kelvins.
 	If frequency array 'freqs' is given, then average Tinst will be calculated for each
-	frequency range f0-f1, f1-f2, f2-f2 of the array and returned value is list of average Tinst's.
+	frequency range f0-f1, f1-f2, f2-f2 of the array and returned value is an array of average Tinst's.
 	Size of the returned array is smaller by 1 than the size of the input freqs array
 	Each pair of frequencies should be either above 100 MHz or below 100 MHz
+	All bands are evaluated at once on a (bands, 101) grid of sample frequencies.
 	"""
 
-	if type(freqs) in [float, int]:
+	if np.ndim(freqs) == 0:
 		freqs = [(freqs - dv, freqs + dv)]
 
 	if band.upper() == 'HBA':
@@ -53,22 +61,12 @@ def lofar_tinst_range(band = 'HBA', freqs = None, dv = 0.):
 	else:
 		print(f"Unknown band {band.upper()}. Exiting.")
 		return None
-	dpoly = len(T_inst_poly)
-
-	tinsts=[]
-	for flower, fupper in freqs:
-		tot = 0
-		df = fupper - flower
-		for ii in range(101):
-			freq = flower + ii*(df)/100.
-			tinst = 0.0
-			for jj in range(dpoly): 
-				tinst += T_inst_poly[jj]*(freq)**(dpoly-jj-1)
-			tot += tinst
-		tot /= 100.
-		tinsts.append(tot)
-
-	return tinsts
+
+	# 101 samples from the lower to the upper edge of each band; the sum is divided by 100 as in Kondratiev et al.
+	bands = np.asarray(freqs, dtype = float).reshape(-1, 2)
+	flower, df = bands[:, :1], bands[:, 1:] - bands[:, :1]
+	samples = flower + np.arange(101) * df / 100.
+	return np.polyval(T_inst_poly, samples).sum(axis = 1) / 100.
 
 # 2 tiles out of action -> 94
 # Kondratiev et al.
@@ -153,7 +151,9 @@ def applyBeamGuassian(grids, temps, plot = False, plothwhm = False, saveplot = F
 	return pars, convTemp
 
 
-def getSourceTsky(source, frequencies, model = pygdsm.LowFrequencySkyModel(freq_unit = 'MHz'), sampling = 64, nhwhm = 2, **kwargs):
+def getSourceTsky(source, frequencies, model = None, sampling = 64, nhwhm = 2, **kwargs):
+	if model is None:
+		model = CachedSkyModel('LFSS', pygdsm.LowFrequencySkyModel)
 	model.generate(frequencies)
 
 	referenceValues = {frequency: model.get_sky_temperature(source, frequency) for frequency in frequencies}
@@ -165,6 +165,79 @@ def getSourceTsky(source, frequencies, model = pygdsm.LowFrequencySkyModel(freq_
 
 	return pars, convTemp, referenceValues
 
+# Batched equivalents of getCoordinateGrid, getSkyRegion and applyBeamGuassian for many sources at once
+def getBatchGrids(frequencies, sampling = 64, nhwhm = 2):
+	# (frequency, sampling, sampling) offset grids in degrees, as the meshgrids of getCoordinateGrid
+	width = nhwhm * hwhm(np.asarray(frequencies, dtype = float))[:, np.newaxis, np.newaxis]
+	steps = np.linspace(-1., 1., sampling)
+	gridL = np.broadcast_to(width * steps[np.newaxis, np.newaxis, :], (len(frequencies), sampling, sampling))
+	gridB = np.broadcast_to(width * steps[np.newaxis, :, np.newaxis], (len(frequencies), sampling, sampling))
+	return gridL, gridB
+
+def getOffsetVectors(lon, lat, gridL, gridB):
+	"""
+	Galactic unit vectors of the offset grids around every source, shape (3, sources, frequencies, sampling, sampling).
+	Same points as centre.spherical_offsets_by(gridL, gridB): the offset frame, whose x axis points at the
+	source, is rotated by the source latitude about y and by its longitude about z.
+	"""
+	l0 = np.radians(np.asarray(lon, dtype = float))[:, np.newaxis, np.newaxis, np.newaxis]
+	b0 = np.radians(np.asarray(lat, dtype = float))[:, np.newaxis, np.newaxis, np.newaxis]
+	dl, db = np.radians(gridL), np.radians(gridB)
+	xo, yo, zo = np.cos(db) * np.cos(dl), np.cos(db) * np.sin(dl), np.sin(db)
+
+	x1 = np.cos(b0) * xo - np.sin(b0) * zo
+	z = np.sin(b0) * xo + np.cos(b0) * zo
+	return np.cos(l0) * x1 - np.sin(l0) * yo, np.sin(l0) * x1 + np.cos(l0) * yo, z
+
+def getSkyMap(model, frequency):
+	# HEALPix map of a model at one frequency, memory-mapped from the cache when the model is a CachedSkyModel
+	if hasattr(model, 'get_map'):
+		return model.get_map(frequency)
+	return np.asarray(model.generate(frequency))
+
+def getBatchTsky(lon, lat, frequencies, model, sampling = 64, nhwhm = 2, max_mem_mb = 512.):
+	"""
+	Beam-convolved and reference (pointing centre) sky temperatures of many sources, each (sources, frequencies).
+	lon, lat are galactic coordinates in degrees. Every chunk of sources is converted to HEALPix pixels with one
+	vec2pix call, gathered from the sky maps and weighted by the Gaussian beams with one einsum; chunks are
+	sized to keep the temporary arrays below max_mem_mb.
+	"""
+	import healpy as hp
+
+	lon, lat = np.atleast_1d(lon), np.atleast_1d(lat)
+	frequencies = np.asarray(frequencies, dtype = float)
+	gridL, gridB = getBatchGrids(frequencies, sampling, nhwhm)
+	weights = gauss2d(hwhm(frequencies)[:, np.newaxis, np.newaxis], gridL, gridB)
+	weights /= weights.sum(axis = (1, 2), keepdims = True)
+
+	maps = [getSkyMap(model, frequency) for frequency in frequencies]
+	nside = hp.npix2nside(len(maps[0]))
+
+	refPix = hp.ang2pix(nside, lon, lat, lonlat = True)
+	refTemps = np.stack([skyMap[refPix] for skyMap in maps], axis = 1).astype(float)
+
+	# about ten float64 temporaries per grid point
+	chunk = max(1, int(max_mem_mb * 2**20 // (80 * len(frequencies) * sampling * sampling)))
+	convTemps = np.empty((len(lon), len(frequencies)))
+	for start in range(0, len(lon), chunk):
+		x, y, z = getOffsetVectors(lon[start:start + chunk], lat[start:start + chunk], gridL, gridB)
+		pix = hp.vec2pix(nside, x, y, z)
+		temps = np.empty(pix.shape, dtype = np.float32)
+		for ii, skyMap in enumerate(maps):
+			temps[:, ii] = skyMap[pix[:, ii]]
+		convTemps[start:start + chunk] = np.einsum('sfij,fij->sf', temps, weights)
+
+	return convTemps, refTemps
+
+def fitPowerLaws(frequencies, temps):
+	# Same least-squares power law fit as applyBeamGuassian for every row of temps, started from a log-space fit
+	frequencies = np.asarray(frequencies, dtype = float)
+	index, logAmp = np.polyfit(np.log(frequencies), np.log(temps).T, 1)
+	pars = np.empty((len(temps), 2))
+	for ii, temp in enumerate(temps):
+		pars[ii], _ = opt.curve_fit(powerl, frequencies, temp, p0 = (np.exp(logAmp[ii]), index[ii]))
+	return pars
+
 def getSEFD(tskys, bandwidth = 1, tobs = 1e-3, rfiFraction = 0.):
 	sefd = {}
 	for freq, tsky in tskys.items():
@@ -186,7 +259,7 @@ def getSEFD_bandavg(args, frequencies, vsamp = 5.):
 	#print(f"tsysAvg: {lofar_tinst_range('HBA', bandFreqs)} -> {tsysAvg}")
 
 	source = SkyCoord(args.ra, args.dec, unit = args.units)
-	res = getSourceTsky(source, freqs[:, 0].tolist(), model = skyModels[args.model](freq_unit = 'MHz'), sampling = args.samples, nhwhm = args.nhwhm, plot = args.plot, plothwhm = args.plothwhm)
+	res = getSourceTsky(source, freqs[:, 0].tolist(), model = getSkyModel(args), sampling = args.samples, nhwhm = args.nhwhm, plot = args.plot, plothwhm = args.plothwhm)
 	tskyAvg = np.mean(list(res[1].values()))
 
 	#print(f"tskyAvg: {list(res[1].values())} -> {tskyAvg}")
@@ -210,18 +283,176 @@ skyModels = {
 	'HASLAM': pygdsm.HaslamSkyModel,
 }
 
+def getSkyModel(args):
+	# Maps are generated once per model, nside and frequency and then memory-mapped from the cache (sky_cache.py)
+	if args.nocache:
+		return skyModels[args.model](freq_unit = 'MHz')
+	return CachedSkyModel(args.model, skyModels[args.model], nside = args.nside)
+
+def getBatchSEFD(frequencies, tskys, bandwidth = 1, tobs = 1e-3, rfiFraction = 0., ntiles = None):
+	# getSEFD for a (sources, frequencies) array of sky temperatures
+	frequencies = np.asarray(frequencies, dtype = float)
+	tsys = lofar_tinst_range('HBA', freqs = np.column_stack([frequencies - bandwidth, frequencies + bandwidth]))
+	aeff = get_lofar_aeff_max(frequencies, nelem = ntiles or N_TILES)
+	return calculateBrightness(1., aeff = aeff, beamcorrection = 1.0, tsys = tsys, tsky = tskys, tobs = tobs, bandwidth = bandwidth, rfiflagged = rfiFraction)
+
+def getSurveyColumns(frequencies):
+	return ['name', 'ra', 'dec', 'gl', 'gb', 'amp', 'index'] + [f"{col}_{freq:g}" for col in ['tsky', 'tref', 'sefd'] for freq in frequencies]
+
+def surveyChunk(task):
+	# Tsky, power law and SEFD of a chunk of --list sources, one row per source
+	import pandas as pd
+
+	names, ra, dec, args = task
+	gal = SkyCoord(ra, dec, unit = args.units).galactic
+	convTemps, refTemps = getBatchTsky(gal.l.deg, gal.b.deg, args.freqs, getSkyModel(args), sampling = args.samples, nhwhm = args.nhwhm)
+	pars = fitPowerLaws(args.freqs, convTemps)
+	sefd = getBatchSEFD(args.freqs, convTemps, rfiFraction = args.rfi_frac, ntiles = args.ntiles)
+
+	values = np.column_stack([ra, dec, gal.l.deg, gal.b.deg, pars, convTemps, refTemps, sefd])
+	table = pd.DataFrame(values, columns = getSurveyColumns(args.freqs)[1:])
+	table.insert(0, 'name', names)
+	return table
+
+def readSurveyDone(output, columns):
+	# Names already in a survey file; a row cut short by a crash is dropped so the source is done again
+	import pandas as pd
+
+	if not os.path.exists(output) or os.path.getsize(output) == 0:
+		return set()
+	with open(output, 'rb+') as ref:
+		ref.seek(max(0, os.path.getsize(output) - 2**20))
+		tail = ref.read()
+		if not tail.endswith(b'\n'):
+			ref.truncate(ref.tell() - len(tail) + tail.rfind(b'\n') + 1)
+	with open(output) as ref:
+		header = ref.readline().rstrip('\n')
+	if header != ','.join(columns):
+		raise SystemExit(f"{output} holds a survey with other columns (frequencies); use a new --survey file to change them.")
+	return set(pd.read_csv(output, usecols = ['name'], dtype = str)['name'])
+
+def runSurvey(args, sources):
+	"""
+	Computes every source of --list in chunks over a process pool and appends each finished chunk to the
+	--survey .csv, so an interrupted survey resumes with the sources that are not in the file yet.
+	"""
+	columns = getSurveyColumns(args.freqs)
+	done = readSurveyDone(args.survey, columns)
+	todo = [source for source in sources if source not in done]
+	print(f"{len(sources)} sources, {len(sources) - len(todo)} already in {args.survey}, {len(todo)} to compute")
+
+	# make sure every map is cached before the workers read it
+	if not args.nocache:
+		model = getSkyModel(args)
+		for freq in args.freqs:
+			model.get_map(freq)
+
+	tasks = []
+	for start in range(0, len(todo), args.chunk):
+		names = todo[start:start + args.chunk]
+		radec = np.array([sources[name] for name in names])
+		tasks.append((names, radec[:, 0], radec[:, 1], args))
+
+	with open(args.survey, 'a') as ref:
+		if ref.tell() == 0:
+			ref.write(','.join(columns) + '\n')
+		pool = ProcessPoolExecutor(max_workers = args.workers) if args.workers > 1 else None
+		try:
+			for ii, table in enumerate(pool.map(surveyChunk, tasks) if pool else map(surveyChunk, tasks)):
+				table.to_csv(ref, header = False, index = False, float_format = '%.7g')
+				ref.flush()
+				os.fsync(ref.fileno())
+				print(f"Chunk {ii + 1}/{len(tasks)} written ({min((ii + 1) * args.chunk, len(todo))} sources)")
+		finally:
+			if pool:
+				pool.shutdown(cancel_futures = True)
+
+def lookupChunk(task):
+	# Convolved and reference Tsky of a chunk of lookup table pixels (galactic degrees)
+	gl, gb, args = task
+	return getBatchTsky(gl, gb, args.freqs, getSkyModel(args), sampling = args.samples, nhwhm = args.nhwhm)
+
+def buildLookup(args):
+	"""
+	Precomputes Tsky, pointing-centre Tsky and SEFD at the centre of every pixel of an equatorial HEALPix grid
+	for tsky_lookup.py, so sensitivity queries are an array index. The tables are (pixel, frequency) .npy files;
+	meta.json is written last and marks a complete table.
+	"""
+	import healpy as hp
+
+	npix = hp.nside2npix(args.lookup_nside)
+	ra, dec = hp.pix2ang(args.lookup_nside, np.arange(npix), lonlat = True)
+	gal = SkyCoord(ra, dec, unit = 'deg', frame = 'icrs').galactic
+	print(f"Building a {len(args.freqs)} frequency lookup table for {npix} pixels (nside {args.lookup_nside}) in {args.build_lookup}")
+
+	if not args.nocache:
+		model = getSkyModel(args)
+		for freq in args.freqs:
+			model.get_map(freq)
+
+	os.makedirs(args.build_lookup, exist_ok = True)
+	metaFile = os.path.join(args.build_lookup, 'meta.json')
+	if os.path.exists(metaFile):
+		os.remove(metaFile)
+	tables = {name: np.lib.format.open_memmap(os.path.join(args.build_lookup, f"{name}.npy"), mode = 'w+', dtype = np.float32, shape = (npix, len(args.freqs))) for name in ['tsky', 'tref', 'sefd']}
+
+	starts = range(0, npix, args.chunk)
+	tasks = [(gal.l.deg[start:start + args.chunk], gal.b.deg[start:start + args.chunk], args) for start in starts]
+	pool = ProcessPoolExecutor(max_workers = args.workers) if args.workers > 1 else None
+	try:
+		for ii, (start, (convTemps, refTemps)) in enumerate(zip(starts, pool.map(lookupChunk, tasks) if pool else map(lookupChunk, tasks))):
+			rows = slice(start, start + len(convTemps))
+			tables['tsky'][rows] = convTemps
+			tables['tref'][rows] = refTemps
+			tables['sefd'][rows] = getBatchSEFD(args.freqs, convTemps, rfiFraction = args.rfi_frac, ntiles = args.ntiles)
+			if (ii + 1) % 20 == 0 or ii + 1 == len(tasks):
+				print(f"{rows.stop}/{npix} pixels")
+	finally:
+		if pool:
+			pool.shutdown(cancel_futures = True)
+
+	for table in tables.values():
+		table.flush()
+	meta = {'model': args.model, 'nside': args.lookup_nside, 'frame': 'icrs', 'freqs': list(args.freqs), 'ntiles': args.ntiles or N_TILES,
+			'sampling': args.samples, 'nhwhm': args.nhwhm, 'rfi_frac': args.rfi_frac, 'sky_nside': args.nside, 'sefd_bandwidth_MHz': 1, 'sefd_tobs_s': 1e-3}
+	with open(metaFile, 'w') as ref:
+		json.dump(meta, ref, indent = 2)
+
+def summariseSurvey(output, frequencies):
+	# Min/median/max of Tsky (nearest 150 MHz) and of the spectral index from the survey file, reading only those columns
+	import pandas as pd
+
+	frequencies = np.asarray(frequencies, dtype = float)
+	fTsky = frequencies[np.argmin(np.abs(frequencies - 150.))]
+	fRatio = frequencies[np.argmin(np.abs(frequencies - 110.))]
+	table = pd.read_csv(output, usecols = ['name', 'index', f"tsky_{fTsky:g}", f"tsky_{fRatio:g}", f"tref_{fRatio:g}"], dtype = {'name': str})
+	if len(table) == 0:
+		return
+
+	tsky = table.sort_values(f"tsky_{fTsky:g}", kind = 'stable')
+	print(f"Tsky at {fTsky:g} MHz [K]")
+	for label, ii in [("Minimum", 0), ("Median", len(tsky) // 2), ("Maximum", -1)]:
+		print(f"{label}:\t{tsky['name'].iloc[ii]}\t{tsky[f'tsky_{fTsky:g}'].iloc[ii]:.5g}")
+
+	index = table.sort_values('index', kind = 'stable')
+	ratio = index[f"tsky_{fRatio:g}"] / index[f"tref_{fRatio:g}"]
+	print(f"\n\nSpectral index, convolved / reference Tsky at {fRatio:g} MHz")
+	for label, ii in [("Minimum", 0), ("Median", len(index) // 2), ("Maximum", -1)]:
+		print(f"{label}:\t{index['name'].iloc[ii]}\t{index['index'].iloc[ii]:.5g}, {ratio.iloc[ii]:.5g}")
+
 if __name__ == '__main__':
 
 	parser = argparse.ArgumentParser(description = "Generate sky temperatures for a given RA and DEC and frequency")
 	source = parser.add_mutually_exclusive_group(required = True)
 	source.add_argument("--ra", '-r', type = str, help = "Right Ascension in hh:mm:ss.s format.")
 	source.add_argument("--list", '-l', type = str, help = "File containing lines with format \"{srcName} {RA in rad} {Dec in rad}\\n\". USING --LIST WILL ONLY GENERATE AN OUTPUT TSKY FOREACH SOURCE.")
+	source.add_argument("--build_lookup", nargs = '?', const = LOOKUP_DIR, default = None, type = str, help = f"Precompute the all-sky Tsky/SEFD table of --freqs for tsky_lookup.py in this directory (default: {LOOKUP_DIR}).")
 	parser.add_argument("--dec", '-d', type = str, help = "Declination in dd:mm:ss.s format.")
 	parser.add_argument("--units", '-u', type = str, default = "hourangle, degree", help = "Units to parse for RA/Dec")
 
 	parser.add_argument("--output", '-o', default = "./tsky_output.pkl", type = str, help = "Path to output pickle'd dictionary of source Tsky variables")
 
-	parser.add_argument("--freqs", '-f', default = [100, 150, 200], nargs = '+', type = float, help = "Frequencies to sample [MHz].")
+	parser.add_argument("--freqs", '-f', default = None, nargs = '+', type = float, help = "Frequencies to sample [MHz] (default: 100 150 200, or the 100-190 MHz grid of altaz-single-target.py --sens with --build_lookup).")
 	parser.add_argument("--plot", '-p', default = False, action = 'store_true', help = "Whether or not to plot the inspected region of the sky.")
 	parser.add_argument("--plothwhm", '-L', default = False, action = 'store_true', help = "Whether or not to plot the HWHM is the sky is plotted.")
 	parser.add_argument("--nhwhm", '-n', default = 2, type = float, help = "Width (in approximated HWHM (half of FWHM) of the beam) to be used during the convolution.")
@@ -229,6 +460,12 @@ if __name__ == '__main__':
 	parser.add_argument("--model", '-m', default = 'LFSS', choices = ['LFSS', 'GSM2008', 'GSM2016', 'HASLAM'], help = "Choice of SkyModel to generate Tsky values from.")
 	parser.add_argument("--rfi_frac", '-R', default = 0., type = float, help = "Fraction of bandwidth that is flagged for RFI (for SEFD/Sensitivity calculations).")
 	parser.add_argument("--saveplot", default = False, action = 'store_true', help = "Save raw and beam-convolved sky plots")
+	parser.add_argument("--nside", default = None, type = int, help = "HEALPix nside to degrade the cached sky maps to (default: native resolution of the model).")
+	parser.add_argument("--nocache", default = False, action = 'store_true', help = "Generate the sky maps with pygdsm on every lookup instead of using the map cache.")
+	parser.add_argument("--survey", default = None, type = str, help = "With --list, append one row per source to this .csv using --workers processes, resuming from the sources already in it (replaces the pickle output).")
+	parser.add_argument("--workers", default = os.cpu_count(), type = int, help = "Number of processes for --survey (default: all cores).")
+	parser.add_argument("--chunk", default = 500, type = int, help = "Sources per --survey task; each finished chunk is written to the file (default: 500).")
+	parser.add_argument("--lookup_nside", default = 128, type = int, help = "HEALPix nside of the --build_lookup grid (default: 128, 0.46 deg pixels).")
 
 	flags = parser.add_mutually_exclusive_group()
 
@@ -241,10 +478,19 @@ if __name__ == '__main__':
 
 
 	parser.add_argument("--ntiles", default = None, type = int, help = f"Number of HBA tiles used for observation (default: {N_TILES}).")
+	parser.add_argument("--profile", default = False, action = 'store_true', help = "Write a JSON timing/memory report and a cProfile dump for this run.")
 
 	args = parser.parse_args()
+	start_run('tsky_sefd_LOFAR_ilt.py', profile = args.profile)
 	if args.ntiles is not None:
 		N_TILES = args.ntiles
+	if args.freqs is None:
+		args.freqs = SENS_FREQS if args.build_lookup else [100, 150, 200]
+
+	if args.build_lookup:
+		with stage('lookup'):
+			buildLookup(args)
+		exit()
 
 	if args.list:
 		sources = {}
@@ -252,13 +498,34 @@ if __name__ == '__main__':
 			for line in ref.readlines():
 				l = line.rstrip('\n').split()
 				sources[l[0]] = (float(l[1]), float(l[2]))
+		if args.survey:
+			with stage('survey'):
+				runSurvey(args, sources)
+			summariseSurvey(args.survey, args.freqs)
+			exit()
 		results = {}
-		model = skyModels[args.model](freq_unit = 'MHz')
-		for source, (ra, dec) in sources.items():
-			src = SkyCoord(ra, dec, unit = args.units)
-			results[source] = (getSourceTsky(src, args.freqs, model = model, sampling = args.samples, nhwhm = args.nhwhm, plot = args.plot, plothwhm = args.plothwhm), src)
-
-			print(f"{source}: {np.mean(list(results[source][0][1].values())):.0f}K, {results[source][0][0][1]}")
+		with stage('model'):
+			model = getSkyModel(args)
+		if args.plot:
+			for source, (ra, dec) in sources.items():
+				src = SkyCoord(ra, dec, unit = args.units)
+				with stage('tsky'):
+					results[source] = (getSourceTsky(src, args.freqs, model = model, sampling = args.samples, nhwhm = args.nhwhm, plot = args.plot, plothwhm = args.plothwhm), src)
+
+				print(f"{source}: {np.mean(list(results[source][0][1].values())):.0f}K, {results[source][0][0][1]}")
+		else:
+			# all sources in one vectorised pass
+			radec = np.array(list(sources.values()))
+			srcs = SkyCoord(radec[:, 0], radec[:, 1], unit = args.units)
+			with stage('tsky'):
+				gal = srcs.galactic
+				convTemps, refTemps = getBatchTsky(gal.l.deg, gal.b.deg, args.freqs, model, sampling = args.samples, nhwhm = args.nhwhm)
+			with stage('fit'):
+				pars = fitPowerLaws(args.freqs, convTemps)
+			for ii, source in enumerate(sources):
+				results[source] = ((pars[ii], dict(zip(args.freqs, convTemps[ii])), dict(zip(args.freqs, refTemps[ii]))), srcs[ii])
+
+				print(f"{source}: {np.mean(convTemps[ii]):.0f}K, {pars[ii][1]}")
 
 		averaged = [(key, vals[0][1][150.0]) for key, vals in results.items()]
 		averaged.sort(key = lambda x: x[1])
@@ -284,12 +551,14 @@ if __name__ == '__main__':
 	else:
 		if args.sefd_bandavg:
 			freqs = [110, 185]
-			value = getSEFD_bandavg(args, freqs)
+			with stage('sefd_bandavg'):
+				value = getSEFD_bandavg(args, freqs)
 			exit()
 
 		source = SkyCoord(args.ra, args.dec, unit = args.units)
 
-		res = getSourceTsky(source, args.freqs, model = skyModels[args.model](freq_unit = 'MHz'), sampling = args.samples, nhwhm = args.nhwhm, plot = args.plot, plothwhm = args.plothwhm, saveplot = args.saveplot)
+		with stage('tsky'):
+			res = getSourceTsky(source, args.freqs, model = getSkyModel(args), sampling = args.samples, nhwhm = args.nhwhm, plot = args.plot, plothwhm = args.plothwhm, saveplot = args.saveplot)
 
 		print(f"Power law model = {res[0][0]:.5g} * freq **{res[0][1]:.4g}")
 
@@ -301,7 +570,8 @@ if __name__ == '__main__':
 		print()
 
 		if args.sefd or args.sensitivity_snr:
-			sefd = getSEFD(res[1], rfiFraction = args.rfi_frac)
+			with stage('sefd'):
+				sefd = getSEFD(res[1], rfiFraction = args.rfi_frac)
 		if args.sefd:
 			print("\n\nFreq [MHz]:\tSEFD [Jy MHz ms]")
 			for freq, val in sefd.items():